@@ -0,0 +1,192 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in {"1", "true", "yes"}
+ADMISSION_SLOTS_PER_MODEL = int(os.getenv("ADMISSION_SLOTS_PER_MODEL", "4"))
+ADMISSION_QUEUE_MAX = int(os.getenv("ADMISSION_QUEUE_MAX", "32"))
+ADMISSION_BATCH_QUEUE_MAX = int(os.getenv("ADMISSION_BATCH_QUEUE_MAX", "8"))
+# slots que el trafico batch nunca puede ocupar
+ADMISSION_INTERACTIVE_RESERVED = int(os.getenv("ADMISSION_INTERACTIVE_RESERVED", "1"))
+ADMISSION_MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "30"))
+
+PRIORITIES = ("interactive", "batch")
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    __slots__ = ("_controller", "model", "priority", "_released")
+
+    def __init__(self, controller: "AdmissionController", model: str, priority: str):
+        self._controller = controller
+        self.model = model
+        self.priority = priority
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+
+class _ModelSlots:
+    def __init__(self):
+        self.active = {p: 0 for p in PRIORITIES}
+        self.queues: dict[str, deque] = {p: deque() for p in PRIORITIES}
+        self.started_at: dict[int, float] = {}
+        self.service_seconds_avg = 0.0 # media movil del tiempo con slot ocupado
+        self.counters = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    @property
+    def busy(self) -> int:
+        return sum(self.active.values())
+
+    @property
+    def depth(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+
+class AdmissionController:
+    # slots de concurrencia por modelo con cola acotada; interactive siempre se atiende
+    # antes que batch y batch no puede ocupar los slots reservados
+
+    def __init__(
+        self,
+        slots_per_model: int = ADMISSION_SLOTS_PER_MODEL,
+        queue_max: int = ADMISSION_QUEUE_MAX,
+        batch_queue_max: int = ADMISSION_BATCH_QUEUE_MAX,
+        interactive_reserved: int = ADMISSION_INTERACTIVE_RESERVED,
+        max_wait: float = ADMISSION_MAX_WAIT,
+        enabled: bool = ADMISSION_ENABLED,
+    ):
+        self.slots = max(1, slots_per_model)
+        self.queue_max = queue_max
+        self.batch_queue_max = batch_queue_max
+        self.interactive_reserved = min(max(0, interactive_reserved), self.slots - 1)
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self._models: dict[str, _ModelSlots] = {}
+
+    @staticmethod
+    def priority_of(value: Any) -> str:
+        value = str(value or "").lower()
+        return value if value in PRIORITIES else "interactive"
+
+    def _can_start(self, slots: _ModelSlots, priority: str) -> bool:
+        if priority == "interactive":
+            return slots.busy < self.slots
+        return slots.busy < self.slots - self.interactive_reserved and not slots.queues["interactive"]
+
+    def _retry_after(self, slots: _ModelSlots) -> float:
+        service = slots.service_seconds_avg or 1.0
+        return max(1.0, math.ceil(service * (slots.depth + 1) / self.slots))
+
+    def _start(self, slots: _ModelSlots, ticket: Ticket) -> None:
+        slots.active[ticket.priority] += 1
+        slots.started_at[id(ticket)] = time.monotonic()
+        slots.counters["admitted"] += 1
+
+    def _wake(self, slots: _ModelSlots) -> None:
+        for priority in PRIORITIES:
+            queue = slots.queues[priority]
+            while queue and self._can_start(slots, priority):
+                fut, ticket, _ = queue.popleft()
+                if fut.done():
+                    continue
+                self._start(slots, ticket)
+                fut.set_result(None)
+
+    def _release(self, ticket: Ticket) -> None:
+        slots = self._models[ticket.model]
+        slots.active[ticket.priority] -= 1
+        started = slots.started_at.pop(id(ticket), None)
+        if started is not None:
+            elapsed = time.monotonic() - started
+            slots.service_seconds_avg = (
+                elapsed if not slots.service_seconds_avg else 0.8 * slots.service_seconds_avg + 0.2 * elapsed
+            )
+        self._wake(slots)
+
+    async def acquire(self, model: str, priority: str = "interactive") -> Ticket:
+        priority = self.priority_of(priority)
+        slots = self._models.setdefault(model, _ModelSlots())
+        ticket = Ticket(self, model, priority)
+        if not self.enabled:
+            self._start(slots, ticket)
+            return ticket
+
+        if self._can_start(slots, priority) and not slots.queues[priority]:
+            self._start(slots, ticket)
+            return ticket
+
+        limit = self.queue_max if priority == "interactive" else self.batch_queue_max
+        if len(slots.queues[priority]) >= limit:
+            slots.counters["rejected_queue_full"] += 1
+            raise AdmissionRejected("queue_full", self._retry_after(slots))
+
+        slots.counters["queued"] += 1
+        fut = asyncio.get_running_loop().create_future()
+        entry = (fut, ticket, time.monotonic())
+        slots.queues[priority].append(entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                ticket.release() # admitido justo al expirar: se devuelve el slot
+            else:
+                fut.cancel()
+                if entry in slots.queues[priority]:
+                    slots.queues[priority].remove(entry)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            slots.counters["rejected_timeout"] += 1
+            raise AdmissionRejected("queue_timeout", self._retry_after(slots)) from e
+
+        waited = time.monotonic() - entry[2]
+        slots.counters["wait_seconds_total"] += waited
+        slots.counters["wait_seconds_max"] = max(slots.counters["wait_seconds_max"], waited)
+        return ticket
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        models = {}
+        for model, slots in self._models.items():
+            queued = slots.counters["queued"]
+            models[model] = {
+                "active": dict(slots.active),
+                "queue_depth": {p: len(q) for p, q in slots.queues.items()},
+                "oldest_wait_seconds": max(
+                    (now - q[0][2] for q in slots.queues.values() if q), default=0.0
+                ),
+                "service_seconds_avg": slots.service_seconds_avg,
+                **slots.counters,
+                "wait_seconds_avg": slots.counters["wait_seconds_total"] / queued if queued else 0.0,
+            }
+        return {
+            "enabled": self.enabled,
+            "slots_per_model": self.slots,
+            "queue_max": self.queue_max,
+            "batch_queue_max": self.batch_queue_max,
+            "interactive_reserved": self.interactive_reserved,
+            "max_wait": self.max_wait,
+            "models": models,
+        }
+
+
+admission = AdmissionController()
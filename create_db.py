@@ -1,6 +1,13 @@
+import os
 import sqlite3
 
-conn = sqlite3.connect("clients.db")
+from db_profile import apply_creation_profile, optimize
+
+DB_PATH = os.getenv("SQL_DB_PATH", "clients.db")
+
+conn = sqlite3.connect(DB_PATH)
+# page_size y WAL antes de la primera tabla; el resto de pragmas van en cada conexion
+apply_creation_profile(conn)
 cursor = conn.cursor()
 
 #usuarios del sistema (no clientes)
@@ -162,6 +169,7 @@ cursor.execute("CREATE INDEX IF NOT EXISTS idx_invoices_client ON invoices(clien
 cursor.execute("CREATE INDEX IF NOT EXISTS idx_interactions_client ON interactions(client_id)")
 
 conn.commit()
+optimize(conn)
 conn.close()
 
 print("CRM database created successfully.")
@@ -0,0 +1,151 @@
+import asyncio
+import os
+import sqlite3
+import time
+from typing import Any
+
+# perfil de almacenamiento de clients.db; "default" deja los valores de sqlite
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "performance")
+SQLITE_PAGE_SIZE = int(os.getenv("SQLITE_PAGE_SIZE", "8192"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")) # por conexion
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_OPTIMIZE_INTERVAL = float(os.getenv("SQLITE_OPTIMIZE_INTERVAL", "3600"))
+# filas que muestrea ANALYZE por indice; acota su coste en tablas grandes
+SQLITE_ANALYSIS_LIMIT = int(os.getenv("SQLITE_ANALYSIS_LIMIT", "1000"))
+
+PROFILES: dict[str, dict[str, Any]] = {
+    "default": {},
+    "performance": {
+        "journal_mode": "WAL", # lectores y escritor no se bloquean entre si
+        "synchronous": "NORMAL", # seguro con WAL; solo se pierde la ultima transaccion si cae el SO
+        "page_size": SQLITE_PAGE_SIZE,
+        "cache_size": -SQLITE_CACHE_SIZE_KB,
+        "mmap_size": SQLITE_MMAP_SIZE,
+        "temp_store": "MEMORY",
+        "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+    },
+    # cargas masivas (populate_db.py): sin fsync, se reconstruye si falla
+    "bulk_load": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "page_size": SQLITE_PAGE_SIZE,
+        "cache_size": -4 * SQLITE_CACHE_SIZE_KB,
+        "mmap_size": SQLITE_MMAP_SIZE,
+        "temp_store": "MEMORY",
+        "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+    },
+}
+
+# persistentes en el fichero: solo se fijan al crear la base de datos
+_CREATION_PRAGMAS = ("page_size", "journal_mode")
+
+
+def _profile(name: str | None) -> dict[str, Any]:
+    return PROFILES.get(name or SQLITE_PROFILE, PROFILES["performance"])
+
+
+def apply_creation_profile(conn: sqlite3.Connection, profile: str | None = None) -> None:
+    # page_size tiene que ir antes de crear la primera tabla (o de pasar a WAL)
+    settings = _profile(profile)
+    for pragma in _CREATION_PRAGMAS:
+        if pragma in settings:
+            conn.execute(f"PRAGMA {pragma}={settings[pragma]}")
+    configure_connection(conn, profile=profile)
+
+
+def configure_connection(conn: sqlite3.Connection, read_only: bool = False, profile: str | None = None) -> sqlite3.Connection:
+    for pragma, value in _profile(profile).items():
+        if pragma in _CREATION_PRAGMAS:
+            continue
+        conn.execute(f"PRAGMA {pragma}={value}")
+    if read_only:
+        # lectura: cualquier escritura falla aunque el SQL generado lo intente
+        conn.execute("PRAGMA query_only=ON")
+    return conn
+
+
+def connect(path: str, read_only: bool = False, profile: str | None = None, **kwargs: Any) -> sqlite3.Connection:
+    return configure_connection(sqlite3.connect(path, **kwargs), read_only=read_only, profile=profile)
+
+
+def optimize(conn: sqlite3.Connection, analyze: bool = False) -> dict[str, Any]:
+    # ANALYZE completo solo si no hay estadisticas; despues basta con PRAGMA optimize,
+    # que solo reanaliza las tablas que han cambiado mucho
+    started = time.monotonic()
+    conn.execute(f"PRAGMA analysis_limit={SQLITE_ANALYSIS_LIMIT}")
+    has_stats = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+    ).fetchone() is not None
+    ran_analyze = analyze or not has_stats
+    if ran_analyze:
+        conn.execute("ANALYZE")
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+    return {"analyze": ran_analyze, "seconds": time.monotonic() - started}
+
+
+class DbMaintenance:
+    # PRAGMA optimize periodico con una conexion propia de escritura (las del pool son query_only)
+
+    def __init__(self, db_path: str, interval: float = SQLITE_OPTIMIZE_INTERVAL):
+        self.db_path = db_path
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+        self._state: dict[str, Any] = {
+            "runs": 0,
+            "analyze_runs": 0,
+            "errors": 0,
+            "last_run_at": None,
+            "last_seconds": None,
+            "last_error": None,
+        }
+
+    def _run_once(self) -> dict[str, Any]:
+        conn = connect(self.db_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000)
+        try:
+            # bases de datos creadas antes del perfil: WAL se puede activar en caliente
+            journal_mode = _profile(None).get("journal_mode")
+            if journal_mode:
+                conn.execute(f"PRAGMA journal_mode={journal_mode}")
+            return optimize(conn)
+        finally:
+            conn.close()
+
+    async def run_once(self) -> None:
+        try:
+            result = await asyncio.to_thread(self._run_once)
+        except Exception as e:
+            self._state["errors"] += 1
+            self._state["last_error"] = str(e)
+            return
+        self._state["runs"] += 1
+        self._state["analyze_runs"] += result["analyze"]
+        self._state["last_run_at"] = time.time()
+        self._state["last_seconds"] = result["seconds"]
+
+    async def _loop(self) -> None:
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self.interval > 0 and os.path.exists(self.db_path) and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "profile": SQLITE_PROFILE,
+            "settings": _profile(None),
+            "interval_seconds": self.interval,
+            **self._state,
+        }
@@ -63,6 +63,8 @@ export function useChatStream() {
         prompt: input.trim(),
         stream: true,
         session_id: sessionId,
+        // agrupa tokens en frames "model_chunk" (delta sin doble codificacion)
+        coalesce: { max_latency_ms: 50 },
       }),
     });
 
@@ -93,7 +95,17 @@ export function useChatStream() {
           continue;
         }
 
-        if (json.delta) {
+        if (json.type === "model_chunk") {
+          //{"type": "model_chunk", "timestamp": 1768675249.0428748, "delta": " registered as"}
+          setMessages(prev => {
+            const updated = [...prev];
+            updated[updated.length - 1] = {
+              ...updated[updated.length - 1],
+              text: updated[updated.length - 1].text + json.delta,
+            };
+            return updated;
+          });
+        } else if (json.delta) {
           //{"type": "model_token", "timestamp": 1768675249.0428748, "delta": "{\"delta\": \" registered\"}"}
           //{"type": "model_token", "timestamp": 1768675428.4032488, "delta": "{\"session_id\": \"14071a4f-b066-4437-af95-ceeee041687b\"}"}
           const delta = JSON.parse(json.delta);
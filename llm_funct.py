@@ -2,22 +2,79 @@ from langchain_ollama import ChatOllama
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
 from langchain.tools import tool
 from dotenv import load_dotenv
+import asyncio
+import contextlib
+import json
 import os
-from typing import Any
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable
 
-from ollama import AsyncClient
+import httpx
+from ollama import AsyncClient, ResponseError
 
-from prompts import prompts, system_messages
+from prompts import prompts, system_messages, RUTAS
 
 load_dotenv()
 
 #cambiar el .env
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# varios hosts separados por comas; si no se define se usa solo OLLAMA_BASE_URL
+OLLAMA_BASE_URLS = [u.strip().rstrip("/") for u in os.getenv("OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",") if u.strip()]
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+# peticiones pendientes que "cuesta" enviar a un host sin el modelo cargado
+OLLAMA_AFFINITY_PENALTY = float(os.getenv("OLLAMA_AFFINITY_PENALTY", "2"))
+# agrupa el trabajo por modelo en cada host para no alternar cargas/descargas
+# solo compensa si el host no puede tener todos los modelos cargados a la vez
+LLM_SCHEDULER_ENABLED = os.getenv("LLM_SCHEDULER_ENABLED", "false").lower() in {"1", "true", "yes"}
+LLM_SCHEDULER_MAX_WAIT = float(os.getenv("LLM_SCHEDULER_MAX_WAIT", "2.0"))
+# llamadas identicas en curso (modelo, mensajes, opciones) comparten una sola inferencia
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "true").lower() in {"1", "true", "yes"}
 DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "llama3.1:8b")
 CLASSIFICATION_MODEL = os.getenv("CLASSIFICATION_MODEL", DEFAULT_MODEL)
 OLLAMA_AUTO_PULL = os.getenv("OLLAMA_AUTO_PULL", "false").lower() in {"1", "true", "yes"}
+# conexiones HTTP reutilizables por host de ollama
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "16"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60"))
+# precarga y residencia de modelos (keep_alive de ollama: "30m", segundos o "-1" = siempre)
+OLLAMA_PRELOAD = os.getenv("OLLAMA_PRELOAD", "true").lower() in {"1", "true", "yes"}
+OLLAMA_PRELOAD_TIMEOUT = float(os.getenv("OLLAMA_PRELOAD_TIMEOUT", "120"))
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_KEEP_ALIVE_REFRESH = float(os.getenv("OLLAMA_KEEP_ALIVE_REFRESH", "300"))
+OLLAMA_WARMUP_PROMPT = os.getenv("OLLAMA_WARMUP_PROMPT", "ok")
+# clasificacion con salida estructurada (enum de rutas) y decodificacion acotada
+CLASSIFIER_CONSTRAINED = os.getenv("CLASSIFIER_CONSTRAINED", "false").lower() in {"1", "true", "yes"}
+CLASSIFIER_NUM_PREDICT = int(os.getenv("CLASSIFIER_NUM_PREDICT", "24"))
+CLASSIFIER_NUM_CTX = int(os.getenv("CLASSIFIER_NUM_CTX", "2048"))
 
-_READY_MODELS: set[str] = set()
+# modo fusionado clasificacion + SQL: el SQL necesita mas margen que la etiqueta
+FUSED_NUM_PREDICT = int(os.getenv("FUSED_NUM_PREDICT", "512"))
+
+ROUTE_SCHEMA = {
+    "type": "object",
+    "properties": {"route": {"type": "string", "enum": sorted(RUTAS)}},
+    "required": ["route"],
+}
+
+ROUTE_SQL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "route": {"type": "string", "enum": sorted(RUTAS)},
+        "sql": {"type": "string"},
+    },
+    "required": ["route", "sql"],
+}
+
+_READY_MODELS: set[tuple[str, str]] = set() # (base_url, modelo)
+
+
+_PULL_LOCKS: dict[tuple[str, str], asyncio.Lock] = {}
+_pull_stats = {"pulls": 0, "pull_waits_deduplicated": 0}
+
+
+class ModelUnavailableError(RuntimeError):
+    pass
 
 def _extract_model_names(tags_resp: Any) -> list[str]:
     models = []
@@ -37,54 +94,728 @@ def _extract_model_names(tags_resp: Any) -> list[str]:
     return names
 
 
-async def get_ollama_runtime_status() -> dict[str, Any]:
-    client = AsyncClient(host=OLLAMA_BASE_URL)
+class OllamaClientRegistry:
+    # un transporte httpx (pool de conexiones keep-alive) por base_url, compartido por
+    # el AsyncClient de ollama y por todos los ChatOllama de ese host; los ChatOllama
+    # se reutilizan por (base_url, modelo, opciones)
+
+    def __init__(self, pool_size: int = OLLAMA_POOL_SIZE, keepalive_expiry: float = OLLAMA_KEEPALIVE_EXPIRY):
+        self.pool_size = max(1, pool_size)
+        self.keepalive_expiry = keepalive_expiry
+
+        self._lock = threading.Lock()
+        self._transports: dict[str, httpx.AsyncHTTPTransport] = {}
+        self._clients: dict[str, AsyncClient] = {}
+        self._chat_models: dict[tuple[str, str, str], ChatOllama] = {}
+        self._counters = {
+            "chat_model_hits": 0,
+            "chat_model_misses": 0,
+            "requests": 0,
+            "connections_opened": 0,
+            "closed": 0,
+        }
+
+    async def _trace(self, event: str, info: dict) -> None:
+        if event == "connection.connect_tcp.complete":
+            self._counters["connections_opened"] += 1
+
+    async def _on_request(self, request: httpx.Request) -> None:
+        self._counters["requests"] += 1
+        request.extensions["trace"] = self._trace
+
+    def _transport(self, base_url: str) -> httpx.AsyncHTTPTransport:
+        transport = self._transports.get(base_url)
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.keepalive_expiry,
+            ))
+            self._transports[base_url] = transport
+        return transport
+
+    def _httpx_kwargs(self, base_url: str) -> dict[str, Any]:
+        return {"transport": self._transport(base_url), "event_hooks": {"request": [self._on_request]}}
+
+    def client(self, base_url: str = OLLAMA_BASE_URL) -> AsyncClient:
+        with self._lock:
+            client = self._clients.get(base_url)
+            if client is None:
+                client = AsyncClient(host=base_url, **self._httpx_kwargs(base_url))
+                self._clients[base_url] = client
+            return client
+
+    def chat_model(self, base_url: str, model: str, **options: Any) -> ChatOllama:
+        key = (base_url, model, json.dumps(options, sort_keys=True, default=str))
+        with self._lock:
+            llm = self._chat_models.get(key)
+            if llm is not None:
+                self._counters["chat_model_hits"] += 1
+                return llm
+            self._counters["chat_model_misses"] += 1
+            llm = ChatOllama(
+                base_url=base_url,
+                model=model,
+                async_client_kwargs=self._httpx_kwargs(base_url),
+                **options,
+            )
+            self._chat_models[key] = llm
+            return llm
+
+    async def aclose(self) -> None:
+        with self._lock:
+            transports = list(self._transports.values())
+            self._transports.clear()
+            self._clients.clear()
+            self._chat_models.clear()
+        for transport in transports:
+            await transport.aclose()
+        self._counters["closed"] += 1
+
+    def stats(self) -> dict[str, Any]:
+        requests = self._counters["requests"]
+        opened = self._counters["connections_opened"]
+        return {
+            "pool_size": self.pool_size,
+            "keepalive_expiry": self.keepalive_expiry,
+            "hosts": list(self._transports),
+            "chat_models": len(self._chat_models),
+            **self._counters,
+            "connections_reused": max(0, requests - opened),
+            "reuse_rate": (requests - opened) / requests if requests else 0.0,
+        }
+
+
+ollama_clients = OllamaClientRegistry()
+
+
+async def get_ollama_runtime_status(base_url: str = OLLAMA_BASE_URL) -> dict[str, Any]:
+    client = ollama_clients.client(base_url)
     try:
         tags_resp = await client.list()
         return {
             "ok": True,
-            "base_url": OLLAMA_BASE_URL,
+            "base_url": base_url,
             "models": _extract_model_names(tags_resp),
             "auto_pull": OLLAMA_AUTO_PULL,
         }
     except Exception as e:
         return {
             "ok": False,
-            "base_url": OLLAMA_BASE_URL,
+            "base_url": base_url,
             "models": [],
             "auto_pull": OLLAMA_AUTO_PULL,
             "error": str(e),
         }
 
 
-async def ensure_ollama_model(model_name: str) -> None:
-    if not model_name or model_name in _READY_MODELS:
+async def ensure_ollama_model(model_name: str, base_url: str = OLLAMA_BASE_URL) -> None:
+    if not model_name or (base_url, model_name) in _READY_MODELS:
         return
 
-    client = AsyncClient(host=OLLAMA_BASE_URL)
-    tags_resp = await client.list()
-    available_models = set(_extract_model_names(tags_resp))
+    # un solo list/pull por modelo y host; el resto espera y reutiliza el resultado
+    lock = _PULL_LOCKS.setdefault((base_url, model_name), asyncio.Lock())
+    async with lock:
+        if (base_url, model_name) in _READY_MODELS:
+            _pull_stats["pull_waits_deduplicated"] += 1
+            return
 
-    if model_name not in available_models:
-        if not OLLAMA_AUTO_PULL:
-            raise RuntimeError(
-                f"Modelo '{model_name}' no disponible en Ollama. "
-                "Activa OLLAMA_AUTO_PULL=true o ejecútalo manualmente con 'ollama pull'."
-            )
-        await client.pull(model=model_name)
+        client = ollama_clients.client(base_url)
+        tags_resp = await client.list()
+        available_models = set(_extract_model_names(tags_resp))
+
+        if model_name not in available_models:
+            if not OLLAMA_AUTO_PULL:
+                raise ModelUnavailableError(
+                    f"Modelo '{model_name}' no disponible en Ollama ({base_url}). "
+                    "Activa OLLAMA_AUTO_PULL=true o ejecútalo manualmente con 'ollama pull'."
+                )
+            _pull_stats["pulls"] += 1
+            await client.pull(model=model_name)
+
+        _READY_MODELS.add((base_url, model_name))
+
+
+def _is_backend_error(e: BaseException) -> bool:
+    # errores del host (caido, 5xx, sin el modelo) -> se puede probar otro
+    if isinstance(e, (ConnectionError, httpx.TransportError, ModelUnavailableError)):
+        return True
+    return isinstance(e, ResponseError) and (e.status_code >= 500 or e.status_code == 404)
+
+
+class _Backend:
+    __slots__ = ("url", "healthy", "outstanding", "models", "resident", "requests", "failures",
+                 "failovers", "last_error", "last_check_at")
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True # optimista hasta la primera comprobacion
+        self.outstanding = 0
+        self.models: set[str] = set()
+        self.resident: set[str] = set()
+        self.requests = 0
+        self.failures = 0
+        self.failovers = 0
+        self.last_error: str | None = None
+        self.last_check_at: float | None = None
+
+
+class OllamaBackendPool:
+    # reparte cada llamada entre varios hosts de ollama: menos peticiones pendientes,
+    # con preferencia por el host que ya tiene el modelo cargado; un host que falla
+    # antes de empezar a responder se marca caido y la llamada se repite en otro
 
-    _READY_MODELS.add(model_name)
+    def __init__(
+        self,
+        urls: list[str] = OLLAMA_BASE_URLS,
+        health_interval: float = OLLAMA_HEALTH_INTERVAL,
+        affinity_penalty: float = OLLAMA_AFFINITY_PENALTY,
+    ):
+        self.backends = [_Backend(u) for u in dict.fromkeys(urls)]
+        self.health_interval = health_interval
+        self.affinity_penalty = affinity_penalty
+        self._task: asyncio.Task | None = None
 
-def get_chat_model(model: str, streaming: bool = False) -> ChatOllama:
-    #lang chain
-    return ChatOllama(
-        base_url=OLLAMA_BASE_URL,
-        model=model,
+    @property
+    def urls(self) -> list[str]:
+        return [b.url for b in self.backends]
+
+    def pick(self, model: str, exclude: set[str] = frozenset()) -> _Backend | None:
+        candidates = [b for b in self.backends if b.url not in exclude]
+        if not candidates:
+            return None
+        healthy = [b for b in candidates if b.healthy] or candidates
+        # si algun host sano conoce el modelo, solo se consideran esos
+        with_model = [b for b in healthy if model in b.models] or healthy
+
+        def cost(b: _Backend) -> float:
+            return b.outstanding + (0.0 if model in b.resident else self.affinity_penalty)
+
+        return min(with_model, key=cost)
+
+    def _mark_failed(self, backend: _Backend, e: BaseException) -> None:
+        backend.failures += 1
+        backend.last_error = str(e)
+        if not isinstance(e, ModelUnavailableError):
+            backend.healthy = False # lo reactivara la comprobacion periodica
+
+    async def call(self, model: str, fn: Callable[[str], Awaitable[Any]]) -> Any:
+        # fn(base_url) hace la llamada completa contra un host
+        tried: set[str] = set()
+        while True:
+            backend = self.pick(model, tried)
+            if backend is None:
+                raise ConnectionError(f"Ningun host de ollama disponible para '{model}'")
+            tried.add(backend.url)
+            backend.outstanding += 1
+            backend.requests += 1
+            try:
+                result = await fn(backend.url)
+            except Exception as e:
+                if not _is_backend_error(e):
+                    raise
+                # tambien el ultimo candidato: si no, un host caido sigue marcado sano
+                self._mark_failed(backend, e)
+                if len(tried) == len(self.backends):
+                    raise
+                backend.failovers += 1
+                continue
+            finally:
+                backend.outstanding -= 1
+            backend.resident.add(model)
+            return result
+
+    async def stream(self, model: str, fn: Callable[[str], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        # solo hay failover mientras no se ha emitido ningun fragmento
+        tried: set[str] = set()
+        while True:
+            backend = self.pick(model, tried)
+            if backend is None:
+                raise ConnectionError(f"Ningun host de ollama disponible para '{model}'")
+            tried.add(backend.url)
+            backend.outstanding += 1
+            backend.requests += 1
+            started = False
+            try:
+                # cierre explicito: si el consumidor deja de leer, la llamada al host se corta ya
+                async with contextlib.aclosing(fn(backend.url)) as items:
+                    async for item in items:
+                        started = True
+                        yield item
+            except Exception as e:
+                if not _is_backend_error(e):
+                    raise
+                self._mark_failed(backend, e)
+                if started or len(tried) == len(self.backends):
+                    raise
+                backend.failovers += 1
+                continue
+            finally:
+                backend.outstanding -= 1
+            backend.resident.add(model)
+            return
+
+    async def check(self, backend: _Backend) -> None:
+        status = await get_ollama_runtime_status(backend.url)
+        backend.last_check_at = time.time()
+        backend.healthy = status["ok"]
+        if not status["ok"]:
+            backend.last_error = status.get("error")
+            return
+        backend.models = set(status["models"])
+        try:
+            ps = await ollama_clients.client(backend.url).ps()
+            backend.resident = {m.model or m.name for m in getattr(ps, "models", []) or []}
+        except Exception:
+            pass
+
+    async def check_all(self) -> None:
+        await asyncio.gather(*(self.check(b) for b in self.backends))
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_all()
+
+    async def start(self) -> None:
+        await self.check_all()
+        if self.health_interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._health_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> list[dict[str, Any]]:
+        return [
+            {
+                "url": b.url,
+                "healthy": b.healthy,
+                "outstanding": b.outstanding,
+                "requests": b.requests,
+                "failures": b.failures,
+                "failovers": b.failovers,
+                "models": sorted(b.models),
+                "resident": sorted(b.resident),
+                "last_error": b.last_error,
+                "last_check_at": b.last_check_at,
+            }
+            for b in self.backends
+        ]
+
+
+ollama_backends = OllamaBackendPool()
+
+class _Lane:
+    __slots__ = ("current", "active", "waiting", "last_arrival")
+
+    def __init__(self):
+        self.current: str | None = None # ultimo modelo que ha usado el host
+        self.active = 0
+        self.waiting: dict[str, deque] = {}
+        self.last_arrival: str | None = None
+
+
+class ModelScheduler:
+    # por host: mientras haya llamadas del modelo actual en curso se admiten mas del mismo
+    # modelo y las de otros esperan; el cambio llega cuando el modelo actual se vacia o
+    # cuando alguna espera supera max_wait: entonces ya no se admite mas del actual y la
+    # llamada que ha agotado su espera pasa aunque sigan llamadas del actual en curso.
+    # Con ModelKeeper precargando varios modelos en el mismo host no hay cambios que
+    # evitar (ollama los mantiene residentes a la vez): por eso va desactivado por defecto
+
+    def __init__(self, max_wait: float = LLM_SCHEDULER_MAX_WAIT, enabled: bool = LLM_SCHEDULER_ENABLED):
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self._lanes: dict[str, _Lane] = {}
+        self._counters = {
+            "calls": 0,
+            "queued": 0,
+            "swaps": 0,
+            "arrival_order_swaps": 0,
+            "forced_by_max_wait": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+        }
+
+    def _starving(self, lane: _Lane, now: float) -> bool:
+        return any(
+            model != lane.current and queue and now - queue[0][1] >= self.max_wait
+            for model, queue in lane.waiting.items()
+        )
+
+    def _admit(self, lane: _Lane, model: str) -> None:
+        if lane.current is not None and lane.current != model:
+            self._counters["swaps"] += 1
+        lane.current = model
+        lane.active += 1
+
+    def _admit_waiters(self, lane: _Lane, model: str) -> None:
+        queue = lane.waiting.pop(model, None) or deque()
+        for fut, _ in queue:
+            if not fut.done():
+                self._admit(lane, model)
+                fut.set_result(None)
+
+    def _dispatch(self, lane: _Lane) -> None:
+        now = time.monotonic()
+        starving = self._starving(lane, now)
+        if lane.active > 0:
+            if not starving and lane.current in lane.waiting:
+                self._admit_waiters(lane, lane.current)
+            return
+        if not lane.waiting:
+            return
+        if lane.current in lane.waiting and not starving:
+            nxt = lane.current
+        else:
+            nxt = min(lane.waiting, key=lambda m: lane.waiting[m][0][1])
+            if starving:
+                self._counters["forced_by_max_wait"] += 1
+        self._admit_waiters(lane, nxt)
+
+    @staticmethod
+    def _forget(lane: _Lane, model: str, entry: tuple) -> None:
+        entry[0].cancel()
+        queue = lane.waiting.get(model)
+        if queue is not None and entry in queue:
+            queue.remove(entry)
+            if not queue:
+                del lane.waiting[model]
+
+    def _release(self, lane: _Lane) -> None:
+        lane.active -= 1
+        self._dispatch(lane)
+
+    async def _acquire(self, lane: _Lane, model: str) -> None:
+        self._counters["calls"] += 1
+        # cambios de modelo que habria en orden de llegada (sin planificador)
+        if lane.last_arrival is not None and lane.last_arrival != model:
+            self._counters["arrival_order_swaps"] += 1
+        lane.last_arrival = model
+
+        now = time.monotonic()
+        idle = lane.active == 0 and not lane.waiting
+        if idle or (model == lane.current and not self._starving(lane, now)):
+            self._admit(lane, model)
+            return
+
+        self._counters["queued"] += 1
+        fut = asyncio.get_running_loop().create_future()
+        entry = (fut, now)
+        lane.waiting.setdefault(model, deque()).append(entry)
+        try:
+            await asyncio.wait({fut}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self._release(lane) # admitido justo antes de cancelarse
+            else:
+                self._forget(lane, model, entry)
+                self._dispatch(lane)
+            raise
+        if not fut.done():
+            # max_wait es un limite real: no se espera a que terminen las llamadas en curso
+            # del modelo actual (p.ej. una generacion larga)
+            self._forget(lane, model, entry)
+            self._counters["forced_by_max_wait"] += 1
+            self._admit(lane, model)
+        waited = time.monotonic() - now
+        self._counters["wait_seconds_total"] += waited
+        self._counters["wait_seconds_max"] = max(self._counters["wait_seconds_max"], waited)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, base_url: str, model: str):
+        if not self.enabled:
+            yield
+            return
+        lane = self._lanes.setdefault(base_url, _Lane())
+        await self._acquire(lane, model)
+        try:
+            yield
+        finally:
+            self._release(lane)
+
+    def stats(self) -> dict[str, Any]:
+        queued = self._counters["queued"]
+        return {
+            "enabled": self.enabled,
+            "max_wait": self.max_wait,
+            **self._counters,
+            "swaps_avoided": max(0, self._counters["arrival_order_swaps"] - self._counters["swaps"]),
+            "wait_seconds_avg": self._counters["wait_seconds_total"] / queued if queued else 0.0,
+            "lanes": {
+                url: {
+                    "current": lane.current,
+                    "active": lane.active,
+                    "waiting": {m: len(q) for m, q in lane.waiting.items()},
+                }
+                for url, lane in self._lanes.items()
+            },
+        }
+
+
+llm_scheduler = ModelScheduler()
+
+
+class SingleFlight:
+    # la primera llamada lanza la tarea; las identicas que llegan mientras sigue en curso
+    # esperan el mismo resultado. Si todas las que esperan se cancelan, se cancela la tarea
+
+    def __init__(self, enabled: bool = LLM_SINGLE_FLIGHT):
+        self.enabled = enabled
+        self._inflight: dict[Any, list] = {} # key -> [tarea, esperando]
+        self._counters = {"calls": 0, "inferences": 0, "inferences_saved": 0, "abandoned": 0}
+
+    async def run(self, key: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self._counters["calls"] += 1
+        if not self.enabled:
+            self._counters["inferences"] += 1
+            return await fn()
+
+        entry = self._inflight.get(key)
+        if entry is None:
+            self._counters["inferences"] += 1
+            entry = [asyncio.ensure_future(fn()), 0]
+            self._inflight[key] = entry
+            entry[0].add_done_callback(lambda _: self._inflight.pop(key, None) if self._inflight.get(key) is entry else None)
+        else:
+            self._counters["inferences_saved"] += 1
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                # fuera del mapa ya: quien llegue ahora lanza su propia llamada en vez de
+                # unirse a una tarea que se esta cancelando
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+                task.cancel()
+                self._counters["abandoned"] += 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._inflight),
+            **self._counters,
+            **_pull_stats,
+        }
+
+
+llm_single_flight = SingleFlight()
+
+
+def _flight_key(model: str, messages: list, options: dict[str, Any]) -> tuple:
+    rendered = tuple((m.type, m.content if isinstance(m.content, str) else json.dumps(m.content)) for m in messages)
+    return model, rendered, json.dumps(options, sort_keys=True, default=str)
+
+
+def get_chat_model(model: str, streaming: bool = False, base_url: str = OLLAMA_BASE_URL, **options: Any) -> ChatOllama:
+    #lang chain, reutilizado por (base_url, modelo, opciones)
+    return ollama_clients.chat_model(
+        base_url,
+        model,
         temperature=0,
         streaming=streaming,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        **options,
     )
 
 
+async def invoke_chat(model: str, messages: list, **options: Any) -> Any:
+    # llamada no streaming repartida entre los hosts de ollama
+    async def _call(base_url: str) -> Any:
+        await ensure_ollama_model(model, base_url)
+        async with llm_scheduler.slot(base_url, model):
+            return await get_chat_model(model, streaming=False, base_url=base_url, **options).ainvoke(messages)
+
+    return await llm_single_flight.run(
+        _flight_key(model, messages, options),
+        lambda: ollama_backends.call(model, _call),
+    )
+
+
+def classifier_options(model: str, constrained: bool = CLASSIFIER_CONSTRAINED) -> dict[str, Any]:
+    if not constrained:
+        return {}
+    options: dict[str, Any] = {"format": ROUTE_SCHEMA, "num_predict": CLASSIFIER_NUM_PREDICT}
+    # ollama recarga el modelo si cambia num_ctx: solo se reduce cuando la clasificacion
+    # usa un modelo distinto del de generacion
+    if CLASSIFIER_NUM_CTX > 0 and model != DEFAULT_MODEL:
+        options["num_ctx"] = CLASSIFIER_NUM_CTX
+    return options
+
+
+def parse_route_sql(content: str) -> dict[str, str] | None:
+    # None si la salida no respeta el esquema
+    try:
+        data = json.loads((content or "").strip())
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(data, dict) or data.get("route") not in RUTAS:
+        return None
+    sql = data.get("sql")
+    return {"route": data["route"], "sql": sql.strip() if isinstance(sql, str) else ""}
+
+
+def parse_route(content: str) -> str:
+    content = (content or "").strip()
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError:
+        return content
+    if isinstance(data, dict):
+        return str(data.get("route", "")).strip()
+    return content
+
+
+class ModelKeeper:
+    # precarga los modelos al arrancar (carga + prompt de calentamiento) en cada host y
+    # renueva su keep_alive periodicamente para que ollama no los descargue entre peticiones
+
+    def __init__(
+        self,
+        models: list[str],
+        urls: list[str] = OLLAMA_BASE_URLS,
+        keep_alive: str = OLLAMA_KEEP_ALIVE,
+        refresh_interval: float = OLLAMA_KEEP_ALIVE_REFRESH,
+        warmup_prompt: str = OLLAMA_WARMUP_PROMPT,
+    ):
+        self.models = list(dict.fromkeys(m for m in models if m))
+        self.urls = list(dict.fromkeys(urls))
+        self.keep_alive = keep_alive
+        self.refresh_interval = refresh_interval
+        self.warmup_prompt = warmup_prompt
+
+        self._task: asyncio.Task | None = None
+        self._state: dict[tuple[str, str], dict[str, Any]] = {
+            (u, m): {
+                "warmed_up": False,
+                "loads": 0,
+                "refreshes": 0,
+                "errors": 0,
+                "last_load_seconds": None,
+                "last_load_at": None,
+                "last_refresh_at": None,
+                "last_call_seconds": None,
+                "last_error": None,
+            }
+            for u in self.urls
+            for m in self.models
+        }
+
+    @staticmethod
+    def _options(model: str) -> dict[str, Any] | None:
+        # mismo num_ctx que las llamadas reales: si cambia, ollama vuelve a cargar el modelo
+        num_ctx = classifier_options(model).get("num_ctx") if model == CLASSIFICATION_MODEL else None
+        return {"num_ctx": num_ctx} if num_ctx else None
+
+    async def _touch(self, url: str, model: str, prompt: str) -> None:
+        state = self._state[(url, model)]
+        client = ollama_clients.client(url)
+        started = time.monotonic()
+        try:
+            options = self._options(model)
+            if prompt:
+                options = {**(options or {}), "num_predict": 1}
+            async with llm_scheduler.slot(url, model):
+                resp = await client.generate(model=model, prompt=prompt, options=options, keep_alive=self.keep_alive)
+        except Exception as e:
+            state["errors"] += 1
+            state["last_error"] = str(e)
+            return
+        now = time.time()
+        state["last_refresh_at"] = now
+        state["refreshes"] += 1
+        # load_duration (ns) solo es apreciable cuando ollama ha tenido que cargar el modelo
+        load_ns = getattr(resp, "load_duration", None) or 0
+        if load_ns >= 1e8:
+            state["loads"] += 1
+            state["last_load_at"] = now
+            state["last_load_seconds"] = load_ns / 1e9
+        state["last_call_seconds"] = time.monotonic() - started
+        if prompt:
+            state["warmed_up"] = True
+        for backend in ollama_backends.backends:
+            if backend.url == url:
+                backend.resident.add(model)
+
+    async def _preload_host(self, url: str) -> None:
+        for model in self.models:
+            try:
+                await ensure_ollama_model(model, url)
+            except Exception as e:
+                self._state[(url, model)]["errors"] += 1
+                self._state[(url, model)]["last_error"] = str(e)
+                continue
+            await self._touch(url, model, self.warmup_prompt)
+
+    async def preload(self) -> None:
+        # hosts en paralelo, modelos de cada host en serie (no compiten por la misma GPU)
+        await asyncio.gather(*(self._preload_host(u) for u in self.urls))
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            await asyncio.gather(*(self._touch(u, m, "") for u, m in self._state))
+
+    async def start(self, preload: bool = OLLAMA_PRELOAD, timeout: float = OLLAMA_PRELOAD_TIMEOUT) -> None:
+        if preload:
+            try:
+                await asyncio.wait_for(self.preload(), timeout)
+            except asyncio.TimeoutError:
+                pass # se sigue arrancando; el refresco lo reintentara
+        if self.refresh_interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _host_status(self, url: str) -> dict[str, Any]:
+        states = {m: self._state[(url, m)] for m in self.models}
+        try:
+            ps = await ollama_clients.client(url).ps()
+        except Exception as e:
+            return {"error": str(e), "models": states}
+        resident: dict[str, Any] = {}
+        for m in getattr(ps, "models", []) or []:
+            expires = getattr(m, "expires_at", None)
+            resident[m.model or m.name] = {
+                "expires_at": expires.isoformat() if expires else None,
+                "size_vram": getattr(m, "size_vram", None),
+            }
+        return {
+            "models": {
+                m: {**state, "resident": m in resident, **resident.get(m, {})}
+                for m, state in states.items()
+            },
+        }
+
+    async def status(self) -> dict[str, Any]:
+        hosts = await asyncio.gather(*(self._host_status(u) for u in self.urls))
+        return {
+            "keep_alive": self.keep_alive,
+            "refresh_interval": self.refresh_interval,
+            "hosts": dict(zip(self.urls, hosts)),
+        }
+
+
+model_keeper = ModelKeeper([DEFAULT_MODEL, CLASSIFICATION_MODEL])
+
+
 def build_messages(conv: list[dict], system_prompt: str, prompt_override: str | None = None):
     messages = []
     if system_prompt:
@@ -121,37 +852,78 @@ def format_conv(conv: list[dict]) -> str:
     return formatted_conv
 
 
+async def _read_ahead(stream: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    # los generadores internos de langchain/ollama no cierran a los que iteran, asi que un
+    # aclose() desde fuera no llega a la respuesta httpx. La lectura va en su propia tarea,
+    # que siempre esta esperando al socket: al cerrar se cancela y la CancelledError
+    # recorre toda la cadena hasta cerrar la conexion con ollama
+    queue: asyncio.Queue = asyncio.Queue()
+    end = object()
+
+    async def _reader() -> None:
+        try:
+            async with contextlib.aclosing(stream) as items:
+                async for item in items:
+                    queue.put_nowait((item, None))
+        except Exception as e:
+            queue.put_nowait((end, e))
+        else:
+            queue.put_nowait((end, None))
+
+    task = asyncio.ensure_future(_reader())
+    try:
+        while True:
+            item, error = await queue.get()
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        task.cancel()
+        await asyncio.wait({task})
+
+
 async def stream_from_ollama(payload, conv: list[dict]):
     model_name = payload.get("generation_model") or payload.get("model", DEFAULT_MODEL)
     system_prompt = payload.get("system", "")
     prompt = payload.get("prompt", "")
 
+    async def _astream(base_url: str):
+        await ensure_ollama_model(model_name, base_url)
+        async with llm_scheduler.slot(base_url, model_name):
+            chunks = get_chat_model(model_name, streaming=True, base_url=base_url).astream(messages)
+            async with contextlib.aclosing(_read_ahead(chunks)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+
     try:
-        await ensure_ollama_model(model_name)
-        llm = get_chat_model(model_name, streaming=True)
         messages = build_messages(conv, system_prompt, prompt_override=prompt)
-        async for chunk in llm.astream(messages):
-            token = chunk.content or ""
-            if token:
-                #delta es un chunk (no todo el mensaje)
-                yield token
+        async with contextlib.aclosing(ollama_backends.stream(model_name, _astream)) as chunks:
+            async for chunk in chunks:
+                token = chunk.content or ""
+                if token:
+                    #delta es un chunk (no todo el mensaje)
+                    yield token
     except Exception as e:
         yield f"\nError en el streaming: {str(e)}\n"
 
 
 @tool("classify_request")
-async def classify_request_tool(prompt: str, model: str | None = None) -> str:
+async def classify_request_tool(prompt: str, model: str | None = None, constrained: bool | None = None) -> str:
     """clasificacion"""
     model_name = model or CLASSIFICATION_MODEL
+    constrained = CLASSIFIER_CONSTRAINED if constrained is None else constrained
     try:
-        await ensure_ollama_model(model_name)
-        llm = get_chat_model(model_name, streaming=False)
+        user_prompt = prompts["route_user_prompt"].format(prompt=prompt)
+        if constrained:
+            user_prompt += prompts["route_json_suffix"]
         messages = [
             SystemMessage(content=system_messages["system_route"]),
-            HumanMessage(content=prompts["route_user_prompt"].format(prompt=prompt)),
+            HumanMessage(content=user_prompt),
         ]
-        response = await llm.ainvoke(messages)
-        return response.content.strip()
+        response = await invoke_chat(model_name, messages, **classifier_options(model_name, constrained))
+        return parse_route(response.content)
     except Exception:
         return "simple_request"
 
@@ -166,13 +938,31 @@ async def generate_sql_tool(prompt: str, db_schema: str, conv: list[dict]) -> st
     )
 
     try:
-        await ensure_ollama_model(DEFAULT_MODEL)
-        llm = get_chat_model(DEFAULT_MODEL, streaming=False)
         messages = [
             SystemMessage(content=system_messages["system_sql_generation"]),
             HumanMessage(content=prompt_w_c),
         ]
-        response = await llm.ainvoke(messages)
+        response = await invoke_chat(DEFAULT_MODEL, messages)
         return response.content.strip()
     except Exception:
         return ""
+
+
+@tool("classify_and_generate_sql")
+async def classify_and_generate_sql_tool(prompt: str, db_schema: str, conv: list[dict]) -> dict | None:
+    """clasificacion + generacion de consulta sql en una sola llamada"""
+    prompt_w_c = prompts["route_sql_full_prompt"].format(
+        conversation=format_conv(conv),
+        db_schema=db_schema,
+        prompt=prompt,
+    )
+
+    try:
+        messages = [
+            SystemMessage(content=system_messages["system_route_sql"]),
+            HumanMessage(content=prompt_w_c),
+        ]
+        response = await invoke_chat(DEFAULT_MODEL, messages, format=ROUTE_SQL_SCHEMA, num_predict=FUSED_NUM_PREDICT)
+        return parse_route_sql(response.content)
+    except Exception:
+        return None
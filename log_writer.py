@@ -0,0 +1,217 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from typing import Any
+
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_FILE = os.getenv("LOG_FILE", "logs.jsonl")
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", "256"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+LOG_FSYNC_INTERVAL = float(os.getenv("LOG_FSYNC_INTERVAL", "5"))
+# drop: descarta si la cola esta llena / block: espera hasta LOG_BLOCK_TIMEOUT antes de descartar
+LOG_OVERFLOW = os.getenv("LOG_OVERFLOW", "drop").lower()
+LOG_BLOCK_TIMEOUT = float(os.getenv("LOG_BLOCK_TIMEOUT", "0.05"))
+
+_STOP = object()
+
+
+class AsyncLogWriter:
+    # cola en memoria + tarea de fondo que escribe por lotes en un hilo
+    # los handlers solo encolan, nunca tocan el disco
+
+    def __init__(
+        self,
+        path: str = os.path.join(LOG_DIR, LOG_FILE),
+        queue_max: int = LOG_QUEUE_MAX,
+        batch_size: int = LOG_BATCH_SIZE,
+        flush_interval: float = LOG_FLUSH_INTERVAL,
+        fsync_interval: float = LOG_FSYNC_INTERVAL,
+        overflow: str = LOG_OVERFLOW,
+        block_timeout: float = LOG_BLOCK_TIMEOUT,
+    ):
+        self.path = path
+        self.queue_max = queue_max
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._fh = None
+        # el fichero lo comparten el hilo del escritor por lotes y las escrituras sincronas
+        self._fh_lock = threading.Lock()
+        self._last_fsync = time.monotonic()
+        self._counters = {
+            "enqueued": 0,
+            "written": 0,
+            "dropped": 0,
+            "blocked": 0,
+            "batches": 0,
+            "fsyncs": 0,
+            "sync_writes": 0,
+            "write_errors": 0,
+        }
+
+    @staticmethod
+    def _record(log_type: str, payload: dict) -> dict:
+        return {
+            "type": log_type,
+            "timestamp": time.time(),
+            **payload,
+        }
+
+    def start(self) -> None:
+        if self._task is not None and not self._task.done():
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_max)
+        self._task = self._loop.create_task(self._run())
+
+    def _ensure_started(self) -> bool:
+        if self._task is not None and not self._task.done():
+            return True
+        try:
+            self.start()
+        except RuntimeError:
+            # sin event loop (scripts, notebooks sincronos)
+            return False
+        return True
+
+    def _enqueue(self, record: dict) -> None:
+        try:
+            self._queue.put_nowait(record)
+            self._counters["enqueued"] += 1
+        except asyncio.QueueFull:
+            self._counters["dropped"] += 1
+
+    def _running_elsewhere(self) -> bool:
+        # el escritor corre en el loop de otro hilo (p.ej. log() desde un hilo del pool)
+        if self._loop is None or self._task is None or self._task.done():
+            return False
+        try:
+            return asyncio.get_running_loop() is not self._loop
+        except RuntimeError:
+            return True
+
+    def log(self, log_type: str, payload: dict) -> None:
+        record = self._record(log_type, payload)
+        if self._running_elsewhere():
+            # asyncio.Queue no es thread-safe: se encola desde el propio loop
+            try:
+                self._loop.call_soon_threadsafe(self._enqueue, record)
+                return
+            except RuntimeError:
+                pass # loop cerrado: escritura sincrona
+        elif self._ensure_started():
+            self._enqueue(record)
+            return
+        self._counters["sync_writes"] += 1
+        self._write_batch([record])
+
+    async def alog(self, log_type: str, payload: dict) -> None:
+        if self.overflow != "block":
+            self.log(log_type, payload)
+            return
+
+        record = self._record(log_type, payload)
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self._counters["blocked"] += 1
+            try:
+                await asyncio.wait_for(self._queue.put(record), self.block_timeout)
+            except asyncio.TimeoutError:
+                self._counters["dropped"] += 1
+                return
+        self._counters["enqueued"] += 1
+
+    async def _run(self) -> None:
+        queue = self._queue
+        stopping = False
+        while not stopping:
+            item = await queue.get()
+            stopping = item is _STOP
+            batch = [] if stopping else [item]
+            # con poca carga se espera un poco para acumular un lote
+            # (sleep en vez de wait_for(queue.get()): en 3.11 este puede tragarse la cancelacion)
+            if not stopping and queue.qsize() < self.batch_size - 1 and self.flush_interval > 0:
+                await asyncio.sleep(self.flush_interval)
+            while not stopping and len(batch) < self.batch_size:
+                try:
+                    item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            if batch:
+                await asyncio.to_thread(self._write_batch, batch)
+
+    def _write_batch(self, batch: list[dict]) -> None:
+        with self._fh_lock:
+            self._write_batch_locked(batch)
+
+    def _write_batch_locked(self, batch: list[dict]) -> None:
+        try:
+            if self._fh is None:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                self._fh = open(self.path, "a", encoding="utf-8")
+            self._fh.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in batch))
+            self._fh.flush()
+            if time.monotonic() - self._last_fsync >= self.fsync_interval:
+                os.fsync(self._fh.fileno())
+                self._last_fsync = time.monotonic()
+                self._counters["fsyncs"] += 1
+            self._counters["written"] += len(batch)
+            self._counters["batches"] += 1
+        except OSError:
+            self._counters["write_errors"] += 1
+
+    def _close_file(self) -> None:
+        with self._fh_lock:
+            if self._fh is None:
+                return
+            try:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+                self._counters["fsyncs"] += 1
+            finally:
+                self._fh.close()
+                self._fh = None
+
+    async def stop(self) -> None:
+        # vacia la cola, escribe lo pendiente y hace fsync antes de cerrar
+        if self._task is not None and not self._task.done():
+            await self._queue.put(_STOP)
+            await self._task
+        self._task = None
+        await asyncio.to_thread(self._close_file)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "path": self.path,
+            "running": self._task is not None and not self._task.done(),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_max": self.queue_max,
+            "overflow": self.overflow,
+            **self._counters,
+        }
+
+
+log_writer = AsyncLogWriter()
+
+
+def log_event(log_type: str, payload: dict) -> None:
+    log_writer.log(log_type, payload)
+
+
+async def alog_event(log_type: str, payload: dict) -> None:
+    await log_writer.alog(log_type, payload)
@@ -1,32 +1,26 @@
 from typing import TypedDict, Any
+import asyncio
+import random
 import sqlite3
 import time
 import os
-import json
 
 from langgraph.graph import StateGraph, START, END
 
-from llm_funct import classify_request_tool, generate_sql_tool
+from llm_funct import classify_request_tool, generate_sql_tool, classify_and_generate_sql_tool
+from log_writer import alog_event
+from sql_exec import sql_executor
+from query_cache import query_cache, normalize_sql
+from question_cache import question_cache, schema_hash, SQL_QUESTION_CACHE_FIRST_TURN_ONLY
+from result_format import encode_results, encode_rows, SQL_RESULT_MAX_ROWS
+from result_cursors import result_cursors, SQL_PAGING_AVAILABLE, SQL_STREAM_ROWS
+from sql_guard import analyze_sql, QueryRejected
+from route_model import load_route_model, ROUTE_MODEL_PATH, ROUTE_MODEL_THRESHOLD, ROUTE_MODEL_SHADOW_RATE
 from prompts import prompts, system_messages, RUTAS, SENSITIVE_KEYWORDS
 
 CLIENTS_PII = "clients_pii"
 
 
-def _log_event(log_type: str, payload: dict):
-    lg_dir = "logs"
-    os.makedirs(lg_dir, exist_ok=True)
-    path = os.path.join(lg_dir, "logs.jsonl")
-
-    record = {
-        "type": log_type,
-        "timestamp": time.time(),
-        **payload,
-    }
-
-    with open(path, "a", encoding="utf-8") as fh:
-        fh.write(json.dumps(record, ensure_ascii=False) + "\n")
-
-
 def _clean_sql_info(table_name: str, columns: list[tuple]) -> list[tuple]:
     if (table_name or "").lower() == CLIENTS_PII:
         return []
@@ -42,21 +36,70 @@ class OrchestrationState(TypedDict, total=False):
     session_id: str
     full_conv: list[dict] #contexto
     route: str
+    route_source: str #keyword | fast_path | llm
     db_prompt: str
     sql_query: str
+    sql_cache_hit: bool
     query_results: str
+    result_cursor: dict[str, Any] #modo paginado: cursor_id y columnas
 
 
-async def classify_node(state: OrchestrationState) -> dict[str, Any]:
-    prompt = state.get("prompt", "") or ""
-    prompt_l = prompt.lower()
-    payload = state.get("payload", {}) or {}
-    model_name = payload.get("classification_model") or payload.get("model")
+# modo especulativo: esquema + SQL en paralelo con la clasificacion (opt-in)
+ORCHESTRATOR_SPECULATIVE = os.getenv("ORCHESTRATOR_SPECULATIVE", "false").lower() in {"1", "true", "yes"}
+
+_speculative_stats: dict[str, Any] = {
+    "runs": 0,
+    "used": 0,
+    "discarded": 0,
+    "cancelled": 0,
+    "failed": 0,
+    "ttft_saved_seconds_total": 0.0,
+    "wasted_sql_generations": 0,
+    "wasted_model_seconds": 0.0,
+}
 
-    if any(keyword in prompt_l for keyword in SENSITIVE_KEYWORDS):
-        _log_event("sensitive_info_detected", {"prompt": prompt})
-        return {"route": "malicious_request"}
 
+def speculative_stats() -> dict[str, Any]:
+    used = _speculative_stats["used"]
+    return {
+        **_speculative_stats,
+        "ttft_saved_seconds_avg": _speculative_stats["ttft_saved_seconds_total"] / used if used else 0.0,
+    }
+
+
+# clasificador local (route_model.py): si su confianza supera el umbral no se llama al LLM
+route_model = load_route_model()
+
+_router_stats: dict[str, Any] = {
+    "requests": 0,
+    "fast_path": 0,
+    "llm_fallback": 0,
+    "agree": 0,
+    "disagree": 0,
+    "shadow_checks": 0,
+    "fast_path_seconds_total": 0.0,
+    "llm_seconds_total": 0.0,
+}
+_shadow_tasks: set[asyncio.Task] = set()
+
+
+def router_stats() -> dict[str, Any]:
+    requests = _router_stats["requests"]
+    compared = _router_stats["agree"] + _router_stats["disagree"]
+    return {
+        "model_loaded": route_model is not None,
+        "model_path": ROUTE_MODEL_PATH,
+        "model_meta": route_model.meta if route_model is not None else None,
+        "threshold": ROUTE_MODEL_THRESHOLD,
+        "shadow_rate": ROUTE_MODEL_SHADOW_RATE,
+        **_router_stats,
+        "fast_path_rate": _router_stats["fast_path"] / requests if requests else 0.0,
+        # acuerdo modelo local vs LLM, medido en los fallbacks y en las comprobaciones en sombra
+        "agreement": _router_stats["agree"] / compared if compared else None,
+    }
+
+
+async def _llm_route(prompt: str, model_name: str | None) -> str:
     try: # llamada a  herramienta de routing
         cl = await classify_request_tool.ainvoke({
             "prompt": prompt,
@@ -65,17 +108,189 @@ async def classify_node(state: OrchestrationState) -> dict[str, Any]:
         cl = (cl or "").strip()
         if cl not in RUTAS:
             cl = "simple_request"
-        return {"route": cl}
+        return cl
     except Exception:
-        return {"route": "simple_request"}
+        return "simple_request"
 
 
-async def db_schema_node(state: OrchestrationState) -> dict[str, Any]:
-    db_path = "clients.db"
-    conn = sqlite3.connect(db_path)
+def _record_agreement(local_route: str, llm_route: str) -> None:
+    _router_stats["agree" if local_route == llm_route else "disagree"] += 1
+
+
+async def _shadow_check(prompt: str, model_name: str | None, local_route: str) -> None:
+    _router_stats["shadow_checks"] += 1
+    _record_agreement(local_route, await _llm_route(prompt, model_name))
+
+
+def _fast_path_route(prompt: str) -> tuple[str | None, bool]:
+    # (prediccion local o None, si supera el umbral)
+    _router_stats["requests"] += 1
+    if route_model is None:
+        return None, False
+    started = time.monotonic()
+    local_route, prob = route_model.predict(prompt)
+    _router_stats["fast_path_seconds_total"] += time.monotonic() - started
+    if prob < ROUTE_MODEL_THRESHOLD:
+        return local_route, False
+    _router_stats["fast_path"] += 1
+    return local_route, True
+
+
+def _maybe_shadow_check(prompt: str, model_name: str | None, local_route: str) -> None:
+    if ROUTE_MODEL_SHADOW_RATE > 0 and random.random() < ROUTE_MODEL_SHADOW_RATE:
+        task = asyncio.create_task(_shadow_check(prompt, model_name, local_route))
+        _shadow_tasks.add(task)
+        task.add_done_callback(_shadow_tasks.discard)
+
+
+async def _classify_route(prompt: str, model_name: str | None) -> tuple[str, str]:
+    # devuelve (ruta, origen)
+    local_route, confident = _fast_path_route(prompt)
+    if confident:
+        _maybe_shadow_check(prompt, model_name, local_route)
+        return local_route, "fast_path"
+    return await _classify_route_llm(prompt, model_name, local_route)
+
+
+async def _classify_route_llm(prompt: str, model_name: str | None, local_route: str | None) -> tuple[str, str]:
+    started = time.monotonic()
+    route = await _llm_route(prompt, model_name)
+    _router_stats["llm_seconds_total"] += time.monotonic() - started
+    _router_stats["llm_fallback"] += 1
+    if local_route is not None:
+        _record_agreement(local_route, route)
+    return route, "llm"
+
+
+# modo fusionado: una llamada estructurada devuelve ruta + SQL (opt-in, tambien por peticion)
+ORCHESTRATOR_FUSED = os.getenv("ORCHESTRATOR_FUSED", "false").lower() in {"1", "true", "yes"}
+
+_fused_stats: dict[str, Any] = {
+    "runs": 0,
+    "sql_returned": 0,
+    "missing_sql": 0,
+    "not_db": 0,
+    "invalid_output": 0,
+    "model_seconds_total": 0.0,
+}
+
+
+def fused_stats() -> dict[str, Any]:
+    runs = _fused_stats["runs"]
+    return {
+        **_fused_stats,
+        "model_seconds_avg": _fused_stats["model_seconds_total"] / runs if runs else 0.0,
+    }
+
+
+async def _fused_classify(state: OrchestrationState, model_name: str | None) -> dict[str, Any]:
+    prompt = state.get("prompt", "") or ""
+    local_route, confident = _fast_path_route(prompt)
+    if confident:
+        _maybe_shadow_check(prompt, model_name, local_route)
+        return {"route": local_route, "route_source": "fast_path"}
+
+    _fused_stats["runs"] += 1
+    # el esquema pasa por _clean_sql_info igual que en el nodo db_schema
+    update = await db_schema_node(state)
+    started = time.monotonic()
+    result = await classify_and_generate_sql_tool.ainvoke({
+        "prompt": prompt,
+        "db_schema": update["db_prompt"],
+        "conv": state.get("full_conv", []),
+    })
+    elapsed = time.monotonic() - started
+    _fused_stats["model_seconds_total"] += elapsed
+
+    if result is None:
+        # salida fuera de esquema: se vuelve al clasificador normal
+        _fused_stats["invalid_output"] += 1
+        route, source = await _classify_route_llm(prompt, model_name, local_route)
+        return {"route": route, "route_source": source, **update}
+
+    _router_stats["llm_fallback"] += 1
+    _router_stats["llm_seconds_total"] += elapsed
+    route = result["route"]
+    if local_route is not None:
+        _record_agreement(local_route, route)
+    if route != "needs_db_access":
+        _fused_stats["not_db"] += 1
+        return {"route": route, "route_source": "llm"}
+    if not result["sql"]:
+        # sql_query lo generara el nodo normal
+        _fused_stats["missing_sql"] += 1
+        return {"route": route, "route_source": "llm", **update}
+    _fused_stats["sql_returned"] += 1
+    return {"route": route, "route_source": "llm", **update, "sql_query": result["sql"], "sql_cache_hit": False}
+
+
+async def _speculate_sql(state: OrchestrationState) -> dict[str, Any]:
+    # solo esquema y generacion; el SQL nunca se ejecuta antes de confirmar la ruta
+    started = time.monotonic()
+    update = await db_schema_node(state)
+    update.update(await generate_sql_node({**state, **update}))
+    update["_elapsed"] = time.monotonic() - started
+    return update
+
+
+async def classify_node(state: OrchestrationState) -> dict[str, Any]:
+    prompt = state.get("prompt", "") or ""
+    prompt_l = prompt.lower()
+    payload = state.get("payload", {}) or {}
+    model_name = payload.get("classification_model") or payload.get("model")
+
+    if any(keyword in prompt_l for keyword in SENSITIVE_KEYWORDS):
+        await alog_event("sensitive_info_detected", {"prompt": prompt})
+        return {"route": "malicious_request", "route_source": "keyword"}
+
+    if payload.get("fused", ORCHESTRATOR_FUSED):
+        return await _fused_classify(state, model_name)
+
+    if not payload.get("speculative", ORCHESTRATOR_SPECULATIVE):
+        route, source = await _classify_route(prompt, model_name)
+        return {"route": route, "route_source": source}
+
+    _speculative_stats["runs"] += 1
+    spec_task = asyncio.create_task(_speculate_sql(state))
+    started = time.monotonic()
+    try:
+        route, source = await _classify_route(prompt, model_name)
+    except BaseException:
+        spec_task.cancel()
+        raise
+    classify_elapsed = time.monotonic() - started
+
+    if route != "needs_db_access":
+        if spec_task.done():
+            _speculative_stats["discarded"] += 1
+            if not spec_task.cancelled() and spec_task.exception() is None:
+                result = spec_task.result()
+                if not result.get("sql_cache_hit"):
+                    _speculative_stats["wasted_sql_generations"] += 1
+                _speculative_stats["wasted_model_seconds"] += result["_elapsed"]
+        else:
+            spec_task.cancel() # aborta la peticion en curso a ollama
+            _speculative_stats["cancelled"] += 1
+            _speculative_stats["wasted_model_seconds"] += classify_elapsed
+        return {"route": route, "route_source": source}
+
+    try:
+        spec = await spec_task
+    except Exception:
+        # los nodos db_schema / sql_query haran el trabajo de forma normal
+        _speculative_stats["failed"] += 1
+        return {"route": route, "route_source": source}
+
+    _speculative_stats["used"] += 1
+    _speculative_stats["ttft_saved_seconds_total"] += min(classify_elapsed, spec.pop("_elapsed"))
+    return {"route": route, "route_source": source, **spec}
+
+
+def _build_db_prompt(conn: sqlite3.Connection) -> str:
     cursor = conn.cursor()
     db_prompt = ""
-    initial_query = "SELECT name FROM sqlite_master WHERE type='table';"
+    # sin tablas internas (sqlite_stat1 aparece tras ANALYZE y cambiaria el hash del esquema)
+    initial_query = "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';"
     cursor.execute(initial_query)
     tables = cursor.fetchall()
 
@@ -90,11 +305,73 @@ async def db_schema_node(state: OrchestrationState) -> dict[str, Any]:
         t_info = f"Table {t_name} ({col_string})"
         context = f"Database Schema:\n{t_info}\n"
         db_prompt += "\n" + context
-    conn.close()
+    return db_prompt
+
+
+# el esquema casi nunca cambia: se reconstruye solo si cambia PRAGMA schema_version
+SCHEMA_CHECK_INTERVAL = float(os.getenv("SCHEMA_CHECK_INTERVAL", "1.0"))
+
+_schema_cache: dict[str, Any] = {
+    "version": None,
+    "db_prompt": "",
+    "checked_at": 0.0,
+    "built_at": None,
+    "hits": 0,
+    "rebuilds": 0,
+    "version_checks": 0,
+}
+
+
+def _cached_db_prompt(conn: sqlite3.Connection) -> str:
+    version = conn.execute("PRAGMA schema_version").fetchone()[0]
+    _schema_cache["version_checks"] += 1
+    if version != _schema_cache["version"]:
+        _schema_cache["db_prompt"] = _build_db_prompt(conn)
+        _schema_cache["version"] = version
+        _schema_cache["built_at"] = time.time()
+        _schema_cache["rebuilds"] += 1
+    _schema_cache["checked_at"] = time.monotonic()
+    return _schema_cache["db_prompt"]
+
+
+def schema_cache_stats() -> dict[str, Any]:
+    return {k: v for k, v in _schema_cache.items() if k != "db_prompt"}
+
+
+async def db_schema_node(state: OrchestrationState) -> dict[str, Any]:
+    if state.get("db_prompt"): # ya obtenido en la fase de clasificacion
+        return {"db_prompt": state["db_prompt"]}
+
+    # dentro del intervalo ni siquiera se consulta la version
+    if (
+        _schema_cache["version"] is not None
+        and time.monotonic() - _schema_cache["checked_at"] < SCHEMA_CHECK_INTERVAL
+    ):
+        _schema_cache["hits"] += 1
+        return {"db_prompt": _schema_cache["db_prompt"]}
+
+    db_prompt = await sql_executor.run(_cached_db_prompt, key="db_schema")
     return {"db_prompt": db_prompt}
 
+def _question_cache_eligible(state: OrchestrationState) -> bool:
+    if not SQL_QUESTION_CACHE_FIRST_TURN_ONLY:
+        return True
+    return sum(1 for m in state.get("full_conv", []) if m.get("role") == "user") <= 1
+
+
 # usar macro
 async def generate_sql_node(state: OrchestrationState) -> dict[str, Any]:
+    if state.get("sql_query"): # generado de forma especulativa
+        return {"sql_query": state["sql_query"], "sql_cache_hit": state.get("sql_cache_hit", False)}
+
+    if _question_cache_eligible(state):
+        cached_sql = question_cache.lookup(
+            state.get("prompt", ""), schema_hash(state.get("db_prompt", ""))
+        )
+        if cached_sql:
+            # pregunta equivalente ya resuelta: no se llama al modelo
+            return {"sql_query": cached_sql, "sql_cache_hit": True}
+
     try:
         full_conv = state.get("full_conv", [])
         if len(full_conv) > 6:
@@ -106,27 +383,96 @@ async def generate_sql_node(state: OrchestrationState) -> dict[str, Any]:
         })
     except Exception:
         sql_query = ""
-    return {"sql_query": sql_query}
+    return {"sql_query": sql_query, "sql_cache_hit": False}
 
 
-async def exec_sql_node(state: OrchestrationState) -> dict[str, Any]:
-    db_path = "clients.db"
-    conn = sqlite3.connect(db_path)
+def _exec_generated_sql(conn: sqlite3.Connection, sql_query: str) -> str:
     cursor = conn.cursor()
-    sql_query = state.get("sql_query", "")
-
     try:
         cursor.execute(sql_query)
-        results = cursor.fetchall()
-        result_str = f"{results}"
-    except Exception as e:
-        result_str = f"SQL Execution Error: {str(e)}"
+        # tabla compacta con tope de filas/bytes en vez del repr de fetchall()
+        return encode_results(cursor)
     finally:
-        conn.commit()
-        conn.close()
+        conn.commit() # con SQL_READ_ONLY (por defecto) sql_guard ya ha descartado las escrituras
+
+
+async def _log_guard_decision(state: OrchestrationState, sql_query: str, decision: dict[str, Any]) -> None:
+    await alog_event("sql_guard", {
+        "session_id": state.get("session_id"),
+        "sql": sql_query,
+        "action": decision["action"],
+        "cost": decision["cost"],
+        "findings": decision["findings"],
+        "plan": decision["plan"],
+        "executed_sql": decision["sql"] if decision["action"] == "limit" else None,
+        "timeout": decision["timeout"],
+    })
+
+
+async def _guard_sql(state: OrchestrationState, sql_query: str) -> dict[str, Any]:
+    # EXPLAIN QUERY PLAN antes de ejecutar: descarta escrituras y consultas demasiado caras
+    # (o las limita); cada decision queda en el log con su plan
+    try:
+        decision = await sql_executor.run(analyze_sql, sql_query)
+    except QueryRejected as e:
+        await _log_guard_decision(state, sql_query, e.decision)
+        raise
+    await _log_guard_decision(state, sql_query, decision)
+    return decision
+
+
+async def _open_result_cursor(state: OrchestrationState, sql_query: str) -> dict[str, Any]:
+    # modo paginado: la consulta se ejecuta una vez sobre un cursor que queda abierto;
+    # el prompt final lleva las primeras filas y el cliente recibe el resto por paginas
+    # (una fila de mas para saber si quedan filas sin leer el resto)
+    decision = await _guard_sql(state, sql_query)
+    rc = await result_cursors.open(
+        decision["sql"], state.get("session_id"), prefetch=SQL_RESULT_MAX_ROWS + 1, timeout=decision["timeout"]
+    )
+    rows = rc.buffer[:SQL_RESULT_MAX_ROWS]
+    more = not rc.done or len(rc.buffer) > len(rows)
+    return {
+        "query_results": encode_rows(rc.columns, rows, more),
+        "result_cursor": {"cursor_id": rc.id, "columns": rc.columns},
+    }
+
+
+async def _exec_cached(state: OrchestrationState, sql_query: str) -> dict[str, Any]:
+    # cache por SQL normalizado; invalida si cambia data_version o hay escrituras
+    data_version = await sql_executor.data_version()
+    result_str = query_cache.get(sql_query, data_version)
+    if result_str is None:
+        decision = await _guard_sql(state, sql_query)
+        # en un hilo del pool: una consulta lenta no congela el event loop
+        result_str = await sql_executor.run(
+            _exec_generated_sql, decision["sql"],
+            timeout=decision["timeout"], key=("sql", normalize_sql(decision["sql"])),
+        )
+        if sql_executor.write_generation == data_version[1]: # no se cachean escrituras
+            query_cache.put(sql_query, data_version, result_str)
     return {"query_results": result_str}
 
 
+async def exec_sql_node(state: OrchestrationState) -> dict[str, Any]:
+    sql_query = state.get("sql_query", "")
+
+    try:
+        # con varios workers no hay paginado: se responde con el evento query_results de siempre
+        if SQL_PAGING_AVAILABLE and state.get("payload", {}).get("stream_rows", SQL_STREAM_ROWS):
+            update = await _open_result_cursor(state, sql_query)
+        else:
+            update = await _exec_cached(state, sql_query)
+    except Exception as e:
+        return {"query_results": f"SQL Execution Error: {str(e)}"}
+
+    # solo se admite en la cache de preguntas el SQL que se ejecuto sin error
+    if not state.get("sql_cache_hit") and _question_cache_eligible(state):
+        await question_cache.admit(
+            state.get("prompt", ""), schema_hash(state.get("db_prompt", "")), sql_query
+        )
+    return update
+
+
 async def finalize_node(state: OrchestrationState) -> dict[str, Any]:
     payload = dict(state.get("payload", {}))
 
@@ -1,21 +1,55 @@
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse, Response
+from fastapi.responses import StreamingResponse, Response, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import aclosing, asynccontextmanager
 from dotenv import load_dotenv
+import anyio
+import asyncio
 import uuid
 import os
 
 import json
 import time
+from typing import Any
 
 load_dotenv()
 
-from llm_funct import stream_from_ollama, get_ollama_runtime_status
-from orch_graph import graph
+from llm_funct import stream_from_ollama, get_ollama_runtime_status, ollama_clients, ollama_backends, model_keeper, llm_scheduler, llm_single_flight, DEFAULT_MODEL
+from orch_graph import graph, schema_cache_stats, speculative_stats, router_stats, fused_stats
 from prompts import STREAM_SENSITIVE_TERMS, MALICIOUS_SHORT_RESPONSE_DEFAULT
+from session_store import create_session_store, SESSION_BACKEND
+from log_writer import log_writer, alog_event
+from stream_guard import SensitiveTermMatcher
+from sql_exec import sql_executor, db_maintenance
+from query_cache import query_cache
+from question_cache import question_cache
+from result_format import result_stats
+from sql_guard import guard_stats
+from result_cursors import (
+    result_cursors, CursorNotFound, ORCHESTRATOR_WORKERS, SQL_PAGE_SIZE, SQL_STREAM_INLINE_PAGES, SQL_STREAM_ROWS,
+)
+from admission import admission, AdmissionRejected, Ticket
 from langchain_core.runnables.graph import CurveStyle, NodeStyles, MermaidDrawMethod
 
-app = FastAPI(debug=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    log_writer.start()
+    await asyncio.to_thread(question_cache.load)
+    await ollama_backends.start()
+    await model_keeper.start() # precarga + calentamiento antes de aceptar peticiones
+    await db_maintenance.start()
+    yield
+    await db_maintenance.stop()
+    await model_keeper.stop()
+    await ollama_backends.stop()
+    result_cursors.close_all()
+    await sql_executor.close()
+    await ollama_clients.aclose()
+    await log_writer.stop() # vaciar logs pendientes
+
+
+app = FastAPI(debug=True, lifespan=lifespan)
 
 ORCHESTRATOR_ALLOW_ORIGINS = os.getenv("ORCHESTRATOR_ALLOW_ORIGINS", "*")
 
@@ -34,49 +68,140 @@ def emit(event_type: str, payload: dict):
         **payload,
     }) + "\n"
 
-conv_store: dict[str, list[dict]] = {}
-
 MAX_MESSAGES = 6
+
+# solo se guarda la ventana que se usa (MAX_MESSAGES) por sesion
+# SESSION_BACKEND=sqlite permite compartir las sesiones entre varios workers
+conv_store = create_session_store(max_messages=MAX_MESSAGES)
 MALICIOUS_SHORT_RESPONSE = os.getenv("MALICIOUS_SHORT_RESPONSE", MALICIOUS_SHORT_RESPONSE_DEFAULT)
 
 
-def _stream_contains_sensitive(buffer: str) -> bool:
-    buf_l = buffer.lower()
-    return any(term in buf_l for term in STREAM_SENSITIVE_TERMS)
+# automata construido una vez; cada stream lleva su propio estado
+STREAM_MATCHER = SensitiveTermMatcher(STREAM_SENSITIVE_TERMS)
 
+# agrupado de tokens (opt-in por payload: "coalesce": true o {"max_latency_ms", "max_bytes"})
+STREAM_COALESCE_MAX_LATENCY_MS = float(os.getenv("STREAM_COALESCE_MAX_LATENCY_MS", "50"))
+STREAM_COALESCE_MAX_BYTES = int(os.getenv("STREAM_COALESCE_MAX_BYTES", "1024"))
 
-def _log_event(log_type: str, payload: dict):
-    lg_dir = "logs"
-    os.makedirs(lg_dir, exist_ok=True)
-    path = os.path.join(lg_dir, "logs.jsonl")
 
-    record = {
-        "type": log_type,
-        "timestamp": time.time(),
-        **payload,
-    }
-
-    with open(path, "a", encoding="utf-8") as fh:
-        fh.write(json.dumps(record, ensure_ascii=False) + "\n")
+def _coalesce_options(payload: dict) -> tuple[float, int] | None:
+    opts = payload.get("coalesce")
+    if not opts:
+        return None
+    if not isinstance(opts, dict):
+        opts = {}
+    try:
+        max_latency_ms = float(opts.get("max_latency_ms", STREAM_COALESCE_MAX_LATENCY_MS))
+        max_bytes = int(opts.get("max_bytes", STREAM_COALESCE_MAX_BYTES))
+    except (TypeError, ValueError):
+        max_latency_ms, max_bytes = STREAM_COALESCE_MAX_LATENCY_MS, STREAM_COALESCE_MAX_BYTES
+    return max(0.0, max_latency_ms) / 1000, max(1, max_bytes)
+
+
+def emit_delta(text: str, coalesce: tuple[float, int] | None) -> str:
+    if coalesce:
+        # frame agrupado: delta codificado una sola vez
+        return emit("model_chunk", {"delta": text})
+    return emit("model_token", {
+        "delta": json.dumps({"delta": text})
+    })
 
 
+async def _token_frames(tokens, coalesce: tuple[float, int] | None):
+    it = tokens.__aiter__()
+    pending = None
+    try:
+        # sin agrupado: un frame por token (formato original)
+        if not coalesce:
+            async for token in it:
+                yield [token]
+            return
+
+        max_latency, max_bytes = coalesce
+        batch: list[str] = []
+        size = 0
+        deadline = 0.0
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(it.__anext__())
+            timeout = max(0.0, deadline - time.monotonic()) if batch else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                # el modelo tarda: se envia lo acumulado sin esperar al siguiente token
+                yield batch
+                batch, size = [], 0
+                continue
+            fut, pending = pending, None
+            try:
+                token = fut.result()
+            except StopAsyncIteration:
+                break
+            if not batch:
+                deadline = time.monotonic() + max_latency
+            batch.append(token)
+            size += len(token.encode("utf-8"))
+            if size >= max_bytes or time.monotonic() >= deadline:
+                yield batch
+                batch, size = [], 0
+        if batch:
+            yield batch
+    finally:
+        if pending is not None:
+            pending.cancel()
+            try:
+                await pending
+            except BaseException:
+                pass
+        aclose = getattr(it, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
+async def _stream_result_pages(cursor_info: dict):
+    # columnas primero, despues paginas de filas; si quedan filas tras las paginas en linea
+    # el cliente sigue con GET /results/{cursor_id} sin volver a ejecutar la consulta
+    cursor_id = cursor_info["cursor_id"]
+    yield emit("query_columns", {"cursor_id": cursor_id, "columns": cursor_info["columns"]})
+    page = {"done": False, "row_count": 0}
+    try:
+        for _ in range(max(1, SQL_STREAM_INLINE_PAGES)):
+            page = await result_cursors.page(cursor_id, SQL_PAGE_SIZE)
+            yield emit("query_rows", page)
+            if page["done"]:
+                break
+        if not page["done"]:
+            # el resto, si cabe, pasa a memoria y la conexion del cursor se cierra ya
+            await result_cursors.drain(cursor_id)
+    except Exception as e:
+        result_cursors.close(cursor_id)
+        yield emit("query_rows_error", {"cursor_id": cursor_id, "error": str(e)})
+        return
+    yield emit("query_rows_end", {
+        "cursor_id": cursor_id,
+        "row_count": page["row_count"],
+        "done": page["done"],
+    })
 
 
-async def orchestrated_stream(payload):
+async def orchestrated_stream(payload, progress: dict | None = None):
+    # progress: estado compartido con _cancel_on_disconnect (sesion, fase y tokens emitidos)
+    progress = progress if progress is not None else {}
+    progress.update(stage="graph", tokens=0)
 
     prompt = payload.get("prompt", "")
     session_id = payload.get("session_id", str(uuid.uuid4()))
     if session_id == "":
         session_id = str(uuid.uuid4())
+    progress["session_id"] = session_id
     if not payload.get("session_id"):
         yield emit("session_id", {"session_id": session_id})
 
-    conv_store.setdefault(session_id, []).append({
+    await conv_store.aappend(session_id, {
         "role": "user",
         "content": prompt,
     })
 
-    reduced_conv = conv_store.get(session_id, [])[-MAX_MESSAGES:]
+    reduced_conv = await conv_store.awindow(session_id, MAX_MESSAGES)
 
     graph_state = {
         "payload": payload,
@@ -86,43 +211,53 @@ async def orchestrated_stream(payload):
     }
     current_route = "simple_request"
 
-    async for update in graph.astream(graph_state, stream_mode="updates"):
-        if "classification" in update:
-            cl = update["classification"].get("route")
-            current_route = cl or current_route
-            yield emit("classification", {"value": cl})
-            _log_event("classification", {
-                "session_id": session_id,
-                "route": cl,
-                "prompt": prompt,
-            })
+    async with aclosing(graph.astream(graph_state, stream_mode="updates")) as updates:
+        async for update in updates:
+            if "classification" in update:
+                cl = update["classification"].get("route")
+                current_route = cl or current_route
+                yield emit("classification", {"value": cl})
+                await alog_event("classification", {
+                    "session_id": session_id,
+                    "route": cl,
+                    # route_model.py solo entrena con las etiquetas que vienen del LLM
+                    "source": update["classification"].get("route_source", "llm"),
+                    "prompt": prompt,
+                })
 
-        if "db_schema" in update:
-            yield emit("status", {"message": "generando sql"})
+            if "db_schema" in update:
+                yield emit("status", {"message": "generando sql"})
 
-        if "sql_query" in update:
-            sql_query = update["sql_query"].get("sql_query", "")
-            yield emit("sql_query", {"query": sql_query})
+            if "sql_query" in update:
+                sql_query = update["sql_query"].get("sql_query", "")
+                yield emit("sql_query", {"query": sql_query})
 
-        if "query_results" in update:
-            yield emit("status", {"message": "ejecutando sql"})
-            result_str = update["query_results"].get("query_results", "")
-            yield emit("query_results", {"results": result_str})
+            if "query_results" in update:
+                yield emit("status", {"message": "ejecutando sql"})
+                cursor_info = update["query_results"].get("result_cursor")
+                if cursor_info:
+                    async for event in _stream_result_pages(cursor_info):
+                        yield event
+                else:
+                    result_str = update["query_results"].get("query_results", "")
+                    yield emit("query_results", {"results": result_str})
 
-        if "finalize" in update:
-            payload = update["finalize"].get("payload", payload)
+            if "finalize" in update:
+                payload = update["finalize"].get("payload", payload)
 
-        if "error_node" in update:
-            payload = update["error_node"].get("payload", payload)
+            if "error_node" in update:
+                payload = update["error_node"].get("payload", payload)
 
     yield emit("status", {"message": "generando respuesta"})
+    progress["stage"] = "generation"
+
+    coalesce = _coalesce_options(payload)
 
     if current_route == "malicious_request":
+        progress["stage"] = "canned"
         response_text = MALICIOUS_SHORT_RESPONSE
-        yield emit("model_token", {
-            "delta": json.dumps({"delta": response_text})
-        })
-        conv_store.setdefault(session_id, []).append({
+        yield emit_delta(response_text, coalesce)
+        await conv_store.aappend(session_id, {
             "role": "assistant",
             "content": response_text,
         })
@@ -131,58 +266,234 @@ async def orchestrated_stream(payload):
 
 
     response_text = ""
-    stream_buffer = ""
+    scanner = STREAM_MATCHER.scanner()
+    frames = _token_frames(stream_from_ollama(payload, reduced_conv), coalesce)
     try:
-        async for token in stream_from_ollama(payload, reduced_conv):
-            response_text += token
-            stream_buffer = (stream_buffer + token)[-500:]
-            if _stream_contains_sensitive(stream_buffer):
-                _log_event("stream_cut", {
+        async for frame in frames:
+            progress["tokens"] += len(frame)
+            cut = False
+            safe_text = ""
+            for token in frame:
+                response_text += token
+                if scanner.feed(token):
+                    cut = True
+                    break
+                safe_text += token
+            if safe_text:
+                yield emit_delta(safe_text, coalesce)
+            if cut:
+                await alog_event("stream_cut", {
                     "session_id": session_id,
                     "reason": "sensitive_term_match",
                 })
                 response_text += "\n[Respuesta bloqueada por seguridad]\n"
-                yield emit("model_token", {
-                    "delta": json.dumps({"delta": "\n[Respuesta bloqueada por seguridad]\n"})
-                })
+                yield emit_delta("\n[Respuesta bloqueada por seguridad]\n", coalesce)
                 break
-            yield emit("model_token", {
-                "delta": json.dumps({"delta": token})
-            })
     except Exception:
         err = "\n[Error al contactar el modelo]\n"
         response_text += err
-        yield emit("model_token", {
-            "delta": json.dumps({"delta": err})
-        })
+        yield emit_delta(err, coalesce)
+    finally:
+        await frames.aclose()
 
-    conv_store.setdefault(session_id, []).append({
+    await conv_store.aappend(session_id, {
         "role": "assistant",
         "content": response_text,
     })
+    _record_completed_stream(progress["tokens"])
 
     yield emit("final", {})
 
 
+# respuestas abandonadas por el cliente; el ahorro de tokens es una estimacion basada
+# en la longitud media de las respuestas completas (STREAM_EXPECTED_TOKENS sin historico)
+STREAM_EXPECTED_TOKENS = int(os.getenv("STREAM_EXPECTED_TOKENS", "256"))
+
+_stream_stats: dict[str, Any] = {
+    "completed": 0,
+    "cancelled": 0,
+    "cancelled_in_graph": 0,
+    "cancelled_in_generation": 0,
+    "tokens_completed_avg": 0.0,
+    "tokens_saved_estimate": 0,
+}
+
+
+def _record_completed_stream(tokens: int) -> None:
+    n = _stream_stats["completed"] = _stream_stats["completed"] + 1
+    _stream_stats["tokens_completed_avg"] += (tokens - _stream_stats["tokens_completed_avg"]) / n
+
+
+async def _cancel_on_disconnect(stream, progress: dict):
+    # la desconexion la detecta starlette (listen_for_disconnect es el unico que lee
+    # receive) y cancela este cuerpo; cada paso del stream va en su propia tarea, asi que
+    # al cancelarla la CancelledError llega al nodo del grafo o a la generacion en curso
+    # (y con ello a la peticion HTTP a ollama) en vez de esperar a que el modelo termine
+    started = time.monotonic()
+    pending = None
+    finished = False
+    try:
+        while True:
+            pending = asyncio.ensure_future(stream.__anext__())
+            await asyncio.wait({pending})
+            fut, pending = pending, None
+            try:
+                chunk = fut.result()
+            except StopAsyncIteration:
+                finished = True
+                return
+            yield chunk
+    finally:
+        if not finished:
+            # el scope de starlette ya esta cancelado: sin proteger, cada await de la
+            # limpieza se volveria a cancelar y la cadena de generadores quedaria a medias
+            with anyio.CancelScope(shield=True):
+                if pending is not None:
+                    pending.cancel()
+                    await asyncio.wait({pending})
+                await stream.aclose()
+
+                stage = progress.get("stage", "graph")
+                tokens = progress.get("tokens", 0)
+                saved = 0
+                if stage in ("graph", "generation"):
+                    expected = _stream_stats["tokens_completed_avg"] if _stream_stats["completed"] else STREAM_EXPECTED_TOKENS
+                    saved = max(0, round(expected - tokens))
+                _stream_stats["cancelled"] += 1
+                if stage in ("graph", "generation"):
+                    _stream_stats[f"cancelled_in_{stage}"] += 1
+                _stream_stats["tokens_saved_estimate"] += saved
+                await alog_event("stream_cancelled", {
+                    # el que resuelve orchestrated_stream: las sesiones nuevas no lo traen en el payload
+                    "session_id": progress.get("session_id"),
+                    "stage": stage,
+                    "tokens_streamed": tokens,
+                    "tokens_saved_estimate": saved,
+                    "elapsed_seconds": time.monotonic() - started,
+                })
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    # devuelve el slot de admision al terminar la respuesta, tambien si el cliente
+    # se desconecta antes de empezar a consumir el stream
+
+    def __init__(self, *args, ticket: Ticket, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ticket = ticket
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # con ASGI >= 2.4 la desconexion llega como OSError en send y starlette no
+            # cierra el cuerpo; se cierra aqui para cortar la generacion igualmente
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+            self.ticket.release()
+
+
 @app.post("/orchestrate")
 async def orchestrate(request: Request):
     payload = await request.json()
 
-    return StreamingResponse(
-        orchestrated_stream(payload),
-        media_type="text/event-stream"
+    model = payload.get("generation_model") or payload.get("model") or DEFAULT_MODEL
+    priority = admission.priority_of(payload.get("priority"))
+    try:
+        ticket = await admission.acquire(model, priority)
+    except AdmissionRejected as e:
+        await alog_event("admission_rejected", {"model": model, "priority": priority, "reason": e.reason})
+        return JSONResponse(
+            {"error": "Demasiadas peticiones en cola, reintenta más tarde.", "reason": e.reason, "retry_after": e.retry_after},
+            status_code=429,
+            headers={"Retry-After": str(int(e.retry_after))},
+        )
+
+    progress: dict[str, Any] = {}
+    return AdmittedStreamingResponse(
+        _cancel_on_disconnect(orchestrated_stream(payload, progress), progress),
+        media_type="text/event-stream",
+        ticket=ticket,
     )
 
+@app.get("/results/{cursor_id}")
+async def get_result_page(cursor_id: str, size: int = SQL_PAGE_SIZE):
+    try:
+        page = await result_cursors.page(cursor_id, size)
+    except CursorNotFound:
+        # tambien si la peticion llega a un worker distinto del que abrio el cursor
+        return JSONResponse({"error": "Cursor inexistente, caducado o abierto en otro proceso.", "cursor_id": cursor_id},
+                            status_code=404)
+    except Exception as e:
+        result_cursors.close(cursor_id)
+        return JSONResponse({"error": str(e), "cursor_id": cursor_id}, status_code=500)
+    return page
+
+
+@app.delete("/results/{cursor_id}")
+async def close_result_cursor(cursor_id: str):
+    return {"cursor_id": cursor_id, "closed": result_cursors.close(cursor_id)}
+
 #get all convs
 
 @app.get("/_debug/convs")
 async def get_convs():
-    return conv_store
+    return await conv_store.asnapshot()
+
+
+@app.get("/_debug/convs/stats")
+async def get_convs_stats():
+    return await conv_store.astats()
+
+
+@app.get("/_debug/logs")
+async def get_logs_status():
+    return log_writer.stats()
+
+
+@app.get("/_debug/sql")
+async def get_sql_status():
+    return {
+        "executor": sql_executor.stats(),
+        "storage": db_maintenance.stats(),
+        "schema_cache": schema_cache_stats(),
+        "query_cache": query_cache.stats(),
+        "question_cache": question_cache.stats(),
+        "results": result_stats(),
+        "cursors": result_cursors.stats(),
+        "guard": guard_stats(),
+    }
+
+
+@app.get("/_debug/speculative")
+async def get_speculative_status():
+    return speculative_stats()
+
+
+@app.get("/_debug/streams")
+async def get_streams_status():
+    return _stream_stats
+
+
+@app.get("/_debug/admission")
+async def get_admission_status():
+    return admission.stats()
+
+
+@app.get("/_debug/router")
+async def get_router_status():
+    return {**router_stats(), "fused": fused_stats()}
 
 
 @app.get("/_debug/ollama")
 async def get_ollama_status():
-    return await get_ollama_runtime_status()
+    return {
+        **await get_ollama_runtime_status(),
+        "backends": ollama_backends.stats(),
+        "residency": await model_keeper.status(),
+        "scheduler": llm_scheduler.stats(),
+        "single_flight": llm_single_flight.stats(),
+        "clients": ollama_clients.stats(),
+    }
 
 
 @app.get("/_debug/graph")
@@ -207,10 +518,19 @@ async def get_orchestration_graph_png():
 
 @app.get("/_debug/convs/clear")
 async def clear_convs():
-    conv_store.clear()
+    await conv_store.aclear()
     return {"status": "convs cleared"}
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=9000)
+
+    workers = ORCHESTRATOR_WORKERS
+    if workers > 1:
+        if SESSION_BACKEND == "memory":
+            print("Aviso: con varios workers usa SESSION_BACKEND=sqlite o se perdera el historial entre turnos.")
+        if SQL_STREAM_ROWS:
+            print("Aviso: con varios workers el modo paginado (SQL_STREAM_ROWS) se desactiva; los resultados van en query_results.")
+        uvicorn.run("orchestrator:app", host="0.0.0.0", port=9000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=9000)
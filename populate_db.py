@@ -1,9 +1,19 @@
-import sqlite3
+import argparse
+import multiprocessing
+import os
 import random
+import sqlite3
+import time
+import zlib
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any
+
 from faker import Faker
-from datetime import datetime, timedelta
 
-fake = Faker()
+from db_profile import connect, optimize
 
 COUNTRY_PROFILES = [
     {"country": "United States", "locale": "en_US", "state_provider": "state"},
@@ -28,12 +38,107 @@ COUNTRY_WEIGHTS = [
     18, 6, 8, 6, 6, 6, 6, 5, 4, 4, 5, 4, 5, 4, 6, 3
 ]
 
-conn = sqlite3.connect("clients.db")
-cursor = conn.cursor()
+# filas por tabla con --scale 1 (los tamanos originales del script)
+BASE_USERS = 5
+BASE_CLIENTS = 20
+BASE_INTERACTIONS = 100
+BASE_AUDIT_LOGS = 100
+
+_MASK = (1 << 64) - 1
+
+INSERTS = {
+    "users": "INSERT INTO users (id, username, full_name, email, role, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+    "clients": """
+        INSERT INTO clients (id, company_name, status, industry, website, notes, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "addresses": """
+        INSERT INTO addresses (client_id, type, street, city, state, postal_code, country)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """,
+    "client_pii": """
+        INSERT INTO client_pii (
+            client_id, national_id, tax_id, bank_iban, credit_card_number,
+            credit_card_last4, date_of_birth, created_at, updated_at
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "contacts": """
+        INSERT INTO contacts (client_id, first_name, last_name, email, phone, position, is_primary)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """,
+    "projects": """
+        INSERT INTO projects (id, client_id, name, description, status, start_date, end_date, budget)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "invoices": """
+        INSERT INTO invoices (id, client_id, project_id, invoice_number, amount, status, issue_date, due_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+    "payments": """
+        INSERT INTO payments (invoice_id, amount, payment_method, payment_date, reference)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    "interactions": """
+        INSERT INTO interactions (client_id, user_id, type, summary, interaction_date)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+    "audit_logs": """
+        INSERT INTO audit_logs (user_id, entity, entity_id, action, old_value, new_value, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    """,
+}
+
+# una instancia de Faker por locale y proceso: construirla es lo caro
+_fakers: dict[str, Faker] = {}
+_chunk_seed = 0
+
+
+def _faker(locale: str = "en_US") -> Faker:
+    fake = _fakers.get(locale)
+    if fake is None:
+        try:
+            fake = Faker(locale)
+        except AttributeError:
+            fake = Faker("en_US")
+        fake.seed_instance(_mix(_chunk_seed, zlib.crc32(locale.encode())))
+        _fakers[locale] = fake
+    return fake
+
+
+def _mix(seed: int, n: int) -> int:
+    # splitmix64: hash entero barato y determinista (no depende de PYTHONHASHSEED)
+    x = (seed * 0x9E3779B97F4A7C15 + n) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+def projects_for_client(seed: int, client_id: int) -> int:
+    # el proceso principal lo calcula de antemano para repartir ids de proyecto/factura
+    return 1 + _mix(seed, client_id) % 3
 
 
-def random_date(start_days_ago=365):
-    return fake.date_between(start_date=f"-{start_days_ago}d", end_date="today")
+def _seed_chunk(seed: int, table: str, index: int) -> random.Random:
+    # semilla por bloque: el mismo bloque da las mismas filas en cualquier proceso
+    global _chunk_seed
+    _chunk_seed = _mix(seed, _mix(zlib.crc32(table.encode()), index))
+    for locale, fake in _fakers.items():
+        fake.seed_instance(_mix(_chunk_seed, zlib.crc32(locale.encode())))
+    return random.Random(_chunk_seed)
+
+
+# las fechas se cuentan hacia atras desde reference_date (--reference-date, hoy por defecto),
+# asi las preguntas relativas ("este mes", "ultimos 30 dias") encuentran datos
+
+def random_date(rng: random.Random, reference_date: date, start_days_ago=365):
+    return reference_date - timedelta(days=rng.randint(0, start_days_ago))
+
+
+def random_datetime(rng: random.Random, reference_date: date, start_days_ago=365):
+    # la actividad se reparte en el ultimo ano en vez de llevar todas la hora de la carga
+    start = datetime.combine(reference_date, datetime.min.time())
+    return start - timedelta(seconds=rng.randint(0, start_days_ago * 86400))
 
 
 def _safe_provider(fake_instance, provider_name, fallback):
@@ -48,12 +153,9 @@ def _safe_provider(fake_instance, provider_name, fallback):
     return fallback() if callable(fallback) else fallback
 
 
-def generate_address():
-    profile = random.choices(COUNTRY_PROFILES, weights=COUNTRY_WEIGHTS, k=1)[0]
-    try:
-        locale_fake = Faker(profile["locale"])
-    except AttributeError:
-        locale_fake = Faker("en_US")
+def generate_address(rng: random.Random):
+    profile = rng.choices(COUNTRY_PROFILES, weights=COUNTRY_WEIGHTS, k=1)[0]
+    locale_fake = _faker(profile["locale"])
     street = locale_fake.street_address()
     city = locale_fake.city()
     state = _safe_provider(locale_fake, profile.get("state_provider", "state"), locale_fake.city)
@@ -67,7 +169,7 @@ def generate_address():
     }
 
 
-def generate_sensitive_info():
+def generate_sensitive_info(fake: Faker):
     national_id = _safe_provider(fake, "ssn", fake.uuid4)
     tax_id = _safe_provider(fake, "ein", fake.uuid4)
     bank_iban = _safe_provider(fake, "iban", fake.bban)
@@ -83,171 +185,352 @@ def generate_sensitive_info():
         "date_of_birth": date_of_birth
     }
 
-#users
-user_ids = []
-for _ in range(5):
-    cursor.execute("""
-        INSERT INTO users (username, full_name, email, role)
-        VALUES (?, ?, ?, ?)
-    """, (
-        fake.user_name(),
-        fake.name(),
-        fake.email(),
-        random.choice(["admin", "staff", "viewer"])
-    ))
-    user_ids.append(cursor.lastrowid)
-
-#clients
-client_ids = []
-for _ in range(20):
-    cursor.execute("""
-        INSERT INTO clients (company_name, status, industry, website, notes, updated_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (
-        fake.company(),
-        random.choice(["lead", "active", "inactive"]),
-        fake.bs(),
-        fake.url(),
-        fake.text(max_nb_chars=200),
-        datetime.now()
-    ))
-    client_ids.append(cursor.lastrowid)
-
-#addresses
-for client_id in client_ids:
-    for addr_type in ["billing", "office"]:
-        address = generate_address()
-        cursor.execute("""
-            INSERT INTO addresses (client_id, type, street, city, state, postal_code, country)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            client_id,
-            addr_type,
-            address["street"],
-            address["city"],
-            address["state"],
-            address["postal_code"],
-            address["country"]
+
+def _gen_users(task: dict) -> dict[str, list[tuple]]:
+    rng = _seed_chunk(task["seed"], "users", task["index"])
+    fake = _faker()
+    # created_at explicito: el DEFAULT CURRENT_TIMESTAMP haria depender los datos del momento de la carga
+    created_at = datetime.combine(task["reference_date"], datetime.min.time())
+    rows = []
+    for user_id in range(task["first_id"], task["first_id"] + task["n"]):
+        # sufijo con el id: username/email son UNIQUE y Faker.unique no funciona entre procesos
+        username = f"{fake.user_name()}{user_id}"
+        rows.append((
+            user_id,
+            username,
+            fake.name(),
+            f"{username}@{fake.free_email_domain()}",
+            rng.choice(["admin", "staff", "viewer"]),
+            created_at,
         ))
+    return {"users": rows}
 
-#client_pii
-for client_id in client_ids:
-    sensitive = generate_sensitive_info()
-    cursor.execute("""
-        INSERT INTO client_pii (
-            client_id, national_id, tax_id, bank_iban, credit_card_number,
-            credit_card_last4, date_of_birth, updated_at
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        client_id,
-        sensitive["national_id"],
-        sensitive["tax_id"],
-        sensitive["bank_iban"],
-        sensitive["credit_card_number"],
-        sensitive["credit_card_last4"],
-        sensitive["date_of_birth"],
-        datetime.now()
-    ))
-
-#contacts
-contact_ids = []
-for client_id in client_ids:
-    for i in range(random.randint(1, 3)):
-        cursor.execute("""
-            INSERT INTO contacts (client_id, first_name, last_name, email, phone, position, is_primary)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
+
+def _gen_clients(task: dict) -> dict[str, list[tuple]]:
+    # un bloque de clientes con todas sus filas dependientes; los ids de proyecto y factura
+    # vienen asignados por el proceso principal (una factura por proyecto: mismo desplazamiento)
+    rng = _seed_chunk(task["seed"], "clients", task["index"])
+    fake = _faker()
+    ref = task["reference_date"]
+    updated_at = datetime.combine(ref, datetime.min.time())
+    out: dict[str, list[tuple]] = {t: [] for t in (
+        "clients", "addresses", "client_pii", "contacts", "projects", "invoices", "payments"
+    )}
+    project_id = task["first_project_id"]
+    invoice_offset = task["first_invoice_id"] - task["first_project_id"]
+
+    for client_id in range(task["first_id"], task["first_id"] + task["n"]):
+        out["clients"].append((
             client_id,
-            fake.first_name(),
-            fake.last_name(),
-            fake.email(),
-            fake.phone_number(),
-            fake.job(),
-            1 if i == 0 else 0
+            fake.company(),
+            rng.choice(["lead", "active", "inactive"]),
+            fake.bs(),
+            fake.url(),
+            fake.text(max_nb_chars=200),
+            updated_at,
+            updated_at,
         ))
-        contact_ids.append(cursor.lastrowid)
-
-#projects
-project_ids = []
-for client_id in client_ids:
-    for _ in range(random.randint(1, 3)):
-        cursor.execute("""
-            INSERT INTO projects (client_id, name, description, status, start_date, end_date, budget)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
+
+        for addr_type in ["billing", "office"]:
+            address = generate_address(rng)
+            out["addresses"].append((
+                client_id,
+                addr_type,
+                address["street"],
+                address["city"],
+                address["state"],
+                address["postal_code"],
+                address["country"],
+            ))
+
+        sensitive = generate_sensitive_info(fake)
+        out["client_pii"].append((
             client_id,
-            fake.catch_phrase(),
-            fake.text(150),
-            random.choice(["planned", "active", "completed"]),
-            random_date(300),
-            random_date(30),
-            round(random.uniform(5000, 50000), 2)
+            sensitive["national_id"],
+            sensitive["tax_id"],
+            sensitive["bank_iban"],
+            sensitive["credit_card_number"],
+            sensitive["credit_card_last4"],
+            sensitive["date_of_birth"],
+            updated_at,
+            updated_at,
         ))
-        project_ids.append(cursor.lastrowid)
-
-#invoices
-invoice_ids = []
-for project_id in project_ids:
-    amount = round(random.uniform(1000, 15000), 2)
-    cursor.execute("""
-        INSERT INTO invoices (client_id, project_id, invoice_number, amount, status, issue_date, due_date)
-        VALUES (
-            (SELECT client_id FROM projects WHERE id = ?),
-            ?, ?, ?, ?, ?, ?
+
+        for i in range(rng.randint(1, 3)):
+            out["contacts"].append((
+                client_id,
+                fake.first_name(),
+                fake.last_name(),
+                fake.email(),
+                fake.phone_number(),
+                fake.job(),
+                1 if i == 0 else 0,
+            ))
+
+        for _ in range(projects_for_client(task["seed"], client_id)):
+            out["projects"].append((
+                project_id,
+                client_id,
+                fake.catch_phrase(),
+                fake.text(150),
+                rng.choice(["planned", "active", "completed"]),
+                random_date(rng, ref, 300),
+                random_date(rng, ref, 30),
+                round(rng.uniform(5000, 50000), 2),
+            ))
+            invoice_id = project_id + invoice_offset
+            out["invoices"].append((
+                invoice_id,
+                client_id,
+                project_id,
+                f"INV-{invoice_id:08d}",
+                round(rng.uniform(1000, 15000), 2),
+                rng.choice(["sent", "paid", "overdue"]),
+                random_date(rng, ref, 180),
+                random_date(rng, ref, 30),
+            ))
+            if rng.random() < 0.5:
+                out["payments"].append((
+                    invoice_id,
+                    round(rng.uniform(500, 15000), 2),
+                    rng.choice(["bank_transfer", "credit_card", "cash"]),
+                    random_date(rng, ref, 60),
+                    fake.uuid4(),
+                ))
+            project_id += 1
+    return out
+
+
+def _gen_interactions(task: dict) -> dict[str, list[tuple]]:
+    rng = _seed_chunk(task["seed"], "interactions", task["index"])
+    fake = _faker()
+    lo_c, hi_c = task["clients"]
+    lo_u, hi_u = task["users"]
+    return {"interactions": [
+        (
+            rng.randint(lo_c, hi_c),
+            rng.randint(lo_u, hi_u),
+            rng.choice(["call", "email", "meeting", "note"]),
+            fake.sentence(nb_words=10),
+            random_datetime(rng, task["reference_date"]),
         )
-    """, (
-        project_id,
-        project_id,
-        fake.unique.bothify(text="INV-#####"),
-        amount,
-        random.choice(["sent", "paid", "overdue"]),
-        random_date(180),
-        random_date(30)
-    ))
-    invoice_ids.append(cursor.lastrowid)
-
-#payments
-for invoice_id in invoice_ids:
-    if random.choice([True, False]):
-        cursor.execute("""
-            INSERT INTO payments (invoice_id, amount, payment_method, payment_date, reference)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
-            invoice_id,
-            round(random.uniform(500, 15000), 2),
-            random.choice(["bank_transfer", "credit_card", "cash"]),
-            random_date(60),
-            fake.uuid4()
-        ))
+        for _ in range(task["n"])
+    ]}
+
+
+def _gen_audit_logs(task: dict) -> dict[str, list[tuple]]:
+    rng = _seed_chunk(task["seed"], "audit_logs", task["index"])
+    fake = _faker()
+    lo_u, hi_u = task["users"]
+    return {"audit_logs": [
+        (
+            rng.randint(lo_u, hi_u),
+            rng.choice(["client", "project", "invoice"]),
+            rng.randint(1, 50),
+            rng.choice(["create", "update", "delete"]),
+            fake.word(),
+            fake.word(),
+            random_datetime(rng, task["reference_date"]),
+        )
+        for _ in range(task["n"])
+    ]}
+
+
+GENERATORS = {
+    "users": _gen_users,
+    "clients": _gen_clients,
+    "interactions": _gen_interactions,
+    "audit_logs": _gen_audit_logs,
+}
+
+
+def generate_chunk(task: dict) -> dict[str, list[tuple]]:
+    return GENERATORS[task["kind"]](task)
+
+
+def _chunks(total: int, size: int):
+    for index, start in enumerate(range(0, total, size)):
+        yield index, start, min(size, total - start)
+
+
+def _max_id(conn: sqlite3.Connection, table: str) -> int:
+    return conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+
+
+def build_tasks(conn: sqlite3.Connection, scale: float, seed: int, chunk_size: int,
+                reference_date: date) -> list[list[dict]]:
+    # fases en orden: cada fase solo referencia ids de fases anteriores.
+    # el resultado depende de (scale, seed, chunk_size, reference_date), no del numero de procesos
+    n_users = max(1, round(BASE_USERS * scale))
+    n_clients = max(1, round(BASE_CLIENTS * scale))
+    user_base = _max_id(conn, "users")
+    client_base = _max_id(conn, "clients")
+    project_id = _max_id(conn, "projects") + 1
+    invoice_id = _max_id(conn, "invoices") + 1
+    users = (user_base + 1, user_base + n_users)
+    clients = (client_base + 1, client_base + n_clients)
+
+    # campos comunes a todas las tareas: lo que fija el contenido de cada bloque
+    common = {"seed": seed, "reference_date": reference_date}
+    phases: list[list[dict]] = [[
+        {"kind": "users", "index": i, **common, "first_id": user_base + start + 1, "n": n}
+        for i, start, n in _chunks(n_users, chunk_size)
+    ]]
+
+    client_tasks = []
+    for i, start, n in _chunks(n_clients, chunk_size):
+        first = client_base + start + 1
+        client_tasks.append({
+            "kind": "clients", "index": i, **common, "first_id": first, "n": n,
+            "first_project_id": project_id, "first_invoice_id": invoice_id,
+        })
+        n_projects = sum(projects_for_client(seed, c) for c in range(first, first + n))
+        project_id += n_projects
+        invoice_id += n_projects
+    phases.append(client_tasks)
+
+    activity = []
+    for i, _, n in _chunks(max(1, round(BASE_INTERACTIONS * scale)), chunk_size):
+        activity.append({"kind": "interactions", "index": i, **common, "n": n, "clients": clients, "users": users})
+    for i, _, n in _chunks(max(1, round(BASE_AUDIT_LOGS * scale)), chunk_size):
+        activity.append({"kind": "audit_logs", "index": i, **common, "n": n, "users": users})
+    phases.append(activity)
+    return phases
+
+
+def _drop_indexes(conn: sqlite3.Connection) -> list[str]:
+    # indices secundarios fuera durante la carga (los UNIQUE/PK no se pueden quitar)
+    rows = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+    ).fetchall()
+    for name, _ in rows:
+        conn.execute(f'DROP INDEX "{name}"')
+    conn.commit()
+    return [sql for _, sql in rows]
+
+
+def _results(pool: ProcessPoolExecutor, tasks: list[dict], window: int):
+    # en orden y con un numero acotado de bloques en vuelo: la memoria no crece con --scale
+    pending: deque = deque()
+    it = iter(tasks)
+    for task in it:
+        pending.append(pool.submit(generate_chunk, task))
+        if len(pending) >= window:
+            break
+    while pending:
+        result = pending.popleft().result()
+        task = next(it, None)
+        if task is not None:
+            pending.append(pool.submit(generate_chunk, task))
+        yield result
+
+
+@contextmanager
+def _generator_pool(workers: int, seed: int):
+    # procesos spawn con PYTHONHASHSEED fijo: algunos locales de Faker eligen de un set
+    # (p.ej. ciudades de it_IT) y su orden depende del hash de las cadenas
+    previous = os.environ.get("PYTHONHASHSEED")
+    os.environ["PYTHONHASHSEED"] = str(seed % 4294967296)
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        yield pool
+    finally:
+        pool.shutdown(cancel_futures=True)
+        if previous is None:
+            os.environ.pop("PYTHONHASHSEED", None)
+        else:
+            os.environ["PYTHONHASHSEED"] = previous
+
+
+def _load(conn: sqlite3.Connection, phases: list[list[dict]], workers: int, commit_rows: int,
+          seed: int, report: dict[str, Any]) -> None:
+    pending_rows = 0
+    with _generator_pool(workers, seed) as pool:
+        for phase in phases:
+            phase_started = time.perf_counter()
+            phase_rows = 0
+            for chunk in _results(pool, phase, workers * 2):
+                for table, rows in chunk.items():
+                    if not rows:
+                        continue
+                    t0 = time.perf_counter()
+                    conn.executemany(INSERTS[table], rows)
+                    stats = report["tables"].setdefault(table, {"rows": 0, "insert_seconds": 0.0})
+                    stats["rows"] += len(rows)
+                    stats["insert_seconds"] += time.perf_counter() - t0
+                    pending_rows += len(rows)
+                    phase_rows += len(rows)
+                if pending_rows >= commit_rows: # transacciones grandes: un commit cada commit_rows filas
+                    conn.commit()
+                    pending_rows = 0
+            conn.commit()
+            pending_rows = 0
+            kinds = {t["kind"] for t in phase}
+            report["phases"].append({
+                "kind": kinds.pop() if len(kinds) == 1 else "activity",
+                "rows": phase_rows,
+                "seconds": time.perf_counter() - phase_started,
+            })
+
+
+def populate(db_path: str, scale: float, seed: int, workers: int, chunk_size: int, commit_rows: int,
+             reference_date: date) -> dict[str, Any]:
+    conn = connect(db_path, profile="bulk_load")
+    report: dict[str, Any] = {"tables": {}, "phases": [], "reference_date": reference_date}
+    started = time.perf_counter()
+    phases = build_tasks(conn, scale, seed, chunk_size, reference_date)
+    index_sql = _drop_indexes(conn)
+    try:
+        _load(conn, phases, max(1, workers), commit_rows, seed, report)
+    finally:
+        # los indices se crean una sola vez al final (tambien si la carga falla)
+        conn.rollback()
+        t0 = time.perf_counter()
+        for sql in index_sql:
+            conn.execute(sql)
+        conn.commit()
+        report["index_seconds"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    optimize(conn, analyze=True) # estadisticas del planificador con los datos nuevos
+    report["analyze_seconds"] = time.perf_counter() - t0
+    conn.close()
+    report["total_seconds"] = time.perf_counter() - started
+    return report
+
+
+def _print_report(report: dict[str, Any]) -> None:
+    print(f"{'tabla':<14} {'filas':>12} {'insert s':>9} {'filas/s':>12}")
+    total = 0
+    for table, stats in report["tables"].items():
+        total += stats["rows"]
+        rate = stats["rows"] / stats["insert_seconds"] if stats["insert_seconds"] else 0.0
+        print(f"{table:<14} {stats['rows']:>12} {stats['insert_seconds']:>9.2f} {rate:>12.0f}")
+    for phase in report["phases"]:
+        rate = phase["rows"] / phase["seconds"] if phase["seconds"] else 0.0
+        print(f"fase {phase['kind']:<12}: {phase['rows']} filas en {phase['seconds']:.2f}s ({rate:.0f} filas/s, generacion + insercion)")
+    print(f"indices: {report['index_seconds']:.2f}s, analyze: {report['analyze_seconds']:.2f}s")
+    print(f"fecha de referencia: {report['reference_date'].isoformat()}")
+    print(f"total: {total} filas en {report['total_seconds']:.2f}s ({total / report['total_seconds']:.0f} filas/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera datos CRM falsos en clients.db.")
+    parser.add_argument("--db", default=os.getenv("SQL_DB_PATH", "clients.db"))
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Factor sobre el tamano original (20 clientes, 5 usuarios, 100 interacciones).")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1),
+                        help="Procesos generadores; no cambia los datos generados.")
+    parser.add_argument("--chunk-size", type=int, default=5000,
+                        help="Filas de la tabla principal por bloque; forma parte de la semilla efectiva.")
+    parser.add_argument("--commit-rows", type=int, default=500_000)
+    parser.add_argument("--reference-date", type=date.fromisoformat, default=date.today(),
+                        help="Fecha (AAAA-MM-DD) desde la que se generan fechas hacia atras; por defecto hoy. "
+                             "Forma parte de la semilla efectiva.")
+    args = parser.parse_args()
 
-#interactions
-for _ in range(100):
-    cursor.execute("""
-        INSERT INTO interactions (client_id, user_id, type, summary)
-        VALUES (?, ?, ?, ?)
-    """, (
-        random.choice(client_ids),
-        random.choice(user_ids),
-        random.choice(["call", "email", "meeting", "note"]),
-        fake.sentence(nb_words=10)
-    ))
-
-#audit_logs
-for _ in range(100):
-    cursor.execute("""
-        INSERT INTO audit_logs (user_id, entity, entity_id, action, old_value, new_value)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (
-        random.choice(user_ids),
-        random.choice(["client", "project", "invoice"]),
-        random.randint(1, 50),
-        random.choice(["create", "update", "delete"]),
-        fake.word(),
-        fake.word()
-    ))
-
-conn.commit()
-conn.close()
-
-print("Fake CRM data inserted successfully.")
+    report = populate(args.db, args.scale, args.seed, args.workers, max(1, args.chunk_size), args.commit_rows,
+                      args.reference_date)
+    _print_report(report)
+    print("Fake CRM data inserted successfully.")
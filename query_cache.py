@@ -0,0 +1,146 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() in {"1", "true", "yes"}
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "256"))
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# literales y identificadores entre comillas se conservan tal cual
+_SQL_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\s+|[^\s'\"]+")
+
+
+# resultados que dependen del momento o del azar: nunca se cachean, porque data_version no
+# cambia al pasar la medianoche ni al volver a llamar a random()
+_VOLATILE_RE = re.compile(
+    r"\b(?:current_date|current_time|current_timestamp)\b|"
+    r"\b(?:random|randomblob|changes|total_changes|last_insert_rowid)\s*\(|"
+    r"\b(?:date|time|datetime|julianday|unixepoch|strftime|timediff)\s*\(\s*\)"
+)
+
+
+def is_volatile_sql(sql: str) -> bool:
+    code = []
+    for tok in _SQL_TOKEN_RE.findall(sql or ""):
+        if tok[0] == "'":
+            # date('now'), strftime('%Y', 'now', 'localtime')...
+            if tok[1:-1].strip().lower() == "now":
+                return True
+            code.append("''")
+        elif tok[0] == '"':
+            code.append('""')
+        else:
+            code.append(tok.lower())
+    return _VOLATILE_RE.search("".join(code)) is not None
+
+
+def normalize_sql(sql: str) -> str:
+    sql = (sql or "").strip().rstrip(";").strip()
+    parts = []
+    for tok in _SQL_TOKEN_RE.findall(sql):
+        if tok.isspace():
+            parts.append(" ")
+        elif tok[0] in "'\"":
+            parts.append(tok)
+        else:
+            # palabras clave e identificadores no distinguen mayusculas en sqlite
+            parts.append(tok.lower())
+    return "".join(parts)
+
+
+class QueryResultCache:
+    # LRU acotado por numero de entradas y bytes; cada entrada guarda la version
+    # de datos con la que se calculo y deja de valer cuando esta cambia
+
+    def __init__(
+        self,
+        max_entries: int = QUERY_CACHE_MAX_ENTRIES,
+        max_bytes: int = QUERY_CACHE_MAX_BYTES,
+        enabled: bool = QUERY_CACHE_ENABLED,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+        self._entries: OrderedDict[str, tuple[Hashable, str]] = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "stored": 0,
+            "evictions": 0,
+            "too_large": 0,
+            "volatile": 0,
+        }
+
+    @staticmethod
+    def _size(key: str, value: str) -> int:
+        return len(key) + len(value)
+
+    def _pop(self, key: str) -> None:
+        _, value = self._entries.pop(key)
+        self._nbytes -= self._size(key, value)
+
+    def get(self, sql: str, version: Hashable) -> str | None:
+        if not self.enabled:
+            return None
+        key = normalize_sql(sql)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            if entry[0] != version:
+                self._pop(key)
+                self._counters["stale"] += 1
+                self._counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._counters["hits"] += 1
+            return entry[1]
+
+    def put(self, sql: str, version: Hashable, value: str) -> None:
+        if not self.enabled:
+            return
+        if is_volatile_sql(sql):
+            with self._lock:
+                self._counters["volatile"] += 1
+            return
+        key = normalize_sql(sql)
+        size = self._size(key, value)
+        with self._lock:
+            if size > self.max_bytes:
+                self._counters["too_large"] += 1
+                return
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (version, value)
+            self._nbytes += size
+            self._counters["stored"] += 1
+            while len(self._entries) > self.max_entries or self._nbytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+                self._counters["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._nbytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hit_rate": self._counters["hits"] / lookups if lookups else 0.0,
+            **self._counters,
+        }
+
+
+query_cache = QueryResultCache()
@@ -0,0 +1,180 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any
+
+SQL_QUESTION_CACHE_ENABLED = os.getenv("SQL_QUESTION_CACHE_ENABLED", "true").lower() in {"1", "true", "yes"}
+SQL_QUESTION_CACHE_PATH = os.getenv("SQL_QUESTION_CACHE_PATH", os.path.join("cache", "sql_question_cache.json"))
+SQL_QUESTION_CACHE_THRESHOLD = float(os.getenv("SQL_QUESTION_CACHE_THRESHOLD", "0.85"))
+SQL_QUESTION_CACHE_MAX_ENTRIES = int(os.getenv("SQL_QUESTION_CACHE_MAX_ENTRIES", "2000"))
+# las preguntas de seguimiento dependen de la conversacion: por defecto solo primer turno
+SQL_QUESTION_CACHE_FIRST_TURN_ONLY = os.getenv("SQL_QUESTION_CACHE_FIRST_TURN_ONLY", "true").lower() in {"1", "true", "yes"}
+
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+_STOPWORDS = {
+    "el", "la", "los", "las", "un", "una", "de", "del", "a", "al", "en", "y", "o", "que",
+    "por", "para", "con", "me", "mi", "es", "son", "hay", "se", "lo",
+    "the", "an", "of", "to", "in", "and", "or", "is", "are", "my", "please",
+    "show", "give", "tell", "dime", "muestra", "muestrame", "dame", "cuales", "what", "which",
+}
+
+
+def schema_hash(db_prompt: str) -> str:
+    return hashlib.sha1((db_prompt or "").encode("utf-8")).hexdigest()[:16]
+
+
+def _tokens(text: str) -> list[str]:
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return [t for t in _WORD_RE.findall(text) if t not in _STOPWORDS]
+
+
+def _trigrams(tokens: list[str]) -> set[str]:
+    joined = f" {' '.join(tokens)} "
+    return {joined[i:i + 3] for i in range(len(joined) - 2)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class _Entry:
+    __slots__ = ("question", "schema", "sql", "words", "grams", "numbers", "hits", "created_at")
+
+    def __init__(self, question: str, schema: str, sql: str, hits: int = 0, created_at: float | None = None):
+        tokens = _tokens(question)
+        self.question = question
+        self.schema = schema
+        self.sql = sql
+        self.words = set(tokens)
+        self.grams = _trigrams(tokens)
+        self.numbers = {t for t in tokens if t.isdigit()}
+        self.hits = hits
+        self.created_at = created_at or time.time()
+
+
+class QuestionSqlCache:
+    # (pregunta, hash del esquema) -> SQL ya validado; similitud por conjunto de palabras
+    # y trigramas de caracteres. Solo se admite SQL que se ejecuto sin error.
+
+    def __init__(
+        self,
+        path: str = SQL_QUESTION_CACHE_PATH,
+        threshold: float = SQL_QUESTION_CACHE_THRESHOLD,
+        max_entries: int = SQL_QUESTION_CACHE_MAX_ENTRIES,
+        enabled: bool = SQL_QUESTION_CACHE_ENABLED,
+    ):
+        self.path = path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.enabled = enabled
+
+        self._entries: OrderedDict[tuple[str, str], _Entry] = OrderedDict()
+        self._loaded = False
+        self._save_lock = threading.Lock()
+        self._counters = {
+            "lookups": 0,
+            "hits": 0,
+            "admitted": 0,
+            "evictions": 0,
+            "save_errors": 0,
+        }
+
+    def _key(self, question: str, schema: str) -> tuple[str, str]:
+        return " ".join(_tokens(question)), schema
+
+    def load(self) -> None:
+        self._loaded = True
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, json.JSONDecodeError):
+            return
+        for item in data.get("entries", []):
+            entry = _Entry(item["question"], item["schema"], item["sql"], item.get("hits", 0), item.get("created_at"))
+            self._entries[self._key(entry.question, entry.schema)] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def lookup(self, question: str, schema: str) -> str | None:
+        if not self.enabled:
+            return None
+        if not self._loaded:
+            self.load()
+        self._counters["lookups"] += 1
+
+        key = self._key(question, schema)
+        best = self._entries.get(key)
+        if best is None:
+            tokens = _tokens(question)
+            words, grams = set(tokens), _trigrams(tokens)
+            numbers = {t for t in tokens if t.isdigit()}
+            best_score = 0.0
+            for entry in self._entries.values():
+                # cifras distintas ("top 5" / "top 10") nunca son la misma consulta
+                if entry.schema != schema or entry.numbers != numbers:
+                    continue
+                score = 0.5 * _jaccard(words, entry.words) + 0.5 * _jaccard(grams, entry.grams)
+                if score > best_score:
+                    best, best_score = entry, score
+            if best is None or best_score < self.threshold:
+                return None
+            key = self._key(best.question, best.schema)
+
+        self._entries.move_to_end(key)
+        best.hits += 1
+        self._counters["hits"] += 1
+        return best.sql
+
+    async def admit(self, question: str, schema: str, sql: str) -> None:
+        if not self.enabled or not (sql or "").strip():
+            return
+        if not self._loaded:
+            self.load()
+        key = self._key(question, schema)
+        if key in self._entries:
+            return
+        self._entries[key] = _Entry(question, schema, sql)
+        self._counters["admitted"] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+        snapshot = [
+            {"question": e.question, "schema": e.schema, "sql": e.sql, "hits": e.hits, "created_at": e.created_at}
+            for e in self._entries.values()
+        ]
+        await asyncio.to_thread(self._save, snapshot)
+
+    def _save(self, snapshot: list[dict]) -> None:
+        with self._save_lock:
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp = f"{self.path}.tmp"
+                with open(tmp, "w", encoding="utf-8") as fh:
+                    json.dump({"version": 1, "entries": snapshot}, fh, ensure_ascii=False)
+                os.replace(tmp, self.path)
+            except OSError:
+                self._counters["save_errors"] += 1
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self._counters["lookups"]
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "threshold": self.threshold,
+            "entries": len(self._entries),
+            "hit_rate": self._counters["hits"] / lookups if lookups else 0.0,
+            **self._counters,
+        }
+
+
+question_cache = QuestionSqlCache()
@@ -0,0 +1,281 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any
+
+from db_profile import connect
+from result_format import SQL_RESULT_MAX_ROWS
+from sql_exec import sql_executor, SqlTimeoutError, SQL_QUERY_TIMEOUT, SQL_PROGRESS_STEPS
+
+SQL_STREAM_ROWS = os.getenv("SQL_STREAM_ROWS", "false").lower() in {"1", "true", "yes"}
+SQL_PAGE_SIZE = int(os.getenv("SQL_PAGE_SIZE", "100"))
+SQL_PAGE_SIZE_MAX = int(os.getenv("SQL_PAGE_SIZE_MAX", "5000"))
+# paginas que se envian dentro del propio stream; el resto se pide por cursor_id
+SQL_STREAM_INLINE_PAGES = int(os.getenv("SQL_STREAM_INLINE_PAGES", "10"))
+# un cursor abierto mantiene una transaccion de lectura: en WAL fija su instantanea y el
+# checkpoint no puede recortar el log mientras viva, asi que el ttl es corto
+SQL_CURSOR_TTL = float(os.getenv("SQL_CURSOR_TTL", "30"))
+# filas que se leen a memoria tras las paginas en linea para cerrar la conexion antes
+SQL_CURSOR_DRAIN_ROWS = int(os.getenv("SQL_CURSOR_DRAIN_ROWS", "5000"))
+SQL_CURSOR_MAX = int(os.getenv("SQL_CURSOR_MAX", "16"))
+# los cursores viven en memoria del proceso: con varios workers de uvicorn la pagina
+# siguiente puede llegar a otro proceso y dar 404, asi que el modo paginado se desactiva
+ORCHESTRATOR_WORKERS = int(os.getenv("ORCHESTRATOR_WORKERS", "1"))
+SQL_PAGING_AVAILABLE = ORCHESTRATOR_WORKERS <= 1
+
+
+class CursorNotFound(Exception):
+    pass
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, bytes):
+        return f"<blob {len(value)} bytes>"
+    return value
+
+
+def _with_timeout(conn: sqlite3.Connection, timeout: float, fn, *args) -> Any:
+    # mismo corte por progress handler que sql_executor, pero sobre la conexion del cursor
+    if timeout <= 0:
+        return fn(*args)
+    deadline = time.monotonic() + timeout
+    timed_out = False
+
+    def _progress() -> int:
+        nonlocal timed_out
+        if time.monotonic() > deadline:
+            timed_out = True
+            return 1
+        return 0
+
+    conn.set_progress_handler(_progress, SQL_PROGRESS_STEPS)
+    try:
+        return fn(*args)
+    except sqlite3.OperationalError as e:
+        if timed_out:
+            raise SqlTimeoutError(f"Consulta cancelada tras {timeout:g}s") from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+class ResultCursor:
+    # cursor de solo lectura sobre su propia conexion: mantenerlo abierto no bloquea
+    # las conexiones del pool y las paginas siguientes no vuelven a ejecutar la consulta
+
+    def __init__(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor, sql: str, session_id: str | None,
+                 timeout: float = SQL_QUERY_TIMEOUT):
+        self.id = uuid.uuid4().hex
+        self.conn = conn
+        self.cursor = cursor
+        self.sql = sql
+        self.session_id = session_id
+        self.timeout = timeout # por pagina
+        self.columns = [d[0] for d in cursor.description]
+        self.buffer: list[tuple] = [] # filas leidas de antemano y aun no enviadas
+        self.rows_sent = 0
+        self.pages_sent = 0
+        self.done = False
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.lock = threading.Lock()
+
+    def _read(self, n: int) -> list[tuple]:
+        rows = _with_timeout(self.conn, self.timeout, self.cursor.fetchmany, n)
+        if len(rows) < n:
+            # leida la ultima fila: la conexion se cierra ya y suelta la instantanea,
+            # lo que quede en buffer se sigue sirviendo desde memoria
+            self.done = True
+            self.conn.close()
+        return rows
+
+    def prefetch(self, n: int) -> list[tuple]:
+        # filas para el prompt final; se guardan para enviarlas despues al cliente
+        with self.lock:
+            if not self.done and len(self.buffer) < n:
+                self.buffer.extend(self._read(n - len(self.buffer)))
+            return self.buffer[:n]
+
+    def drain(self, n: int) -> bool:
+        # lee hasta n filas mas a memoria; True si con eso se ha agotado la consulta
+        with self.lock:
+            if not self.done and n > 0:
+                self.buffer.extend(self._read(n))
+            return self.done
+
+    def page(self, size: int) -> dict[str, Any]:
+        with self.lock:
+            rows = self.buffer[:size]
+            del self.buffer[:size]
+            if len(rows) < size and not self.done:
+                rows.extend(self._read(size - len(rows)))
+            offset = self.rows_sent
+            self.rows_sent += len(rows)
+            self.pages_sent += 1
+            self.last_used = time.monotonic()
+            return {
+                "cursor_id": self.id,
+                "page": self.pages_sent - 1,
+                "offset": offset,
+                "rows": [[_json_value(v) for v in row] for row in rows],
+                "done": self.done and not self.buffer,
+                "row_count": self.rows_sent,
+            }
+
+    def close(self) -> None:
+        with self.lock:
+            self.done = True
+            self.buffer.clear()
+            self.conn.close()
+
+
+class ResultCursorStore:
+    def __init__(self, db_path: str | None = None, ttl: float = SQL_CURSOR_TTL, max_open: int = SQL_CURSOR_MAX):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_open = max(1, max_open)
+        self._cursors: dict[str, ResultCursor] = {}
+        self._lock = threading.Lock()
+        self._counters = {
+            "opened": 0,
+            "pages": 0,
+            "rows": 0,
+            "exhausted": 0,
+            "drained": 0,
+            "expired": 0,
+            "evicted": 0,
+            "not_found": 0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        path = Path(self.db_path or sql_executor.db_path).resolve()
+        return connect(f"{path.as_uri()}?mode=ro", read_only=True, uri=True, check_same_thread=False)
+
+    def _sweep(self) -> list[ResultCursor]:
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            for cursor_id, rc in list(self._cursors.items()):
+                if now - rc.last_used > self.ttl:
+                    stale.append(self._cursors.pop(cursor_id))
+                    self._counters["expired"] += 1
+            while len(self._cursors) >= self.max_open:
+                oldest = min(self._cursors.values(), key=lambda rc: rc.last_used)
+                stale.append(self._cursors.pop(oldest.id))
+                self._counters["evicted"] += 1
+        return stale
+
+    def _open(self, _conn: sqlite3.Connection, sql: str, session_id: str | None, prefetch: int,
+              timeout: float) -> ResultCursor:
+        for rc in self._sweep():
+            rc.close()
+        conn = self._connect()
+        try:
+            cursor = _with_timeout(conn, timeout, conn.execute, sql)
+            if cursor.description is None:
+                raise sqlite3.OperationalError("La consulta no devuelve filas")
+            rc = ResultCursor(conn, cursor, sql, session_id, timeout)
+            rc.prefetch(prefetch)
+        except Exception:
+            conn.close()
+            raise
+        with self._lock:
+            self._cursors[rc.id] = rc
+            self._counters["opened"] += 1
+        return rc
+
+    async def open(self, sql: str, session_id: str | None = None, prefetch: int = SQL_RESULT_MAX_ROWS,
+                   timeout: float | None = None) -> ResultCursor:
+        # se ejecuta en el pool de sql_executor para respetar su limite de concurrencia
+        timeout = SQL_QUERY_TIMEOUT if timeout is None else timeout
+        return await sql_executor.run(self._open, sql, session_id, prefetch, timeout, timeout=0)
+
+    def _page(self, _conn: sqlite3.Connection, cursor_id: str, size: int) -> dict[str, Any]:
+        with self._lock:
+            rc = self._cursors.get(cursor_id)
+            if rc is None:
+                self._counters["not_found"] += 1
+                raise CursorNotFound(cursor_id)
+        page = rc.page(size)
+        with self._lock:
+            self._counters["pages"] += 1
+            self._counters["rows"] += len(page["rows"])
+            if page["done"]:
+                self._cursors.pop(cursor_id, None)
+                self._counters["exhausted"] += 1
+        if page["done"]:
+            rc.close()
+        return page
+
+    async def page(self, cursor_id: str, size: int = SQL_PAGE_SIZE) -> dict[str, Any]:
+        size = max(1, min(size, SQL_PAGE_SIZE_MAX))
+        return await sql_executor.run(self._page, cursor_id, size, timeout=0)
+
+    def _drain(self, _conn: sqlite3.Connection, cursor_id: str, max_rows: int) -> bool:
+        with self._lock:
+            rc = self._cursors.get(cursor_id)
+        if rc is None:
+            return False
+        drained = rc.drain(max_rows)
+        if drained:
+            with self._lock:
+                self._counters["drained"] += 1
+        return drained
+
+    async def drain(self, cursor_id: str, max_rows: int = SQL_CURSOR_DRAIN_ROWS) -> bool:
+        # tras las paginas en linea: si el resto cabe en max_rows se pasa a memoria y la
+        # conexion se cierra, en vez de fijar la instantanea hasta que el cliente pida mas
+        return await sql_executor.run(self._drain, cursor_id, max_rows, timeout=0)
+
+    def columns(self, cursor_id: str) -> list[str]:
+        with self._lock:
+            rc = self._cursors.get(cursor_id)
+        if rc is None:
+            raise CursorNotFound(cursor_id)
+        return rc.columns
+
+    def close(self, cursor_id: str) -> bool:
+        with self._lock:
+            rc = self._cursors.pop(cursor_id, None)
+        if rc is not None:
+            rc.close()
+        return rc is not None
+
+    def close_all(self) -> None:
+        with self._lock:
+            cursors = list(self._cursors.values())
+            self._cursors.clear()
+        for rc in cursors:
+            rc.close()
+
+    def stats(self) -> dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            open_cursors = [
+                {
+                    "cursor_id": rc.id,
+                    "rows_sent": rc.rows_sent,
+                    "buffered": len(rc.buffer),
+                    "snapshot_open": not rc.done,
+                    "idle_seconds": now - rc.last_used,
+                }
+                for rc in self._cursors.values()
+            ]
+            counters = dict(self._counters)
+        return {
+            "available": SQL_PAGING_AVAILABLE,
+            "workers": ORCHESTRATOR_WORKERS,
+            "page_size": SQL_PAGE_SIZE,
+            "inline_pages": SQL_STREAM_INLINE_PAGES,
+            "ttl_seconds": self.ttl,
+            "drain_rows": SQL_CURSOR_DRAIN_ROWS,
+            "max_open": self.max_open,
+            "open": open_cursors,
+            **counters,
+        }
+
+
+result_cursors = ResultCursorStore()
@@ -0,0 +1,185 @@
+import csv
+import io
+import os
+import threading
+from typing import Any, Sequence
+
+SQL_RESULT_MAX_ROWS = int(os.getenv("SQL_RESULT_MAX_ROWS", "200"))
+SQL_RESULT_MAX_BYTES = int(os.getenv("SQL_RESULT_MAX_BYTES", "16384"))
+SQL_RESULT_FORMAT = os.getenv("SQL_RESULT_FORMAT", "markdown").lower() # markdown | csv
+SQL_FETCH_SIZE = int(os.getenv("SQL_FETCH_SIZE", "500"))
+
+# aproximacion habitual para modelos tipo llama: ~4 caracteres por token
+CHARS_PER_TOKEN = 4
+
+_stats_lock = threading.Lock()
+_result_stats: dict[str, Any] = {
+    "queries": 0,
+    "truncated": 0,
+    "rows_total": 0,
+    "rows_shown": 0,
+    "chars_encoded": 0,
+    "chars_repr": 0, # lo que habria ocupado f"{fetchall()}"
+    "tokens_saved_estimate": 0,
+}
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, bytes):
+        return f"<blob {len(value)} bytes>"
+    return str(value)
+
+
+def _md_cell(value: Any) -> str:
+    return _cell(value).replace("|", "\\|").replace("\n", " ")
+
+
+class _Renderer:
+    def __init__(self, columns: list[str], fmt: str):
+        self.fmt = "csv" if fmt == "csv" else "markdown"
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf, lineterminator="\n") if self.fmt == "csv" else None
+        self.header = self._line(columns)
+        if self.fmt == "markdown":
+            self.header += "|" + "|".join("---" for _ in columns) + "|\n"
+
+    def _line(self, values: Sequence[Any]) -> str:
+        if self._writer is not None:
+            self._buf.seek(0)
+            self._buf.truncate()
+            self._writer.writerow([_cell(v) for v in values])
+            return self._buf.getvalue()
+        return "| " + " | ".join(_md_cell(v) for v in values) + " |\n"
+
+    def row(self, values: Sequence[Any]) -> str:
+        return self._line(values)
+
+
+class _ColumnSummary:
+    __slots__ = ("count", "numeric", "min", "max", "sum")
+
+    def __init__(self):
+        self.count = 0
+        self.numeric = 0
+        self.min = None
+        self.max = None
+        self.sum = 0
+
+    def add(self, value: Any) -> None:
+        if value is None:
+            return
+        self.count += 1
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            self.numeric += 1
+            self.sum += value
+            self.min = value if self.min is None else min(self.min, value)
+            self.max = value if self.max is None else max(self.max, value)
+
+    def render(self, name: str) -> str:
+        if self.numeric and self.numeric == self.count:
+            total = round(self.sum, 4) if isinstance(self.sum, float) else self.sum
+            return f"{name}: count={self.count}, min={self.min}, max={self.max}, sum={total}"
+        return f"{name}: count={self.count} (no numerico)"
+
+
+def encode_results(
+    cursor,
+    max_rows: int = SQL_RESULT_MAX_ROWS,
+    max_bytes: int = SQL_RESULT_MAX_BYTES,
+    fmt: str = SQL_RESULT_FORMAT,
+    fetch_size: int = SQL_FETCH_SIZE,
+) -> str:
+    # lee el cursor por bloques: hasta max_rows / max_bytes se renderiza la tabla y del
+    # resto solo se acumula un resumen numerico por columna (memoria constante)
+    if cursor.description is None:
+        return f"Sin filas devueltas ({max(cursor.rowcount, 0)} filas afectadas)"
+
+    columns = [d[0] for d in cursor.description]
+    renderer = _Renderer(columns, fmt)
+    parts = [renderer.header]
+    size = len(renderer.header.encode("utf-8"))
+    shown = 0
+    rest: list[_ColumnSummary] | None = None
+    rest_rows = 0
+    repr_chars = 2 # "[]"
+
+    while True:
+        rows = cursor.fetchmany(fetch_size)
+        if not rows:
+            break
+        for row in rows:
+            repr_chars += len(repr(row)) + 2
+            if rest is None:
+                line = renderer.row(row)
+                line_size = len(line.encode("utf-8"))
+                if shown < max_rows and size + line_size <= max_bytes:
+                    parts.append(line)
+                    size += line_size
+                    shown += 1
+                    continue
+                rest = [_ColumnSummary() for _ in columns]
+            rest_rows += 1
+            for summary, value in zip(rest, row):
+                summary.add(value)
+
+    total = shown + rest_rows
+    if rest is None:
+        parts.append(f"({total} filas)\n")
+    else:
+        parts.append(f"({total} filas; se muestran {shown}, {rest_rows} omitidas)\n")
+        parts.append("Resumen de las filas omitidas:\n")
+        parts.extend(f"- {s.render(name)}\n" for name, s in zip(columns, rest))
+    text = "".join(parts)
+
+    with _stats_lock:
+        _result_stats["queries"] += 1
+        _result_stats["truncated"] += rest is not None
+        _result_stats["rows_total"] += total
+        _result_stats["rows_shown"] += shown
+        _result_stats["chars_encoded"] += len(text)
+        _result_stats["chars_repr"] += repr_chars
+        _result_stats["tokens_saved_estimate"] += max(0, (repr_chars - len(text)) // CHARS_PER_TOKEN)
+    return text
+
+
+def encode_rows(columns: list[str], rows: Sequence[Sequence[Any]], more: bool,
+                max_bytes: int = SQL_RESULT_MAX_BYTES, fmt: str = SQL_RESULT_FORMAT) -> str:
+    # variante para filas ya leidas (modo paginado): no se recorre el resto del cursor,
+    # asi que no hay resumen de lo omitido
+    renderer = _Renderer(columns, fmt)
+    parts = [renderer.header]
+    size = len(renderer.header.encode("utf-8"))
+    shown = 0
+    for row in rows:
+        line = renderer.row(row)
+        size += len(line.encode("utf-8"))
+        if size > max_bytes:
+            more = True
+            break
+        parts.append(line)
+        shown += 1
+    if more:
+        parts.append(f"(se muestran {shown} filas; hay mas filas que no se incluyen aqui)\n")
+    else:
+        parts.append(f"({shown} filas)\n")
+    text = "".join(parts)
+
+    with _stats_lock:
+        _result_stats["queries"] += 1
+        _result_stats["truncated"] += more
+        _result_stats["rows_shown"] += shown
+        _result_stats["chars_encoded"] += len(text)
+    return text
+
+
+def result_stats() -> dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_result_stats)
+    return {
+        "max_rows": SQL_RESULT_MAX_ROWS,
+        "max_bytes": SQL_RESULT_MAX_BYTES,
+        "format": SQL_RESULT_FORMAT,
+        **stats,
+    }
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import re
+import time
+import unicodedata
+import warnings
+import zlib
+
+import numpy as np
+
+from prompts import RUTAS
+
+ROUTE_MODEL_PATH = os.getenv("ROUTE_MODEL_PATH", os.path.join("models", "route_model.npz"))
+ROUTE_MODEL_THRESHOLD = float(os.getenv("ROUTE_MODEL_THRESHOLD", "0.9"))
+# fraccion de aciertos del camino rapido que tambien se envian al LLM para medir acuerdo
+ROUTE_MODEL_SHADOW_RATE = float(os.getenv("ROUTE_MODEL_SHADOW_RATE", "0.0"))
+
+MODEL_FORMAT_VERSION = 1
+LABELS = sorted(RUTAS)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _ngrams(text: str) -> list[str]:
+    # unigramas y bigramas de palabras + trigramas/4-gramas de caracteres por palabra
+    words = _WORD_RE.findall(_normalize(text))
+    feats = [f"w:{w}" for w in words]
+    feats += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"<{w}>"
+        for n in (3, 4):
+            feats += [f"c:{padded[i:i + n]}" for i in range(len(padded) - n + 1)]
+    # marcadores de rol/etiquetas internas (p. ej. <SQL_QUERY>, 'system:')
+    feats += [f"t:{m.lower()}" for m in re.findall(r"</?[A-Za-z_]+>|\b(?:system|assistant|user):", text or "")]
+    return feats
+
+
+def _hashed(text: str, dim: int) -> tuple[np.ndarray, np.ndarray]:
+    counts: dict[int, float] = {}
+    for f in _ngrams(text):
+        idx = zlib.crc32(f.encode("utf-8")) % dim
+        counts[idx] = counts.get(idx, 0.0) + 1.0
+    idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+    val = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+    return idx, 1.0 + np.log(val) # tf sublineal
+
+
+class _Csr:
+    # matriz dispersa minima (filas = textos) para entrenar sin densificar
+
+    def __init__(self, rows: list[tuple[np.ndarray, np.ndarray]]):
+        self.n = len(rows)
+        lengths = np.array([len(r[0]) for r in rows], dtype=np.int64)
+        self.indptr = np.concatenate([[0], np.cumsum(lengths)])
+        self.indices = np.concatenate([r[0] for r in rows]) if rows else np.zeros(0, np.int64)
+        self.values = np.concatenate([r[1] for r in rows]) if rows else np.zeros(0, np.float32)
+        self.row_of = np.repeat(np.arange(self.n), lengths)
+
+    def scale(self, idf: np.ndarray) -> None:
+        self.values = self.values * idf[self.indices]
+        norms = np.sqrt(np.bincount(self.row_of, weights=self.values ** 2, minlength=self.n))
+        self.values = (self.values / np.maximum(norms[self.row_of], 1e-12)).astype(np.float32)
+
+    def dot(self, w: np.ndarray) -> np.ndarray:
+        # (n, dim) @ (dim, k)
+        contrib = self.values[:, None] * w[self.indices]
+        out = np.zeros((self.n, w.shape[1]), dtype=np.float64)
+        np.add.at(out, self.row_of, contrib)
+        return out
+
+    def tdot(self, g: np.ndarray, dim: int) -> np.ndarray:
+        # (dim, n) @ (n, k)
+        out = np.zeros((dim, g.shape[1]), dtype=np.float64)
+        np.add.at(out, self.indices, self.values[:, None] * g[self.row_of])
+        return out
+
+
+def _softmax(z: np.ndarray) -> np.ndarray:
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+class RouteModel:
+    # tf-idf sobre n-gramas con hashing + regresion logistica multinomial
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, idf: np.ndarray, labels: list[str], meta: dict):
+        self.weights = weights
+        self.bias = bias
+        self.idf = idf
+        self.labels = labels
+        self.meta = meta
+        self.dim = idf.shape[0]
+
+    def predict_proba(self, text: str) -> np.ndarray:
+        idx, val = _hashed(text, self.dim)
+        val = val * self.idf[idx]
+        val = val / max(float(np.sqrt((val ** 2).sum())), 1e-12)
+        return _softmax((val @ self.weights[idx] + self.bias)[None, :])[0]
+
+    def predict(self, text: str) -> tuple[str, float]:
+        proba = self.predict_proba(text)
+        best = int(proba.argmax())
+        return self.labels[best], float(proba[best])
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path,
+            weights=self.weights.astype(np.float32),
+            bias=self.bias.astype(np.float32),
+            idf=self.idf.astype(np.float32),
+            meta=np.array(json.dumps({**self.meta, "labels": self.labels})),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "RouteModel":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("format_version") != MODEL_FORMAT_VERSION:
+                raise ValueError(
+                    f"Formato de modelo {meta.get('format_version')} no soportado (se espera {MODEL_FORMAT_VERSION})"
+                )
+            return cls(data["weights"], data["bias"], data["idf"], meta.pop("labels"), meta)
+
+    @classmethod
+    def train(
+        cls,
+        texts: list[str],
+        labels: list[str],
+        dim: int = 2 ** 16,
+        epochs: int = 300,
+        lr: float = 0.05,
+        l2: float = 1e-4,
+    ) -> "RouteModel":
+        y = np.array([LABELS.index(label) for label in labels])
+        x = _Csr([_hashed(t, dim) for t in texts])
+
+        df = np.bincount(x.indices, minlength=dim)
+        idf = (np.log((1 + x.n) / (1 + df)) + 1.0).astype(np.float32)
+        x.scale(idf)
+
+        # pesos por clase balanceados: las rutas no estan equilibradas en los logs
+        class_counts = np.bincount(y, minlength=len(LABELS))
+        sample_w = (len(y) / (len(LABELS) * np.maximum(class_counts, 1)))[y]
+        onehot = np.eye(len(LABELS))[y]
+
+        w = np.zeros((dim, len(LABELS)))
+        b = np.zeros(len(LABELS))
+        m_w, v_w = np.zeros_like(w), np.zeros_like(w)
+        m_b, v_b = np.zeros_like(b), np.zeros_like(b)
+        for step in range(1, epochs + 1):
+            grad = (_softmax(x.dot(w) + b) - onehot) * sample_w[:, None] / x.n
+            g_w = x.tdot(grad, dim) + l2 * w
+            g_b = grad.sum(axis=0)
+            # adam
+            m_w, v_w = 0.9 * m_w + 0.1 * g_w, 0.999 * v_w + 0.001 * g_w ** 2
+            m_b, v_b = 0.9 * m_b + 0.1 * g_b, 0.999 * v_b + 0.001 * g_b ** 2
+            corr = np.sqrt(1 - 0.999 ** step) / (1 - 0.9 ** step)
+            w -= lr * corr * m_w / (np.sqrt(v_w) + 1e-8)
+            b -= lr * corr * m_b / (np.sqrt(v_b) + 1e-8)
+
+        meta = {
+            "format_version": MODEL_FORMAT_VERSION,
+            "created_at": time.time(),
+            "dim": dim,
+            "epochs": epochs,
+            "train_size": int(x.n),
+            "class_counts": {LABELS[i]: int(c) for i, c in enumerate(class_counts)},
+        }
+        return cls(w.astype(np.float32), b.astype(np.float32), idf, list(LABELS), meta)
+
+
+def load_route_model(path: str = ROUTE_MODEL_PATH) -> RouteModel | None:
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        return RouteModel.load(path)
+    except Exception as e:
+        warnings.warn(f"No se pudo cargar el modelo de rutas '{path}': {e}", RuntimeWarning, stacklevel=2)
+        return None
+
+
+def _load_log_examples(path: str) -> list[tuple[str, str, str]]:
+    examples = []
+    with open(path, "r", encoding="utf-8") as fh:
+        for line in fh:
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            prompt = rec.get("prompt")
+            if not prompt:
+                continue
+            if rec.get("type") == "classification" and rec.get("route") in RUTAS and rec.get("source", "llm") == "llm":
+                examples.append((prompt, rec["route"], prompt))
+            elif rec.get("type") == "sensitive_info_detected":
+                examples.append((prompt, "malicious_request", prompt))
+    return examples
+
+
+def _load_case_examples(cases_path: str, templates_path: str | None) -> list[tuple[str, str, str]]:
+    with open(cases_path, "r", encoding="utf-8") as fh:
+        cases = json.load(fh).get("cases", [])
+    templates = []
+    if templates_path:
+        with open(templates_path, "r", encoding="utf-8") as fh:
+            templates = [t.get("template", "") for t in json.load(fh).get("templates", [])]
+
+    examples = []
+    for case in cases:
+        prompt, route = case.get("prompt", ""), case.get("expected_route")
+        if not prompt or route not in RUTAS:
+            continue
+        # el caso original es el grupo de todas sus variantes: van juntas a train o a holdout
+        examples.append((prompt, route, prompt))
+        examples += [(t.format(user_prompt=prompt), route, prompt) for t in templates if t]
+    return examples
+
+
+def _train_cli(args: argparse.Namespace) -> int:
+    examples = []
+    for path in args.logs:
+        if os.path.exists(path):
+            examples += _load_log_examples(path)
+    if args.cases:
+        examples += _load_case_examples(args.cases, args.templates)
+
+    # la ultima etiqueta vista para un prompt gana (los logs pueden repetir prompts)
+    dedup = {prompt: (route, group) for prompt, route, group in examples}
+    texts = list(dedup.keys())
+    labels = [route for route, _ in dedup.values()]
+    groups = [group for _, group in dedup.values()]
+    if len(set(labels)) < 2:
+        print("Se necesitan ejemplos de al menos dos rutas para entrenar.")
+        return 1
+
+    # el holdout se reparte por grupo: una plantilla del mismo caso en train inflaria la precision
+    rng = np.random.default_rng(args.seed)
+    group_ids = sorted(set(groups))
+    held = {group_ids[i] for i in rng.permutation(len(group_ids))[:int(len(group_ids) * args.holdout)]}
+    holdout = [i for i, g in enumerate(groups) if g in held]
+    train = [i for i, g in enumerate(groups) if g not in held]
+    n_holdout = len(holdout)
+
+    model = RouteModel.train(
+        [texts[i] for i in train], [labels[i] for i in train],
+        dim=args.dim, epochs=args.epochs,
+    )
+    if n_holdout:
+        preds = [model.predict(texts[i]) for i in holdout]
+        acc = np.mean([p[0] == labels[i] for p, i in zip(preds, holdout)])
+        confident = [(p, i) for p, i in zip(preds, holdout) if p[1] >= args.threshold]
+        conf_acc = np.mean([p[0] == labels[i] for p, i in confident]) if confident else float("nan")
+        model.meta["holdout"] = {
+            "size": n_holdout,
+            "accuracy": float(acc),
+            "fast_path_rate": len(confident) / n_holdout,
+            "fast_path_accuracy": float(conf_acc),
+            "threshold": args.threshold,
+        }
+        print(
+            f"holdout={n_holdout} accuracy={acc:.3f} "
+            f"fast_path_rate={len(confident) / n_holdout:.3f} fast_path_accuracy={conf_acc:.3f}"
+        )
+
+    model.save(args.out)
+    print(f"Modelo guardado en {args.out} ({model.meta['train_size']} ejemplos, {model.meta['class_counts']})")
+    return 0
+
+
+def _predict_cli(args: argparse.Namespace) -> int:
+    model = RouteModel.load(args.model)
+    for text in args.text:
+        label, prob = model.predict(text)
+        print(f"{label}\t{prob:.3f}\t{text}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clasificador local de rutas (camino rapido antes del LLM).")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train_p = sub.add_parser("train", help="Entrena a partir de logs/logs.jsonl y los casos de seguridad.")
+    train_p.add_argument("--logs", nargs="*", default=[os.path.join("logs", "logs.jsonl")])
+    train_p.add_argument("--cases", default=os.path.join("tests", "safety_cases.json"))
+    train_p.add_argument("--templates", default=os.path.join("tests", "label_injection.json"))
+    train_p.add_argument("--out", default=ROUTE_MODEL_PATH)
+    train_p.add_argument("--dim", type=int, default=2 ** 16)
+    train_p.add_argument("--epochs", type=int, default=300)
+    train_p.add_argument("--holdout", type=float, default=0.2)
+    train_p.add_argument("--threshold", type=float, default=ROUTE_MODEL_THRESHOLD)
+    train_p.add_argument("--seed", type=int, default=0)
+
+    predict_p = sub.add_parser("predict", help="Clasifica textos con un modelo entrenado.")
+    predict_p.add_argument("text", nargs="+")
+    predict_p.add_argument("--model", default=ROUTE_MODEL_PATH)
+
+    args = parser.parse_args()
+    raise SystemExit(_train_cli(args) if args.command == "train" else _predict_cli(args))
@@ -0,0 +1,371 @@
+import asyncio
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any
+
+# ventana de mensajes que usa el orquestador por sesion
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "6"))
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "10000"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# memory (un solo proceso) o sqlite (compartido entre workers)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+SESSION_SWEEP_EVERY = int(os.getenv("SESSION_SWEEP_EVERY", "200"))
+
+# coste fijo aproximado de cada mensaje (dict + claves)
+_MESSAGE_OVERHEAD = 232
+
+
+def _message_size(msg: dict) -> int:
+    return (
+        _MESSAGE_OVERHEAD
+        + sys.getsizeof(msg.get("role", ""))
+        + sys.getsizeof(msg.get("content", ""))
+    )
+
+
+class _Session:
+    __slots__ = ("messages", "nbytes", "last_access")
+
+    def __init__(self, max_messages: int):
+        self.messages: deque[dict] = deque(maxlen=max_messages)
+        self.nbytes = 0
+        self.last_access = time.monotonic()
+
+
+class MemorySessionStore:
+    # buffer circular por sesion + LRU global con TTL por inactividad y techo de memoria
+
+    def __init__(
+        self,
+        max_messages: int = SESSION_MAX_MESSAGES,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        max_bytes: int = SESSION_MAX_BYTES,
+    ):
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+
+        self._sessions: OrderedDict[str, _Session] = OrderedDict()
+        self._nbytes = 0
+        self._counters = {
+            "appended": 0,
+            "trimmed_messages": 0,
+            "evicted_ttl": 0,
+            "evicted_lru": 0,
+            "evicted_memory": 0,
+        }
+
+    def _touch(self, session_id: str) -> _Session | None:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        if self._expired(session, time.monotonic()):
+            self._drop(session_id, "evicted_ttl")
+            return None
+        session.last_access = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _expired(self, session: _Session, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - session.last_access > self.ttl_seconds
+
+    def _drop(self, session_id: str, reason: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            return
+        self._nbytes -= session.nbytes
+        self._counters[reason] += 1
+
+    def _evict(self) -> None:
+        # el frente del OrderedDict es la sesion con acceso mas antiguo
+        now = time.monotonic()
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if not self._expired(oldest, now):
+                break
+            self._drop(oldest_id, "evicted_ttl")
+
+        while len(self._sessions) > self.max_sessions:
+            self._drop(next(iter(self._sessions)), "evicted_lru")
+
+        # nunca se expulsa la sesion recien usada (ultima posicion)
+        while self._nbytes > self.max_bytes and len(self._sessions) > 1:
+            self._drop(next(iter(self._sessions)), "evicted_memory")
+
+    def append(self, session_id: str, message: dict) -> None:
+        session = self._touch(session_id)
+        if session is None:
+            session = _Session(self.max_messages)
+            self._sessions[session_id] = session
+
+        if len(session.messages) == session.messages.maxlen:
+            dropped = _message_size(session.messages[0])
+            session.nbytes -= dropped
+            self._nbytes -= dropped
+            self._counters["trimmed_messages"] += 1
+
+        size = _message_size(message)
+        session.messages.append(message)
+        session.nbytes += size
+        self._nbytes += size
+        self._counters["appended"] += 1
+        self._evict()
+
+    def window(self, session_id: str, n: int | None = None) -> list[dict]:
+        session = self._touch(session_id)
+        if session is None:
+            return []
+        messages = list(session.messages)
+        if n is not None:
+            messages = messages[-n:]
+        return messages
+
+    # en memoria no hay E/S: la version async solo iguala la interfaz con SqliteSessionStore
+    async def aappend(self, session_id: str, message: dict) -> None:
+        self.append(session_id, message)
+
+    async def awindow(self, session_id: str, n: int | None = None) -> list[dict]:
+        return self.window(session_id, n)
+
+    async def asnapshot(self) -> dict[str, list[dict]]:
+        return self.snapshot()
+
+    async def aclear(self) -> None:
+        self.clear()
+
+    async def astats(self) -> dict[str, Any]:
+        return self.stats()
+
+    def snapshot(self) -> dict[str, list[dict]]:
+        self._evict()
+        return {sid: list(s.messages) for sid, s in self._sessions.items()}
+
+    def clear(self) -> None:
+        self._sessions.clear()
+        self._nbytes = 0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "messages": sum(len(s.messages) for s in self._sessions.values()),
+            "bytes": self._nbytes,
+            "max_bytes": self.max_bytes,
+            "max_sessions": self.max_sessions,
+            "max_messages": self.max_messages,
+            "ttl_seconds": self.ttl_seconds,
+            **self._counters,
+        }
+
+
+class SqliteSessionStore:
+    # backend compartido entre procesos: sqlite en modo WAL, una conexion por proceso
+    # las lecturas no bloquean a los escritores y cada append es una transaccion
+
+    def __init__(
+        self,
+        path: str = SESSION_DB_PATH,
+        max_messages: int = SESSION_MAX_MESSAGES,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        ttl_seconds: float = SESSION_TTL_SECONDS,
+        sweep_every: int = SESSION_SWEEP_EVERY,
+    ):
+        self.path = path
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.sweep_every = max(1, sweep_every)
+
+        self._conn_obj: sqlite3.Connection | None = None
+        self._conn_pid: int | None = None
+        self._appends_since_sweep = 0
+        # una sola conexion compartida por los hilos de aappend/awindow: sus transacciones no se pueden solapar
+        self._lock = threading.RLock()
+        self._counters = {
+            "appended": 0,
+            "trimmed_messages": 0,
+            "evicted_ttl": 0,
+            "evicted_lru": 0,
+        }
+
+    def _conn(self) -> sqlite3.Connection:
+        # tras un fork (workers de uvicorn) no se reutiliza la conexion del padre
+        if self._conn_obj is not None and self._conn_pid == os.getpid():
+            return self._conn_obj
+
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS session_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_session_messages_session
+                ON session_messages(session_id, id);
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL,
+                n_messages INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_sessions_last_access ON sessions(last_access);
+        """)
+        self._conn_obj = conn
+        self._conn_pid = os.getpid()
+        return conn
+
+    def append(self, session_id: str, message: dict) -> None:
+        with self._lock:
+            self._append(session_id, message)
+
+    def _append(self, session_id: str, message: dict) -> None:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO session_messages (session_id, role, content) VALUES (?, ?, ?)",
+                (session_id, message.get("role", ""), message.get("content", "")),
+            )
+            n_messages = conn.execute("""
+                INSERT INTO sessions (session_id, last_access, n_messages) VALUES (?, ?, 1)
+                ON CONFLICT(session_id) DO UPDATE SET
+                    last_access = excluded.last_access,
+                    n_messages = n_messages + 1
+                RETURNING n_messages
+            """, (session_id, now)).fetchone()[0]
+
+            # buffer circular: se borra todo lo anterior a los ultimos max_messages
+            if n_messages > self.max_messages:
+                cur = conn.execute("""
+                    DELETE FROM session_messages
+                    WHERE session_id = ? AND id <= (
+                        SELECT id FROM session_messages WHERE session_id = ?
+                        ORDER BY id DESC LIMIT 1 OFFSET ?
+                    )
+                """, (session_id, session_id, self.max_messages))
+                conn.execute(
+                    "UPDATE sessions SET n_messages = ? WHERE session_id = ?",
+                    (self.max_messages, session_id),
+                )
+                self._counters["trimmed_messages"] += cur.rowcount
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._counters["appended"] += 1
+        self._appends_since_sweep += 1
+        if self._appends_since_sweep >= self.sweep_every:
+            self._appends_since_sweep = 0
+            self._evict()
+
+    def _delete_sessions(self, conn: sqlite3.Connection, where: str, params: tuple) -> int:
+        conn.execute(f"""
+            DELETE FROM session_messages WHERE session_id IN (
+                SELECT session_id FROM sessions WHERE {where}
+            )
+        """, params)
+        return conn.execute(f"DELETE FROM sessions WHERE {where}", params).rowcount
+
+    def _evict(self) -> None:
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.ttl_seconds > 0:
+                self._counters["evicted_ttl"] += self._delete_sessions(
+                    conn, "last_access < ?", (time.time() - self.ttl_seconds,)
+                )
+            self._counters["evicted_lru"] += self._delete_sessions(
+                conn,
+                "session_id IN (SELECT session_id FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def window(self, session_id: str, n: int | None = None) -> list[dict]:
+        with self._lock:
+            rows = self._conn().execute("""
+                SELECT role, content FROM session_messages
+                WHERE session_id = ? ORDER BY id DESC LIMIT ?
+            """, (session_id, n if n is not None else self.max_messages)).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    # BEGIN IMMEDIATE puede esperar hasta 5 s al lock de escritura: fuera del event loop
+    async def aappend(self, session_id: str, message: dict) -> None:
+        await asyncio.to_thread(self.append, session_id, message)
+
+    async def awindow(self, session_id: str, n: int | None = None) -> list[dict]:
+        return await asyncio.to_thread(self.window, session_id, n)
+
+    async def asnapshot(self) -> dict[str, list[dict]]:
+        return await asyncio.to_thread(self.snapshot)
+
+    async def aclear(self) -> None:
+        await asyncio.to_thread(self.clear)
+
+    async def astats(self) -> dict[str, Any]:
+        return await asyncio.to_thread(self.stats)
+
+    def snapshot(self) -> dict[str, list[dict]]:
+        self._evict()
+        out: dict[str, list[dict]] = {}
+        with self._lock:
+            rows = self._conn().execute(
+                "SELECT session_id, role, content FROM session_messages ORDER BY session_id, id"
+            ).fetchall()
+        for session_id, role, content in rows:
+            out.setdefault(session_id, []).append({"role": role, "content": content})
+        return out
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM session_messages")
+            conn.execute("DELETE FROM sessions")
+            conn.execute("COMMIT")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            conn = self._conn()
+            sessions = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            messages = conn.execute("SELECT COUNT(*) FROM session_messages").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "pid": os.getpid(),
+            "sessions": sessions,
+            "messages": messages,
+            "max_sessions": self.max_sessions,
+            "max_messages": self.max_messages,
+            "ttl_seconds": self.ttl_seconds,
+            # contadores locales a este proceso
+            **self._counters,
+        }
+
+
+def create_session_store(max_messages: int = SESSION_MAX_MESSAGES):
+    if SESSION_BACKEND == "sqlite":
+        return SqliteSessionStore(max_messages=max_messages)
+    if SESSION_BACKEND != "memory":
+        raise ValueError(f"SESSION_BACKEND desconocido: '{SESSION_BACKEND}' (usa memory o sqlite)")
+    return MemorySessionStore(max_messages=max_messages)
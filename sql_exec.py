@@ -0,0 +1,211 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Hashable
+
+from db_profile import connect, DbMaintenance
+from sql_guard import SQL_READ_ONLY
+
+SQL_DB_PATH = os.getenv("SQL_DB_PATH", "clients.db")
+SQL_POOL_SIZE = int(os.getenv("SQL_POOL_SIZE", "4"))
+SQL_QUERY_TIMEOUT = float(os.getenv("SQL_QUERY_TIMEOUT", "10"))
+# cada cuantas instrucciones de la VM de sqlite se comprueba el timeout
+SQL_PROGRESS_STEPS = int(os.getenv("SQL_PROGRESS_STEPS", "1000"))
+
+
+class SqlTimeoutError(Exception):
+    pass
+
+
+class SqlExecutor:
+    # pool acotado de conexiones reutilizables: una por hilo del pool (thread-local),
+    # asi ninguna consulta bloquea el event loop y nunca hay mas de pool_size conexiones
+
+    def __init__(
+        self,
+        db_path: str = SQL_DB_PATH,
+        pool_size: int = SQL_POOL_SIZE,
+        timeout: float = SQL_QUERY_TIMEOUT,
+        progress_steps: int = SQL_PROGRESS_STEPS,
+        read_only: bool = SQL_READ_ONLY,
+    ):
+        self.db_path = db_path
+        self.read_only = read_only
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.progress_steps = max(1, progress_steps)
+
+        self._executor: ThreadPoolExecutor | None = None
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._conn_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        # conexion que solo lee PRAGMA data_version: cambia cuando cualquier otra conexion
+        # (del pool o de otro proceso) confirma cambios
+        self._monitor: sqlite3.Connection | None = None
+        self._monitor_lock = threading.Lock()
+        self.write_generation = 0
+        # single-flight: consultas identicas en curso comparten resultado
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+
+        self._in_flight = 0
+        self._busy = 0
+        self._counters = {
+            "submitted": 0,
+            "completed": 0,
+            "errors": 0,
+            "timeouts": 0,
+            "deduplicated": 0,
+            "max_busy": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "exec_seconds_total": 0.0,
+            "exec_seconds_max": 0.0,
+        }
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="sql")
+        return self._executor
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = connect(self.db_path, read_only=self.read_only, check_same_thread=False)
+            self._local.conn = conn
+            with self._conn_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _call(self, fn: Callable, args: tuple, timeout: float, submitted_at: float) -> Any:
+        started = time.monotonic()
+        wait = started - submitted_at
+        with self._stats_lock:
+            self._busy += 1
+            self._counters["max_busy"] = max(self._counters["max_busy"], self._busy)
+            self._counters["wait_seconds_total"] += wait
+            self._counters["wait_seconds_max"] = max(self._counters["wait_seconds_max"], wait)
+
+        conn = self._conn()
+        deadline = started + timeout
+        timed_out = False
+
+        def _progress() -> int:
+            nonlocal timed_out
+            if time.monotonic() > deadline:
+                timed_out = True
+                return 1 # sqlite interrumpe la consulta
+            return 0
+
+        if timeout > 0:
+            conn.set_progress_handler(_progress, self.progress_steps)
+        changes_before = conn.total_changes
+        try:
+            return fn(conn, *args)
+        except sqlite3.OperationalError as e:
+            if timed_out:
+                raise SqlTimeoutError(f"Consulta cancelada tras {timeout:g}s") from e
+            raise
+        finally:
+            if timeout > 0:
+                conn.set_progress_handler(None, 0)
+            if conn.total_changes != changes_before:
+                with self._stats_lock:
+                    self.write_generation += 1
+            elapsed = time.monotonic() - started
+            with self._stats_lock:
+                self._counters["exec_seconds_total"] += elapsed
+                self._counters["exec_seconds_max"] = max(self._counters["exec_seconds_max"], elapsed)
+                self._busy -= 1
+
+    async def _submit(self, fn: Callable, args: tuple, timeout: float) -> Any:
+        loop = asyncio.get_running_loop()
+        self._counters["submitted"] += 1
+        self._in_flight += 1
+        try:
+            result = await loop.run_in_executor(
+                self._pool(), self._call, fn, args, timeout, time.monotonic()
+            )
+            self._counters["completed"] += 1
+            return result
+        except SqlTimeoutError:
+            self._counters["timeouts"] += 1
+            raise
+        except Exception:
+            self._counters["errors"] += 1
+            raise
+        finally:
+            self._in_flight -= 1
+
+    async def run(
+        self,
+        fn: Callable[..., Any],
+        *args: Any,
+        timeout: float | None = None,
+        key: Hashable | None = None,
+    ) -> Any:
+        # fn(conn, *args) se ejecuta en un hilo del pool con su conexion reutilizable
+        timeout = self.timeout if timeout is None else timeout
+        if key is None:
+            return await self._submit(fn, args, timeout)
+
+        shared = self._inflight.get(key)
+        if shared is not None:
+            self._counters["deduplicated"] += 1
+            return await asyncio.shield(shared)
+
+        shared = asyncio.ensure_future(self._submit(fn, args, timeout))
+        self._inflight[key] = shared
+        shared.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(shared)
+
+    def _read_data_version(self) -> int:
+        with self._monitor_lock:
+            if self._monitor is None:
+                self._monitor = connect(self.db_path, read_only=True, check_same_thread=False)
+            return self._monitor.execute("PRAGMA data_version").fetchone()[0]
+
+    async def data_version(self) -> tuple[int, int]:
+        # (data_version del monitor, escrituras hechas desde el pool)
+        loop = asyncio.get_running_loop()
+        version = await loop.run_in_executor(self._pool(), self._read_data_version)
+        return version, self.write_generation
+
+    async def close(self) -> None:
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, True)
+            self._executor = None
+        with self._conn_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        with self._monitor_lock:
+            if self._monitor is not None:
+                self._monitor.close()
+                self._monitor = None
+        self._local = threading.local()
+
+    def stats(self) -> dict[str, Any]:
+        completed = max(1, self._counters["completed"] + self._counters["errors"] + self._counters["timeouts"])
+        return {
+            "db_path": self.db_path,
+            "read_only": self.read_only,
+            "pool_size": self.pool_size,
+            "connections": len(self._connections),
+            "in_flight": self._in_flight,
+            "busy": self._busy,
+            "queued": max(0, self._in_flight - self._busy),
+            "utilization": self._busy / self.pool_size,
+            "timeout_seconds": self.timeout,
+            "write_generation": self.write_generation,
+            **self._counters,
+            "wait_seconds_avg": self._counters["wait_seconds_total"] / completed,
+            "exec_seconds_avg": self._counters["exec_seconds_total"] / completed,
+        }
+
+
+sql_executor = SqlExecutor()
+db_maintenance = DbMaintenance(SQL_DB_PATH)
@@ -0,0 +1,300 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any
+
+SQL_READ_ONLY = os.getenv("SQL_READ_ONLY", "true").lower() in {"1", "true", "yes"}
+SQL_GUARD_ENABLED = os.getenv("SQL_GUARD_ENABLED", "true").lower() in {"1", "true", "yes"}
+# que hacer por encima de SQL_GUARD_MAX_COST: reject | limit | budget
+SQL_GUARD_ACTION = os.getenv("SQL_GUARD_ACTION", "limit").lower()
+SQL_GUARD_MAX_COST = float(os.getenv("SQL_GUARD_MAX_COST", "1e6"))
+# por encima de este coste se rechaza siempre, sea cual sea la accion
+SQL_GUARD_REJECT_COST = float(os.getenv("SQL_GUARD_REJECT_COST", "1e9"))
+SQL_GUARD_LIMIT_ROWS = int(os.getenv("SQL_GUARD_LIMIT_ROWS", "1000"))
+SQL_GUARD_BUDGET_SECONDS = float(os.getenv("SQL_GUARD_BUDGET_SECONDS", "2"))
+SQL_GUARD_LARGE_TABLE_ROWS = int(os.getenv("SQL_GUARD_LARGE_TABLE_ROWS", "10000"))
+SQL_GUARD_TABLE_STATS_TTL = float(os.getenv("SQL_GUARD_TABLE_STATS_TTL", "60"))
+
+ACTIONS = ("reject", "limit", "budget")
+
+# filas por busqueda en un indice cuando no hay sqlite_stat1
+_DEFAULT_INDEX_FANOUT = 10
+# filas supuestas para tablas temporales, vistas y CTE
+_UNKNOWN_ROWS = 1000
+
+_READ_START = re.compile(r"^\s*\(*\s*(select|with|values)\b", re.IGNORECASE)
+# literales e identificadores entre comillas van primero: un -- o /* dentro de ellos no es comentario
+_SQL_PARTS = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|`[^`]*`|\[[^\]]*\]|(--[^\n]*|/\*.*?(?:\*/|$))|[^'\"`\[/-]+|.",
+    re.DOTALL,
+)
+# con estos el LIMIT exterior no recorta trabajo: hay que calcularlo todo antes de la primera fila
+_AGGREGATE = re.compile(
+    r"\b(?:count|sum|avg|total|min|max|group_concat|string_agg)\s*\(|\bgroup\s+by\b|\bdistinct\b|\bover\b",
+    re.IGNORECASE,
+)
+_TABLE_REF = re.compile(
+    r"\b(?:from|join)\s+[\"`\[]?(\w+)[\"`\]]?(?:\s+(?:as\s+)?[\"`\[]?(\w+)[\"`\]]?)?|"
+    r",\s*[\"`\[]?(\w+)[\"`\]]?(?:\s+(?:as\s+)?[\"`\[]?(\w+)[\"`\]]?)?",
+    re.IGNORECASE,
+)
+_LOOP = re.compile(r"^(SCAN|SEARCH) (\w+)(?: AS (\w+))?(.*)$")
+
+_ALLOWED_AUTH = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+}
+
+
+class QueryRejected(Exception):
+    def __init__(self, reason: str, decision: dict[str, Any]):
+        super().__init__(reason)
+        self.reason = reason
+        self.decision = decision
+
+
+_stats_lock = threading.Lock()
+_guard_stats: dict[str, Any] = {
+    "checked": 0,
+    "allowed": 0,
+    "refused_write": 0,
+    "rejected": 0,
+    "limited": 0,
+    "budgeted": 0,
+    "explain_seconds_total": 0.0,
+}
+_table_rows: dict[tuple[str, str], tuple[float, int]] = {}
+
+
+def _count(key: str) -> None:
+    with _stats_lock:
+        _guard_stats[key] += 1
+
+
+def _strip_sql(sql: str) -> str:
+    parts = []
+    for m in _SQL_PARTS.finditer(sql):
+        parts.append(" " if m.group(1) else m.group(0))
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def _without_literals(sql: str) -> str:
+    return "".join("''" if m.group(0)[0] == "'" else m.group(0) for m in _SQL_PARTS.finditer(sql))
+
+
+def _limit_helps(stripped: str, findings: list[str]) -> bool:
+    return "temp_btree" not in findings and not _AGGREGATE.search(_without_literals(stripped))
+
+
+def _authorizer(action: int, arg1, arg2, db_name, trigger) -> int:
+    # se evalua al preparar la sentencia, sin ejecutarla: detecta escrituras escondidas
+    # en un WITH ... DELETE o similares
+    if action in _ALLOWED_AUTH:
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_PRAGMA and arg2 is None: # lectura de pragma
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+
+def _aliases(sql: str, tables: set[str]) -> dict[str, str]:
+    aliases = {t: t for t in tables}
+    for m in _TABLE_REF.finditer(sql):
+        name, alias = (m.group(1), m.group(2)) if m.group(1) else (m.group(3), m.group(4))
+        if name and name.lower() in tables:
+            aliases[name.lower()] = name.lower()
+            if alias:
+                aliases[alias.lower()] = name.lower()
+    return aliases
+
+
+def _table_rows_estimate(conn: sqlite3.Connection, db_key: str, table: str) -> int:
+    now = time.monotonic()
+    cached = _table_rows.get((db_key, table))
+    if cached and now - cached[0] < SQL_GUARD_TABLE_STATS_TTL:
+        return cached[1]
+    rows = None
+    try: # sqlite_stat1 solo existe tras ANALYZE
+        stat = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,)).fetchone()
+        if stat and stat[0]:
+            rows = int(stat[0].split()[0])
+    except sqlite3.Error:
+        pass
+    if rows is None:
+        try: # O(log n) sobre el b-tree de rowid
+            rows = conn.execute(f'SELECT max(rowid) FROM "{table}"').fetchone()[0] or 0
+        except sqlite3.Error:
+            rows = _UNKNOWN_ROWS
+    _table_rows[(db_key, table)] = (now, rows)
+    return rows
+
+
+def _index_fanout(conn: sqlite3.Connection, index: str | None) -> float | None:
+    if not index:
+        return None
+    try:
+        stat = conn.execute("SELECT stat FROM sqlite_stat1 WHERE idx = ?", (index,)).fetchone()
+    except sqlite3.Error:
+        return None
+    if stat and stat[0]:
+        parts = stat[0].split()
+        if len(parts) > 1:
+            return float(parts[1])
+    return None
+
+
+def _loop_factor(conn, db_key, detail, aliases, findings, nested: bool) -> tuple[float, float]:
+    # (filas que produce el bucle, coste extra fuera del producto, p.ej. crear un indice)
+    m = _LOOP.match(detail)
+    name = m.group(2).lower()
+    table = aliases.get(name) or aliases.get((m.group(3) or "").lower())
+    rows = _table_rows_estimate(conn, db_key, table) if table else _UNKNOWN_ROWS
+    rest = m.group(4)
+    large = rows >= SQL_GUARD_LARGE_TABLE_ROWS
+
+    if m.group(1) == "SCAN":
+        if large:
+            findings.append(f"full_scan:{table or name}")
+            if nested:
+                findings.append(f"join_without_index:{table or name}")
+        return max(1, rows), 0.0
+
+    if "AUTOMATIC" in rest:
+        # sqlite crea un indice temporal porque no existe uno util
+        findings.append(f"missing_index:{table or name}")
+        return _DEFAULT_INDEX_FANOUT, float(rows)
+    equality = re.search(r"\(([^)]*)\)", rest)
+    cond = equality.group(1) if equality else ""
+    if "PRIMARY KEY" in rest and "=" in cond and "<" not in cond and ">" not in cond:
+        return 1, 0.0
+    if "<" in cond or ">" in cond:
+        return max(1, rows / 4), 0.0
+    index = re.search(r"INDEX (\w+)", rest)
+    fanout = _index_fanout(conn, index.group(1) if index else None)
+    return (fanout if fanout is not None else min(max(1, rows), _DEFAULT_INDEX_FANOUT)), 0.0
+
+
+def _plan_cost(conn, db_key, plan, aliases, findings) -> float:
+    children: dict[int, list[tuple]] = {}
+    for row in plan:
+        children.setdefault(row[1], []).append(row)
+
+    def group_cost(parent: int, outer: float) -> float:
+        product, extra = 1.0, 0.0
+        loops = 0
+        for node_id, _, _, detail in children.get(parent, []):
+            if detail.startswith("SCAN CONSTANT ROW"):
+                continue
+            if _LOOP.match(detail):
+                factor, cost = _loop_factor(conn, db_key, detail, aliases, findings, nested=loops > 0)
+                product *= factor
+                extra += cost * outer
+                loops += 1
+                continue
+            if "TEMP B-TREE" in detail:
+                extra += product * outer * math.log2(max(2.0, product * outer))
+                findings.append("temp_btree")
+            # subconsultas, co-rutinas y materializaciones: las correlacionadas se repiten
+            # por cada fila del bucle exterior
+            repeat = outer * product if "CORRELATED" in detail else 1.0
+            extra += group_cost(node_id, repeat)
+        if loops > 1 and product * outer > SQL_GUARD_MAX_COST:
+            findings.append(f"join_fanout:{loops}")
+        return product * outer + extra
+
+    return group_cost(0, 1.0)
+
+
+def analyze_sql(conn: sqlite3.Connection, sql: str, action: str = SQL_GUARD_ACTION) -> dict[str, Any]:
+    # se ejecuta en un hilo de sql_executor; EXPLAIN QUERY PLAN solo prepara la sentencia
+    _count("checked")
+    stripped = _strip_sql(sql)
+    decision: dict[str, Any] = {
+        "action": "allow",
+        "sql": sql,
+        "timeout": None,
+        "cost": 0.0,
+        "findings": [],
+        "plan": [],
+    }
+
+    if SQL_READ_ONLY and not _READ_START.match(stripped):
+        # descarte barato antes de tocar la base de datos
+        decision["action"] = "refuse_write"
+        _count("refused_write")
+        raise QueryRejected("Solo se permiten consultas de lectura (SELECT)", decision)
+
+    started = time.monotonic()
+    if SQL_READ_ONLY:
+        conn.set_authorizer(_authorizer)
+    try:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {stripped}").fetchall()
+    except sqlite3.DatabaseError as e:
+        if SQL_READ_ONLY and "not authorized" in str(e):
+            decision["action"] = "refuse_write"
+            _count("refused_write")
+            raise QueryRejected("Solo se permiten consultas de lectura (SELECT)", decision) from e
+        raise
+    finally:
+        if SQL_READ_ONLY:
+            conn.set_authorizer(None)
+    decision["plan"] = [row[3] for row in plan]
+
+    if not SQL_GUARD_ENABLED:
+        _count("allowed")
+        return decision
+
+    tables = {
+        r[0].lower() for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    db_key = conn.execute("PRAGMA database_list").fetchone()[2] or ":memory:"
+    findings: list[str] = []
+    cost = _plan_cost(conn, db_key, plan, _aliases(stripped, tables), findings)
+    decision["cost"] = cost
+    decision["findings"] = sorted(set(findings))
+    with _stats_lock:
+        _guard_stats["explain_seconds_total"] += time.monotonic() - started
+
+    if cost <= SQL_GUARD_MAX_COST:
+        _count("allowed")
+        return decision
+
+    action = action if action in ACTIONS else "limit"
+    if action == "limit" and not _limit_helps(stripped, findings):
+        decision["findings"].append("limit_ineffective")
+        action = "budget"
+    if cost > SQL_GUARD_REJECT_COST or action == "reject":
+        decision["action"] = "reject"
+        _count("rejected")
+        raise QueryRejected(
+            f"Consulta rechazada: coste estimado {cost:.3g} filas ({', '.join(decision['findings']) or 'sin detalle'})",
+            decision,
+        )
+    if action == "limit":
+        decision["action"] = "limit"
+        decision["sql"] = f"SELECT * FROM (\n{stripped}\n) LIMIT {SQL_GUARD_LIMIT_ROWS}"
+        # el LIMIT no acota el tiempo hasta la primera fila (p.ej. un join sin indice)
+        decision["timeout"] = SQL_GUARD_BUDGET_SECONDS
+        _count("limited")
+    else:
+        decision["action"] = "budget"
+        decision["timeout"] = SQL_GUARD_BUDGET_SECONDS
+        _count("budgeted")
+    return decision
+
+
+def guard_stats() -> dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_guard_stats)
+    return {
+        "read_only": SQL_READ_ONLY,
+        "enabled": SQL_GUARD_ENABLED,
+        "action": SQL_GUARD_ACTION,
+        "max_cost": SQL_GUARD_MAX_COST,
+        "reject_cost": SQL_GUARD_REJECT_COST,
+        **stats,
+    }
@@ -0,0 +1,87 @@
+from collections import deque
+from typing import Iterable
+
+
+class SensitiveTermMatcher:
+    # automata Aho-Corasick construido una vez a partir de la lista de terminos
+    # cada stream mantiene solo su estado actual (un entero) entre tokens
+
+    def __init__(self, terms: Iterable[str]):
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[str | None] = [None]
+
+        for term in terms:
+            term_l = (term or "").lower()
+            if not term_l:
+                continue
+            state = 0
+            for ch in term_l:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(None)
+                state = nxt
+            if self._out[state] is None:
+                self._out[state] = term_l
+
+        # enlaces de fallo por BFS; la salida se hereda del sufijo mas largo
+        # (los hijos de la raiz ya tienen fallo 0)
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                if self._out[nxt] is None:
+                    self._out[nxt] = self._out[self._fail[nxt]]
+
+        # transiciones ya resueltas (incluyendo fallos) por estado
+        self._delta: list[dict[str, int]] = [dict() for _ in self._goto]
+
+    def step(self, state: int, ch: str) -> int:
+        delta = self._delta[state]
+        nxt = delta.get(ch)
+        if nxt is not None:
+            return nxt
+        s = state
+        while s and ch not in self._goto[s]:
+            s = self._fail[s]
+        nxt = self._goto[s].get(ch, 0)
+        delta[ch] = nxt
+        return nxt
+
+    def feed(self, state: int, text: str) -> tuple[int, str | None]:
+        step = self.step
+        out = self._out
+        for ch in text.lower():
+            state = step(state, ch)
+            if out[state] is not None:
+                return state, out[state]
+        return state, None
+
+    def scanner(self) -> "StreamScanner":
+        return StreamScanner(self)
+
+
+class StreamScanner:
+    # estado por stream: cada caracter nuevo se examina una sola vez,
+    # asi que los terminos partidos entre tokens tambien se detectan
+    __slots__ = ("_matcher", "_state", "match")
+
+    def __init__(self, matcher: SensitiveTermMatcher):
+        self._matcher = matcher
+        self._state = 0
+        self.match: str | None = None
+
+    def feed(self, token: str) -> str | None:
+        if self.match is not None:
+            return self.match
+        self._state, self.match = self._matcher.feed(self._state, token)
+        return self.match
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_funct import classify_request_tool, CLASSIFIER_NUM_PREDICT, CLASSIFIER_NUM_CTX
+from prompts import RUTAS
+
+EXTRA_PROMPTS = [
+    ("hola, ¿qué puedes hacer?", "simple_request"),
+    ("explícame qué es una clave foránea", "simple_request"),
+    ("¿cuántos clientes activos hay por industria?", "needs_db_access"),
+    ("lista las facturas vencidas de este mes con su importe", "needs_db_access"),
+    ("top 5 clientes por facturación total en 2024", "needs_db_access"),
+]
+
+
+def _load_prompts(cases_path: str) -> List[tuple]:
+    with open(cases_path, "r", encoding="utf-8") as fh:
+        cases = json.load(fh).get("cases", [])
+    items = [(c["prompt"], c.get("expected_route")) for c in cases if c.get("prompt")]
+    return items + EXTRA_PROMPTS
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+async def _bench_mode(model: str, constrained: bool, items: List[tuple], repeats: int) -> Dict[str, float]:
+    # una llamada de calentamiento para no medir la carga del modelo
+    await classify_request_tool.ainvoke({"prompt": "hola", "model": model, "constrained": constrained})
+
+    latencies, valid, correct = [], 0, 0
+    for _ in range(repeats):
+        for prompt, expected in items:
+            start = time.perf_counter()
+            route = await classify_request_tool.ainvoke({
+                "prompt": prompt,
+                "model": model,
+                "constrained": constrained,
+            })
+            latencies.append(time.perf_counter() - start)
+            valid += route in RUTAS
+            correct += route == expected
+    n = len(latencies)
+    return {
+        "n": n,
+        "mean": statistics.mean(latencies),
+        "p50": _percentile(latencies, 50),
+        "p90": _percentile(latencies, 90),
+        "p99": _percentile(latencies, 99),
+        "max": max(latencies),
+        "valid": valid / n,
+        "accuracy": correct / n,
+    }
+
+
+async def run(models: List[str], cases_path: str, repeats: int) -> None:
+    items = _load_prompts(cases_path)
+    print(f"prompts: {len(items)}, repeticiones: {repeats}, num_predict={CLASSIFIER_NUM_PREDICT}, num_ctx={CLASSIFIER_NUM_CTX}")
+    header = f"{'modelo':<22} {'modo':<12} {'n':>4} {'media s':>8} {'p50 s':>7} {'p90 s':>7} {'p99 s':>7} {'max s':>7} {'valid':>6} {'acc':>6}"
+    print(header)
+    for model in models:
+        for constrained in (False, True):
+            r = await _bench_mode(model, constrained, items, repeats)
+            mode = "restringido" if constrained else "libre"
+            print(
+                f"{model:<22} {mode:<12} {r['n']:>4} {r['mean']:>8.3f} {r['p50']:>7.3f} {r['p90']:>7.3f} "
+                f"{r['p99']:>7.3f} {r['max']:>7.3f} {r['valid']:>6.2f} {r['accuracy']:>6.2f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Latencia del clasificador de rutas: texto libre vs salida estructurada acotada."
+    )
+    parser.add_argument("--models", default=os.getenv("CLASSIFICATION_MODEL", "llama3.1:8b"),
+                        help="Modelos separados por comas.")
+    parser.add_argument("--cases", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "safety_cases.json"))
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run([m.strip() for m in args.models.split(",") if m.strip()], args.cases, args.repeats))
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db_profile import connect
+
+N_CLIENTS = 2000
+N_USERS = 50
+
+READ_QUERIES = [
+    ("SELECT count(*) FROM interactions WHERE client_id = ?", lambda: (random.randint(1, N_CLIENTS),)),
+    (
+        "SELECT c.company_name, count(i.id) FROM clients c JOIN interactions i ON i.client_id = c.id "
+        "WHERE c.id = ? GROUP BY c.id",
+        lambda: (random.randint(1, N_CLIENTS),),
+    ),
+    ("SELECT id, company_name FROM clients WHERE status = ? LIMIT 20", lambda: (random.choice(["lead", "active"]),)),
+    ("SELECT type, count(*) FROM interactions WHERE client_id BETWEEN ? AND ? + 5 GROUP BY type",
+     lambda: (random.randint(1, N_CLIENTS),) * 2),
+]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _create(path: str, profile: str) -> None:
+    env = {**os.environ, "SQL_DB_PATH": path, "SQLITE_PROFILE": profile}
+    subprocess.run([sys.executable, os.path.join(ROOT, "create_db.py")], env=env, check=True,
+                   cwd=os.path.dirname(path), stdout=subprocess.DEVNULL)
+    conn = connect(path, profile=profile)
+    conn.executemany(
+        "INSERT INTO users (username, full_name, role) VALUES (?, ?, 'staff')",
+        [(f"user{i}", f"User {i}") for i in range(N_USERS)],
+    )
+    conn.executemany(
+        "INSERT INTO clients (company_name, status) VALUES (?, ?)",
+        [(f"Company {i}", random.choice(["lead", "active", "inactive"])) for i in range(N_CLIENTS)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def _writer(path: str, profile: str, rows: int, batch: int, result: Dict) -> None:
+    conn = connect(path, profile=profile, timeout=30)
+    started = time.perf_counter()
+    written = 0
+    while written < rows:
+        n = min(batch, rows - written)
+        conn.executemany(
+            "INSERT INTO interactions (client_id, user_id, type, summary) VALUES (?, ?, ?, ?)",
+            [
+                (random.randint(1, N_CLIENTS), random.randint(1, N_USERS),
+                 random.choice(["call", "email", "meeting", "note"]), "x" * random.randint(20, 120))
+                for _ in range(n)
+            ],
+        )
+        conn.commit()
+        written += n
+    result["seconds"] = time.perf_counter() - started
+    result["rows"] = written
+    conn.close()
+
+
+def _reader(path: str, profile: str, stop: threading.Event, latencies: List[float], errors: List[str]) -> None:
+    conn = connect(path, profile=profile, read_only=True, timeout=30, check_same_thread=False)
+    while not stop.is_set():
+        sql, params = random.choice(READ_QUERIES)
+        started = time.perf_counter()
+        try:
+            conn.execute(sql, params()).fetchall()
+        except sqlite3.OperationalError as e:
+            errors.append(str(e))
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+
+
+def run_profile(profile: str, rows: int, batch: int, readers: int) -> Dict[str, float]:
+    random.seed(1234)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "clients.db")
+        _create(path, profile)
+
+        stop = threading.Event()
+        latencies: List[float] = []
+        errors: List[str] = []
+        threads = [
+            threading.Thread(target=_reader, args=(path, profile, stop, latencies, errors))
+            for _ in range(readers)
+        ]
+        for t in threads:
+            t.start()
+        time.sleep(0.2) # linea base de lectores antes de empezar la carga
+        write: Dict = {}
+        _writer(path, profile, rows, batch, write)
+        stop.set()
+        for t in threads:
+            t.join()
+
+    return {
+        "reads": len(latencies),
+        "errors": len(errors),
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "write_rows_s": write["rows"] / write["seconds"],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Latencia de lectura durante una carga masiva concurrente: perfil sqlite por defecto vs db_profile."
+    )
+    parser.add_argument("--profiles", default="default,performance")
+    parser.add_argument("--rows", type=int, default=300_000, help="Filas que inserta el escritor.")
+    parser.add_argument("--batch", type=int, default=5000, help="Filas por transaccion del escritor.")
+    parser.add_argument("--readers", type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"filas={args.rows}, lote={args.batch}, lectores={args.readers}")
+    print(f"{'perfil':<12} {'lecturas':>9} {'errores':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>9} {'escritura filas/s':>18}")
+    for profile in [p.strip() for p in args.profiles.split(",") if p.strip()]:
+        r = run_profile(profile, args.rows, args.batch, args.readers)
+        print(
+            f"{profile:<12} {r['reads']:>9} {r['errors']:>8} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+            f"{r['p99_ms']:>8.2f} {r['max_ms']:>9.2f} {r['write_rows_s']:>18.0f}"
+        )
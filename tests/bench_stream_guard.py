@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import random
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompts import STREAM_SENSITIVE_TERMS
+from stream_guard import SensitiveTermMatcher
+
+SAMPLE_TEXT = (
+    "Según los datos disponibles, el cliente tiene tres proyectos activos y dos facturas "
+    "pendientes de pago. El importe total facturado este trimestre asciende a 42.380 euros, "
+    "con un retraso medio de 12 días en los cobros. Se recomienda revisar el estado de las "
+    "facturas vencidas y programar una llamada de seguimiento con el contacto principal. "
+)
+
+
+def _naive_contains(buffer: str, terms: List[str]) -> bool:
+    # implementacion anterior del orquestador (ventana deslizante + 'in' por termino)
+    buf_l = buffer.lower()
+    return any(term in buf_l for term in terms)
+
+
+def _scaled_terms(factor: int) -> List[str]:
+    terms = list(STREAM_SENSITIVE_TERMS)
+    rng = random.Random(factor)
+    alphabet = "abcdefghijklmnopqrstuvwxyz_"
+    while len(terms) < len(STREAM_SENSITIVE_TERMS) * factor:
+        base = rng.choice(STREAM_SENSITIVE_TERMS)
+        suffix = "".join(rng.choice(alphabet) for _ in range(rng.randint(3, 8)))
+        terms.append(f"{base}_{suffix}" if rng.random() < 0.5 else f"{suffix} {base}")
+    return terms
+
+
+def _tokenize(text: str, n_tokens: int) -> List[str]:
+    rng = random.Random(0)
+    tokens = []
+    i = 0
+    while len(tokens) < n_tokens:
+        size = rng.randint(2, 6)
+        chunk = text[i % len(text):i % len(text) + size]
+        if chunk:
+            tokens.append(chunk)
+        i += size
+    return tokens
+
+
+def _bench_naive(tokens: List[str], terms: List[str]) -> float:
+    start = time.perf_counter()
+    stream_buffer = ""
+    for token in tokens:
+        stream_buffer = (stream_buffer + token)[-500:]
+        if _naive_contains(stream_buffer, terms):
+            break
+    return time.perf_counter() - start
+
+
+def _bench_automaton(tokens: List[str], matcher: SensitiveTermMatcher) -> float:
+    start = time.perf_counter()
+    scanner = matcher.scanner()
+    for token in tokens:
+        if scanner.feed(token):
+            break
+    return time.perf_counter() - start
+
+
+def run(n_tokens: int, repeats: int, factors: List[int]) -> None:
+    tokens = _tokenize(SAMPLE_TEXT, n_tokens)
+    print(f"tokens por stream: {n_tokens}, repeticiones: {repeats}")
+    print(f"{'terminos':>9} {'naive us/tok':>13} {'automata us/tok':>16} {'speedup':>8} {'build ms':>9}")
+
+    for factor in factors:
+        terms = _scaled_terms(factor)
+        t0 = time.perf_counter()
+        matcher = SensitiveTermMatcher(terms)
+        build_ms = (time.perf_counter() - t0) * 1000
+
+        naive = min(_bench_naive(tokens, terms) for _ in range(repeats))
+        automaton = min(_bench_automaton(tokens, matcher) for _ in range(repeats))
+        naive_us = naive / n_tokens * 1e6
+        automaton_us = automaton / n_tokens * 1e6
+        print(
+            f"{len(terms):>9} {naive_us:>13.2f} {automaton_us:>16.2f} "
+            f"{naive_us / automaton_us:>7.1f}x {build_ms:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara el filtro de terminos sensibles del stream.")
+    parser.add_argument("--tokens", type=int, default=5000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--factors", default="1,10,100", help="Multiplicadores de la lista de terminos.")
+    args = parser.parse_args()
+    run(args.tokens, args.repeats, [int(f) for f in args.factors.split(",") if f.strip()])
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import os
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_ollama import StubOllama
+
+MODEL = "llama3.1:8b"
+
+
+async def run(n_requests: int, delay: float) -> int:
+    stubs = [StubOllama([MODEL], delay=delay, name=f"s{i}") for i in range(3)]
+    # la configuracion de llm_funct se lee al importar
+    os.environ["OLLAMA_BASE_URLS"] = ",".join(s.url for s in stubs)
+    os.environ["OLLAMA_BASE_URL"] = stubs[0].url
+    os.environ["OLLAMA_HEALTH_INTERVAL"] = "0"
+    import llm_funct
+    from langchain_core.messages import HumanMessage
+
+    pool = llm_funct.ollama_backends
+    failures = 0
+
+    def check(name: str, ok: bool) -> None:
+        nonlocal failures
+        failures += not ok
+        print(f"[{'OK' if ok else 'FALLO'}] {name}")
+
+    await pool.start()
+
+    # 1) reparto por menos peticiones pendientes
+    before = {s.name: s.counts["chat"] for s in stubs}
+    await asyncio.gather(*(
+        llm_funct.invoke_chat(MODEL, [HumanMessage(content=f"hola {i}")]) for i in range(n_requests)
+    ))
+    spread = Counter({s.name: s.counts["chat"] - before[s.name] for s in stubs})
+    print(f"reparto concurrente: {dict(spread)}")
+    check("todas las peticiones atendidas", sum(spread.values()) == n_requests)
+    check("los tres hosts reciben trabajo", all(spread[s.name] > 0 for s in stubs))
+
+    # 2) afinidad: en serie, el host que ya tiene el modelo cargado gana
+    for s in stubs[1:]:
+        s.loaded.clear()
+    await pool.check_all()
+    before = {s.name: s.counts["chat"] for s in stubs}
+    for i in range(5):
+        await llm_funct.invoke_chat(MODEL, [HumanMessage(content=f"serie {i}")])
+    serial = {s.name: s.counts["chat"] - before[s.name] for s in stubs}
+    print(f"reparto en serie con afinidad: {serial}")
+    check("afinidad con el host residente", serial[stubs[0].name] == 5)
+
+    # 3) failover: el host preferido cae sin que la comprobacion periodica lo sepa
+    stubs[0].fail = True
+    result = await llm_funct.invoke_chat(MODEL, [HumanMessage(content="failover")])
+    check("failover en llamada no streaming", "s0" not in result.content)
+    check("host caido marcado como no sano", not pool.backends[0].healthy)
+
+    # 4) streaming con failover antes del primer fragmento
+    stubs[1].fail = True
+    tokens = [t async for t in llm_funct.stream_from_ollama({"model": MODEL, "prompt": "hola"}, [])]
+    text = "".join(tokens)
+    print(f"stream: {text!r}")
+    check("stream servido por el host sano", "s2" in text)
+
+    # 4b) caen todos los hosts: la llamada falla pero el ultimo probado tambien queda marcado
+    stubs[0].fail = stubs[1].fail = False
+    await pool.check_all()
+    for s in stubs:
+        s.fail = True
+    try:
+        await llm_funct.invoke_chat(MODEL, [HumanMessage(content="sin hosts")])
+        raised = False
+    except Exception:
+        raised = True
+    check("ultimo host caido marcado como no sano", raised and not any(b.healthy for b in pool.backends))
+
+    # 5) recuperacion tras la comprobacion de salud
+    stubs[0].fail = stubs[1].fail = stubs[2].fail = False
+    await pool.check_all()
+    check("hosts recuperados", all(b.healthy for b in pool.backends))
+
+    for row in pool.stats():
+        print(row)
+
+    await pool.stop()
+    await llm_funct.ollama_clients.aclose()
+    for s in stubs:
+        s.stop()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Comprueba el reparto y failover entre varios hosts de ollama simulados.")
+    parser.add_argument("--requests", type=int, default=30)
+    parser.add_argument("--delay", type=float, default=0.05, help="Latencia simulada por llamada (s).")
+    args = parser.parse_args()
+    sys.exit(1 if asyncio.run(run(args.requests, args.delay)) else 0)
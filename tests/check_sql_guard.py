@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# umbral bajo para que los joins de la prueba superen el coste maximo
+os.environ.setdefault("SQL_GUARD_MAX_COST", "1000")
+
+from sql_guard import SQL_GUARD_BUDGET_SECONDS, QueryRejected, analyze_sql
+
+
+def _db(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE notes (id INTEGER PRIMARY KEY, body TEXT);
+        INSERT INTO notes (body) VALUES ('a--b'), ('/* x */'), ('plain');
+        CREATE TABLE events (id INTEGER PRIMARY KEY, kind TEXT);
+        """
+    )
+    conn.executemany("INSERT INTO events (kind) VALUES (?)", [(f"k{i % 7}",) for i in range(200)])
+    conn.commit()
+    return conn
+
+
+def main() -> int:
+    failures = 0
+
+    def check(name: str, ok: bool) -> None:
+        nonlocal failures
+        failures += not ok
+        print(f"[{'OK' if ok else 'FALLO'}] {name}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = _db(os.path.join(tmp, "guard.db"))
+
+        # 1) comentarios dentro de literales: no se recortan
+        cases = [
+            ("-- entre comillas", "SELECT body FROM notes WHERE body LIKE '%--%' -- comentario\n;", [("a--b",)]),
+            ("/* */ entre comillas", "SELECT body FROM notes /* c */ WHERE body = '/* x */';", [("/* x */",)]),
+            ("comilla escapada", "SELECT 'it''s -- ok' /* c */", [("it's -- ok",)]),
+        ]
+        for name, sql, expected in cases:
+            try:
+                decision = analyze_sql(conn, sql)
+                rows = conn.execute(decision["sql"].rstrip().rstrip(";")).fetchall()
+            except (sqlite3.Error, QueryRejected) as e:
+                print(f"    {e}")
+                rows = None
+            check(name, rows == expected)
+
+        # 2) escrituras tras un comentario siguen rechazandose
+        try:
+            analyze_sql(conn, "/* select */ DELETE FROM notes")
+            refused = False
+        except QueryRejected as e:
+            refused = e.decision["action"] == "refuse_write"
+        check("escritura detras de un comentario", refused)
+
+        # 3) limit: solo envuelve consultas que devuelven filas sin agregar, y siempre con presupuesto
+        decision = analyze_sql(conn, "SELECT a.id, b.id FROM events a, events b", action="limit")
+        check("join sin agregar se limita", decision["action"] == "limit" and "LIMIT" in decision["sql"])
+        check("limit con presupuesto de tiempo", decision["timeout"] == SQL_GUARD_BUDGET_SECONDS)
+        for sql in (
+            "SELECT count(*) FROM events a, events b",
+            "SELECT a.kind, b.kind FROM events a, events b ORDER BY a.kind",
+            "SELECT DISTINCT a.kind FROM events a, events b",
+        ):
+            decision = analyze_sql(conn, sql, action="limit")
+            check(f"sin limit: {sql}", decision["action"] == "budget" and decision["sql"] == sql
+                  and decision["timeout"] == SQL_GUARD_BUDGET_SECONDS)
+        decision = analyze_sql(conn, "SELECT a.id FROM events a, events b WHERE a.kind <> 'count(*)'", action="limit")
+        check("agregado dentro de un literal no cuenta", decision["action"] == "limit")
+        conn.close()
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
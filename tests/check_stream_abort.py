@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_ollama import StubOllama
+
+MODEL = "llama3.1:8b"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until(fn, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if fn():
+            return True
+        time.sleep(0.05)
+    return fn()
+
+
+def run(tokens: int, token_delay: float, read_lines: int) -> int:
+    failures = 0
+
+    def check(name: str, ok: bool) -> None:
+        nonlocal failures
+        failures += not ok
+        print(f"[{'OK' if ok else 'FALLO'}] {name}")
+
+    stub = StubOllama([MODEL], stream_tokens=tokens, token_delay=token_delay, load_seconds=0)
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            **os.environ,
+            "OLLAMA_BASE_URL": stub.url,
+            "OLLAMA_BASE_URLS": stub.url,
+            "OLLAMA_HEALTH_INTERVAL": "0",
+            "OLLAMA_PRELOAD": "false",
+            "OLLAMA_KEEP_ALIVE_REFRESH": "0",
+            "DEFAULT_MODEL": MODEL,
+            "CLASSIFICATION_MODEL": MODEL,
+            "CLASSIFIER_CONSTRAINED": "true", # el stub responde simple_request con format
+            "SQL_DB_PATH": os.path.join(tmp, "clients.db"),
+            "SQLITE_OPTIMIZE_INTERVAL": "0",
+        }
+        # uvicorn real: la desconexion tiene que llegar por el servidor ASGI, no simulada
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "orchestrator:app", "--app-dir", ROOT,
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=tmp, env=env,
+        )
+        try:
+            def _up() -> bool:
+                try:
+                    return httpx.get(f"{base}/_debug/streams", timeout=1).status_code == 200
+                except httpx.TransportError:
+                    return False
+
+            if not _wait_until(_up, 60):
+                check("orquestador arrancado", False)
+                return failures
+
+            # 1) el cliente se va tras unas pocas lineas de la generacion
+            seen = 0
+            with httpx.stream("POST", f"{base}/orchestrate", json={"prompt": "hola", "model": MODEL},
+                              timeout=30) as resp:
+                for line in resp.iter_lines():
+                    if line and json.loads(line).get("type") == "model_token":
+                        seen += 1
+                        if seen >= read_lines:
+                            break
+            dropped_at = time.monotonic()
+            print(f"cliente desconectado tras {seen} tokens")
+
+            aborted = _wait_until(lambda: stub.counts["streams_aborted"] == 1, 2.0)
+            print(f"stub: {stub.counts}, corte a los {time.monotonic() - dropped_at:.2f}s")
+            check("conexion con ollama cortada", aborted)
+            check("ollama no termina la respuesta", stub.counts["streams_completed"] == 0)
+
+            streams = httpx.get(f"{base}/_debug/streams").json()
+            check("stream contado como cancelado en generacion", streams["cancelled_in_generation"] == 1)
+            ollama = httpx.get(f"{base}/_debug/ollama").json()
+            check("sin peticiones pendientes en el host", all(b["outstanding"] == 0 for b in ollama["backends"]))
+            check("slot del planificador liberado",
+                  all(lane["active"] == 0 for lane in ollama["scheduler"]["lanes"].values()))
+
+            # 2) lo mismo con frames agrupados (coalesce), que leen el stream desde otra tarea
+            with httpx.stream("POST", f"{base}/orchestrate",
+                              json={"prompt": "hola", "model": MODEL, "coalesce": {"max_latency_ms": 10}},
+                              timeout=30) as resp:
+                for line in resp.iter_lines():
+                    if line and json.loads(line).get("type") == "model_chunk":
+                        break
+            check("corte tambien con coalesce", _wait_until(lambda: stub.counts["streams_aborted"] == 2, 2.0))
+
+            # 3) una respuesta completa sigue llegando entera
+            with httpx.stream("POST", f"{base}/orchestrate", json={"prompt": "otra", "model": MODEL},
+                              timeout=30) as resp:
+                types = [json.loads(line).get("type") for line in resp.iter_lines() if line]
+            check("stream completo termina con final", types[-1:] == ["final"])
+            check("ollama completa la respuesta", stub.counts["streams_completed"] == 1)
+        finally:
+            server.terminate()
+            server.wait(10)
+            stub.stop()
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Comprueba que al desconectarse el cliente se corta la peticion en curso a ollama."
+    )
+    parser.add_argument("--tokens", type=int, default=200, help="Tokens de la respuesta simulada.")
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--read-lines", type=int, default=8, help="Tokens que lee el cliente antes de irse.")
+    args = parser.parse_args()
+    sys.exit(1 if run(args.tokens, args.token_delay, args.read_lines) else 0)
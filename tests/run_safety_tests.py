@@ -4,12 +4,14 @@ import json
 import os
 import sys
 import re
+import time
 from typing import Dict, Any, List, Optional
 
 import httpx
 
 DEFAULT_URL = os.getenv("ORCHESTRATOR_URL", "http://localhost:9000/orchestrate")
 DEFAULT_MODEL = os.getenv("ORCHESTRATOR_MODEL", "llama3.1:8b")
+MAX_RETRIES = int(os.getenv("ORCHESTRATOR_MAX_RETRIES", "10"))
 
 CLIENT_PII_FIELDS = {
     "id",
@@ -48,6 +50,32 @@ def _has_sensitive_info_pattern(text: str) -> bool:
     return False
 
 
+def _read_stream(response: httpx.Response) -> tuple:
+    classification = None
+    response_text = ""
+    for raw_line in response.iter_lines():
+        if not raw_line:
+            continue
+        try:
+            obj = json.loads(raw_line)
+        except json.JSONDecodeError:
+            continue
+
+        if obj.get("type") == "classification":
+            classification = obj.get("value")
+
+        if obj.get("type") == "model_token":
+            delta_raw = obj.get("delta", "{}")
+            try:
+                delta_obj = json.loads(delta_raw)
+            except json.JSONDecodeError:
+                continue
+            token = delta_obj.get("delta", "")
+            if token:
+                response_text += token
+    return classification, response_text
+
+
 def _stream_orchestrator(prompt: str, model: str, session_id: str = "safety-test") -> Dict[str, Any]:
     payload = {
         "model": model,
@@ -55,34 +83,23 @@ def _stream_orchestrator(prompt: str, model: str, session_id: str = "safety-test
         "prompt": prompt,
         "stream": True,
         "session_id": session_id,
+        "priority": "batch", # no compite con usuarios interactivos
     }
 
     classification = None
     response_text = ""
 
     with httpx.Client(timeout=60.0) as client:
-        with client.stream("POST", DEFAULT_URL, json=payload) as response:
-            response.raise_for_status()
-            for raw_line in response.iter_lines():
-                if not raw_line:
-                    continue
-                try:
-                    obj = json.loads(raw_line)
-                except json.JSONDecodeError:
-                    continue
-
-                if obj.get("type") == "classification":
-                    classification = obj.get("value")
-
-                if obj.get("type") == "model_token":
-                    delta_raw = obj.get("delta", "{}")
-                    try:
-                        delta_obj = json.loads(delta_raw)
-                    except json.JSONDecodeError:
-                        continue
-                    token = delta_obj.get("delta", "")
-                    if token:
-                        response_text += token
+        for attempt in range(MAX_RETRIES + 1):
+            with client.stream("POST", DEFAULT_URL, json=payload) as response:
+                # el orquestador responde 429 + Retry-After cuando la cola batch esta llena
+                retry = response.status_code == 429 and attempt < MAX_RETRIES
+                if not retry:
+                    response.raise_for_status()
+                    classification, response_text = _read_stream(response)
+            if not retry:
+                break
+            time.sleep(float(response.headers.get("Retry-After", "1")))
 
     return {
         "classification": classification,
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Any, Dict, Iterable
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StubOllama:
+    # servidor minimo compatible con /api/tags, /api/ps, /api/generate y /api/chat
+    # para probar el reparto entre hosts sin GPU. fail=True simula un host caido (500).
+    # stream_tokens > 0: /api/chat con stream (sin format) emite esos tokens de uno en uno cada token_delay s
+
+    def __init__(self, models: Iterable[str] = ("llama3.1:8b",), delay: float = 0.0,
+                 load_seconds: float = 2.0, name: str = "stub", port: int = 0,
+                 stream_tokens: int = 0, token_delay: float = 0.0):
+        self.models = list(models)
+        self.delay = delay
+        self.stream_tokens = stream_tokens
+        self.token_delay = token_delay
+        self.load_seconds = load_seconds
+        self.name = name
+        self.fail = False
+        self.loaded: set = set()
+        self.counts: Dict[str, int] = {"generate": 0, "chat": 0, "streams_completed": 0, "streams_aborted": 0}
+        self._lock = threading.Lock()
+        self._server = _Server(("127.0.0.1", port), self._handler())
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _base(self, model: str) -> Dict[str, Any]:
+        with self._lock:
+            load = 0 if model in self.loaded else int(self.load_seconds * 1e9)
+            self.loaded.add(model)
+        return {
+            "model": model,
+            "created_at": "2024-01-01T00:00:00Z",
+            "done": True,
+            "done_reason": "stop",
+            "load_duration": load,
+        }
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, body: bytes, code: int = 200, ctype: str = "application/json") -> None:
+                self.send_response(code)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("Content-Type", ctype)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, obj: Any, code: int = 200) -> None:
+                self._send(json.dumps(obj).encode(), code)
+
+            def _slow_stream(self, base: Dict[str, Any]) -> None:
+                # un chunk http por token: si el cliente corta, la escritura siguiente falla
+                self.send_response(200)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                try:
+                    for i in range(stub.stream_tokens + 1):
+                        last = i == stub.stream_tokens
+                        msg = {"role": "assistant", "content": "" if last else f"tok{i} "}
+                        line = (json.dumps({**base, "done": last, "message": msg}) + "\n").encode()
+                        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                        self.wfile.flush()
+                        if not last:
+                            time.sleep(stub.token_delay)
+                    self.wfile.write(b"0\r\n\r\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    stub.counts["streams_aborted"] += 1
+                    self.close_connection = True
+                    return
+                stub.counts["streams_completed"] += 1
+
+            def do_GET(self):
+                if stub.fail:
+                    return self._json({"error": "stub down"}, 500)
+                if self.path == "/api/tags":
+                    return self._json({"models": [{"name": m, "model": m} for m in stub.models]})
+                if self.path == "/api/ps":
+                    return self._json({"models": [
+                        {"name": m, "model": m, "expires_at": "2030-01-01T00:00:00Z", "size_vram": 1}
+                        for m in sorted(stub.loaded)
+                    ]})
+                self._json({"error": "not found"}, 404)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if stub.fail:
+                    return self._json({"error": "stub down"}, 500)
+                model = body.get("model", "")
+                if model not in stub.models:
+                    return self._json({"error": f"model '{model}' not found"}, 404)
+                base = stub._base(model)
+                time.sleep(stub.delay)
+
+                if self.path == "/api/generate":
+                    stub.counts["generate"] += 1
+                    return self._json({**base, "response": "ok"})
+
+                stub.counts["chat"] += 1
+                if body.get("format"):
+                    content = json.dumps({"route": "simple_request", "sql": ""})
+                else:
+                    content = f"respuesta de {stub.name}"
+                if not body.get("stream"):
+                    return self._json({**base, "message": {"role": "assistant", "content": content}})
+                if stub.stream_tokens and not body.get("format"):
+                    return self._slow_stream(base)
+                lines = [
+                    json.dumps({**base, "done": False, "message": {"role": "assistant", "content": w + " "}})
+                    for w in content.split(" ")
+                ]
+                lines.append(json.dumps({**base, "message": {"role": "assistant", "content": ""}}))
+                self._send(("\n".join(lines) + "\n").encode(), ctype="application/x-ndjson")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor ollama simulado para pruebas locales.")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--models", default="llama3.1:8b")
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--stream-tokens", type=int, default=0, help="Tokens por respuesta en streaming lento.")
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    args = parser.parse_args()
+    stub = StubOllama(args.models.split(","), delay=args.delay, port=args.port, name=f"stub:{args.port}",
+                      stream_tokens=args.stream_tokens, token_delay=args.token_delay)
+    print(f"Stub ollama en {stub.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()